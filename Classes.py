@@ -8,72 +8,272 @@ Classes module:
 """
 from park_unpark import *
 import park_unpark
+from renderers import get_renderer
+from config_loader import load_cached_layout, load_layout, encode_space_types, SPACE_TYPES
+from ticket_log import TicketHistory, TicketLog, CAR_SIZE_CODES
+from tariff import load_tariff, tariff_path
+from walking import DEFAULT_ENTRANCE, UNREACHABLE
+from reservations import ReservationBook
+from collections import namedtuple
+from contextlib import contextmanager
 from datetime import datetime
-from operator import attrgetter
-import copy
+import heapq
+import itertools
+import os
 import threading
 
+#size types a customer may be given, cheapest and most appropriate first
+SPOT_PREFERENCES = {
+    ("compact_car", True): ("handicap", "compact", "large"),
+    ("large_car", True): ("handicap", "large"),
+    ("compact_car", False): ("compact", "large"),
+    ("large_car", False): ("large",),
+}
+
+#results of the check_*_input functions: (invalid input, exception detail, error code), preallocated so
+#validation allocates nothing, the error code is given to park_unpark.InvalidInputError
+VALID_INPUT = (False, None, None)
+SIZE_NOT_STR = (True, "Given 'size' parameter not of Type: Str", "size_not_str")
+PLACARD_NOT_BOOL = (True, "Given 'has_handicapped_placard' parameter not of Type: Bool", "placard_not_bool")
+SIZE_UNKNOWN = (True, "Given 'size' parameter not a defined as a option", "size_unknown")
+ENTRANCE_UNKNOWN = (True, "Given 'entrance' parameter not a entrance of the complex", "entrance_unknown")
+TTL_INVALID = (True, "Given 'ttl' parameter not a positive number", "ttl_invalid")
+RESERVATION_ID_NOT_INT = (True, "Given 'reservation_id' parameter not of type: Int", "reservation_id_not_int")
+LOCATION_NOT_TUPLE = (True, "Given 'location' parameter not of type: Tuple", "location_not_tuple")
+LOCATION_LENGTH = (True, "Given 'location' parameter not a (level, row, space) tuple", "location_length")
+LOCATION_NOT_INT = (True, "Given 'location' parameter tuple index's not of type: Int", "location_not_int")
+LOCATION_BELOW_BOUNDS = (True, "Given 'location' parameter has a index below bounds", "location_below_bounds")
+LEVEL_ABOVE_BOUNDS = (True, "Given 'location' parameter level index above bounds", "level_above_bounds")
+ROW_ABOVE_BOUNDS = (True, "Given 'location' parameter row index above bounds", "row_above_bounds")
+SPACE_ABOVE_BOUNDS = (True, "Given 'location' parameter space index above bounds", "space_above_bounds")
+LOCATION_EMPTY = (True, "Given 'location' parameter is empty", "location_empty")
+
+#ComplexTemplate of each config file, keyed by (absolute path, mtime, size), see complex_template
+TEMPLATES = {}
+TEMPLATES_LOCK = threading.Lock()
+
 
 class ParkingComplex():
     """
     Defines a ParkingComplex instance
 
     Args:
-        config_text_path(str): path to config text file, default is redwood.txt in project
+        config_text_path(str): path to config file in any format accepted by config_loader.load_layout,
+            default is redwood.txt in project
+        renderer(str|NullRenderer): display for transactions, one of ["none", "summary", "map"]
+            or a renderer instance, default is "map"
+        layout(GarageLayout): already loaded layout to build from instead of config_text_path
+        ticket_log_path(str): path of the append-only log closed tickets are archived to, optional
+        recent_tickets(int): number of recently closed tickets kept in memory, default is 1024
+        tariff(Tariff): pricing of closed tickets, default is the tariff file next to config_text_path
+            if there is one, see tariff.tariff_path, otherwise the flat rates of Ticket.set_charge
+        layout_cache_path(str): binary copy of config_text_path kept up to date by
+            config_loader.load_cached_layout, optional
 
     Attributes:
         name (str): Name of the parking complex
         levels(list): contains a list of ParkingComplexLevel objects
-        handicap_spots(list): contains a list of the currently open handicapped parking spots
-        compact_spots(list): contains a list of the currently open compact parking spots
-        large_spots(list): contains a list of the currently open large parking spots
-        tickets(list): contains a list of all tickets that have been processed by this parking complex
-        ticket_map(list): contains a list of ParkingComplexLevel objects
-        ticket_count(int): ticket ID counter
-        best_spots(list): holes
-        resource_lock(threading.Lock): locking access to shared resources during critical sections
+        handicap_spots(FreeSpotIndex): index of the currently open handicapped parking spots
+        compact_spots(FreeSpotIndex): index of the currently open compact parking spots
+        large_spots(FreeSpotIndex): index of the currently open large parking spots
+        free_spots(dict): maps a size type to its FreeSpotIndex, ranked from the default entrance
+        entrances(list): entrance ids, the first is the default entrance
+        entrance_spots(dict): maps an entrance id to its free_spots dict, the indexes of one size type
+            share their free set and differ only in ranking
+        row_distances(dict): maps an entrance id to a dict of (level, row) to the walking distance of the row's
+            aisle head, see walking.WalkingGraph
+        unreachable(int): distance of rows missing from row_distances, level + row is added to it
+        tickets(TicketHistory): the open and recently closed tickets of this parking complex,
+            tickets[n] is the ticket with id n + 1
+        open_tickets(dict): maps a (level, row, space) location to the open Ticket parked there
+        ticket_ids(itertools.count): ticket ID allocator, next() is atomic so no lock is needed
+        ticket_count(int): number of tickets issued
+        best_spots(list): closest open spot for [handicap, compact, large] customers, refreshed after
+            every transaction
+        resource_lock(threading.Lock): locking the refresh of self.best_spots
+        size_locks(dict): maps a size type to the threading.RLock guarding its FreeSpotIndex
+        level_locks(list): threading.RLock per level guarding its occupancy and open tickets
+        level_bounds(list): (rows, spaces) of each level, for O(1) location validation
+        renderer(NullRenderer): displays park and unpark transactions outside of critical sections
+        tariff(Tariff): pricing of closed tickets, or None for the flat rates of Ticket.set_charge
+        listeners(list): objects whose on_transaction(complex, ticket, parking) is called by update_matrixs
+            for every park and unpark, inside the level lock
+        reservations(ReservationBook): spots held by reserve() until claimed, cancelled or expired, a held
+            spot is out of the free spot indexes
+        template(ComplexTemplate): the empty state of this complex, restored by reset()
 
     """
-    def __init__(self, config_text_path):
+    def __init__(self, config_text_path, renderer="map", layout=None, ticket_log_path=None, recent_tickets=1024,
+                 tariff=None, layout_cache_path=None):
         self.name = None
         self.levels = []
-        self.handicap_spots = []
-        self.compact_spots = []
-        self.large_spots = []
-        self.tickets = []
-        self.ticket_map = None
-        self.ticket_count = 0
+        self.handicap_spots = FreeSpotIndex()
+        self.compact_spots = FreeSpotIndex()
+        self.large_spots = FreeSpotIndex()
+        self.free_spots = {"handicap": self.handicap_spots, "compact": self.compact_spots, "large": self.large_spots}
+        ticket_log = TicketLog(ticket_log_path) if ticket_log_path is not None else None
+        self.tickets = TicketHistory(recent_tickets, ticket_log)
+        self.open_tickets = {}
+        self.ticket_ids = itertools.count(1)
         self.best_spots = [None, None, None]
         self.resource_lock = threading.Lock()
-        self.init_system_from_text(config_text_path)
-        self.set_ticket_matrix()
+        self.size_locks = dict((size_t, threading.RLock()) for size_t in self.free_spots)
+        self.level_locks = []
+        self.level_bounds = []
+        self.renderer = get_renderer(renderer)
+        if tariff is None and config_text_path is not None and os.path.exists(tariff_path(config_text_path)):
+            tariff = load_tariff(tariff_path(config_text_path))
+        self.tariff = tariff
+        self.listeners = []
+        self.entrances = []
+        self.entrance_spots = {}
+        self.row_distances = {}
+        self.unreachable = 0
+        self.reservations = ReservationBook()
+        if layout is None:
+            self.template = complex_template(config_text_path, layout_cache_path)
+            self.init_system_from_template(self.template)
+        else:
+            self.init_system_from_layout(layout)
+            self.template = ComplexTemplate(self)
         self.update_best_spots()
 
+    @property
+    def ticket_count(self):
+        return len(self.tickets)
+
     def init_system_from_text(self, file_path):
         """
-        Utility function that updates size spot lists with parking spots on the given level
+        Utility function that builds self.levels from a config file
+
+        Args:
+            file_path(str): path to config file
+        """
+        self.init_system_from_layout(load_layout(file_path))
+
+    def init_system_from_layout(self, layout):
+        """
+        Utility function that builds self.levels from a parsed config
+
+        Args:
+            layout(GarageLayout): parsed config
         """
-        lines = [line.rstrip('\n') for line in open(file_path)]
-        name_levels_tup = lines[0].split(",")
-        self.name = name_levels_tup[0]
-        num_levels = name_levels_tup[1]
-        row_space_index = 0
-        for n in range(0, int(num_levels)):
-            row_space_index = row_space_index + 1
-            row_space_line = lines[row_space_index]
-            row_space_tuple = tuple(row_space_line.split(','))
-            rows = row_space_tuple[0]
-            spaces = row_space_tuple[1]
-            total_level_spaces = int(rows) * int(spaces)
-            space_type_array = []
-            for i in range(0, total_level_spaces):
-                temp_index = row_space_index + i + 1
-                space_type_array.append(lines[temp_index])
-            level = int(n) + 1
-            temp_level = ParkingComplexLevel(level, int(rows), int(spaces), space_type_array)
-            self.update_spot_lists(temp_level)
-            self.levels.append(temp_level)
-            row_space_index = row_space_index + total_level_spaces
+        self.name = layout.name
+        self.set_walking_graph(layout.graph, [level_layout.rows for level_layout in layout.levels])
+        for level_layout in layout.levels:
+            self.add_level(level_layout.rows, level_layout.spaces, level_layout.type_codes)
+
+    def init_system_from_template(self, template):
+        """
+        Utility function that builds self.levels and the free spot indexes by copying a template,
+        no config is parsed and no spot is ranked
+
+        Args:
+            template(ComplexTemplate): empty state of a complex
+        """
+        self.name = template.name
+        self.entrances = list(template.entrances)
+        self.row_distances = template.row_distances
+        self.unreachable = template.unreachable
+        for rows, spaces, type_codes in template.levels:
+            self.levels.append(ParkingComplexLevel(len(self.levels) + 1, rows, spaces, type_codes))
+            self.level_locks.append(threading.RLock())
+            self.level_bounds.append((rows, spaces))
+        self.load_template_indexes(template)
+
+    def load_template_indexes(self, template):
+        """
+        Utility function that replaces the free spot indexes of every entrance with copies of a template's
+
+        Args:
+            template(ComplexTemplate): empty state of a complex
+        """
+        self.entrance_spots = {self.entrances[0]: self.free_spots}
+        for size_t, index in self.free_spots.items():
+            index.free = set(template.free[size_t])
+            index.heap = list(template.heaps[self.entrances[0]][size_t])
+        for entrance in self.entrances[1:]:
+            self.entrance_spots[entrance] = {}
+            for size_t, index in self.free_spots.items():
+                entrance_index = FreeSpotIndex(index.free)
+                entrance_index.heap = list(template.heaps[entrance][size_t])
+                self.entrance_spots[entrance][size_t] = entrance_index
+
+    def reset(self):
+        """
+        Utility function to empty the complex by copying self.template: every spot is freed and every
+        ticket and reservation is dropped, the ticket log is kept. Ticket ids continue from before the
+        reset so they stay unique in the ticket log. Listeners with an on_reset(complex) method are
+        told, the others are not notified
+        """
+        with self.all_locks():
+            for level in self.levels:
+                level.occupancy = bytearray(len(level.type_codes))
+                level.occupied_counts = [0] * len(SPACE_TYPES)
+            self.load_template_indexes(self.template)
+            self.open_tickets.clear()
+            issued = self.tickets.issued
+            self.tickets = TicketHistory(self.tickets.recent, self.tickets.log)
+            self.tickets.issued = issued
+            self.reservations.clear()
+            for listener in self.listeners:
+                if hasattr(listener, "on_reset"):
+                    listener.on_reset(self)
+        self.update_best_spots()
+
+    def set_walking_graph(self, graph, level_rows):
+        """
+        Utility function to run the shortest path search from every entrance once and set up the free
+        spot indexes of each entrance, called before any level is added
+
+        Args:
+            graph(WalkingGraph): entrances and aisle/ramp paths, None for one entrance at location(1,1,1)
+                with the level + row + space distance
+            level_rows(list): number of rows of each level of the layout
+        """
+        if graph is None:
+            self.entrances = [DEFAULT_ENTRANCE]
+            self.row_distances = {DEFAULT_ENTRANCE: {}}
+            self.unreachable = 0
+        else:
+            self.entrances = list(graph.entrances)
+            self.row_distances = graph.row_distances(level_rows)
+            self.unreachable = UNREACHABLE
+        self.entrance_spots = {self.entrances[0]: self.free_spots}
+        for entrance in self.entrances[1:]:
+            self.entrance_spots[entrance] = dict((size_t, FreeSpotIndex(index.free))
+                                                 for size_t, index in self.free_spots.items())
+
+    def spot_distance(self, entrance, key):
+        """
+        Utility function to get the walking distance from an entrance to a spot, O(1)
+
+        Args:
+            entrance(str): entrance id
+            key(tuple(int,int,int)): (level, row, space) of the spot
+        """
+        return self.row_distances[entrance].get((key[0], key[1]), self.unreachable + key[0] + key[1]) + key[2]
+
+    def add_level(self, rows, spaces, space_types):
+        """
+        Utility function that builds the next level of the complex and loads its spots into the size spot
+        indexes in one pass
+
+        Args:
+            rows(int): number of rows the level has
+            spaces(int): number of spaces in each row
+            space_types(list|bytearray): the type of each space in row-major order
+                options:["handicap","compact","large"] or config_loader.SPACE_TYPES codes
+
+        Returns:
+            ParkingComplexLevel: the new level
+        """
+        level = ParkingComplexLevel(len(self.levels) + 1, rows, spaces, space_types)
+        self.update_spot_lists(level)
+        self.levels.append(level)
+        self.level_locks.append(threading.RLock())
+        self.level_bounds.append((rows, spaces))
+        return level
 
     def update_spot_lists(self, level):
         """
@@ -82,14 +282,21 @@ class ParkingComplex():
         Args:
             level(ParkingComplexLevel): level to add parking spots from
         """
-        for i in range(0, level.rows):
-            for j in range(0, level.spaces):
-                if(level.level_matrix[i][j].size_t == "handicap"):
-                    self.handicap_spots.append(level.level_matrix[i][j])
-                elif(level.level_matrix[i][j].size_t == "compact"):
-                    self.compact_spots.append(level.level_matrix[i][j])
-                elif(level.level_matrix[i][j].size_t == "large"):
-                    self.large_spots.append(level.level_matrix[i][j])
+        keys = [[] for size_t in SPACE_TYPES]
+        type_codes = level.type_codes
+        offset = 0
+        for row in xrange(1, level.rows + 1):
+            for space in xrange(1, level.spaces + 1):
+                if not level.occupancy[offset]:
+                    keys[type_codes[offset]].append((level.level, row, space))
+                offset += 1
+        for entrance in self.entrances:
+            for code, size_t in enumerate(SPACE_TYPES):
+                entries = [(self.spot_distance(entrance, key), key) for key in keys[code]]
+                if entrance == self.entrances[0]:
+                    self.free_spots[size_t].extend(entries)
+                else:
+                    self.entrance_spots[entrance][size_t].rank(entries)
 
     def update_best_spots(self):
         """
@@ -97,27 +304,19 @@ class ParkingComplex():
 
         Note: this funciton changes a shared resouce and exists in a crital section
         """
-        h_full = all(spot.filled == True for spot in self.handicap_spots)
-        c_full = all(spot.filled == True for spot in self.compact_spots)
-        l_full = all(spot.filled == True for spot in self.large_spots)
-        if(not h_full):
-            self.best_spots[0] = self.get_closest_by_size("handicap")
-        elif(not c_full):
-            self.best_spots[0] = self.get_closest_by_size("compact")
-        elif(not l_full):
-            self.best_spots[0] = self.get_closest_by_size("large")
-        else:
-            self.best_spots[0] = None
-        if(not c_full):
-            self.best_spots[1] = self.get_closest_by_size("compact")
-        elif(not l_full):
-            self.best_spots[1] = self.get_closest_by_size("large")
-        else:
-            self.best_spots[1] = None
-        if(not l_full):
-            self.best_spots[2] = self.get_closest_by_size("large")
-        else:
-            self.best_spots[2] = None
+        with self.resource_lock:
+            closest = {}
+            for size_t in self.free_spots:
+                closest[size_t] = self.get_closest_by_size(size_t)
+            best_spots = []
+            for customer in [("compact_car", True), ("compact_car", False), ("large_car", False)]:
+                spot = None
+                for size_t in SPOT_PREFERENCES[customer]:
+                    if closest[size_t] is not None:
+                        spot = closest[size_t]
+                        break
+                best_spots.append(spot)
+            self.best_spots = best_spots
 
     def get_closest_by_size(self, size):
         """
@@ -126,28 +325,27 @@ class ParkingComplex():
         Args:
             size(str): size type
         """
-        if size == "handicap":
-            temp_list = self.handicap_spots
-        elif size == "compact":
-            temp_list = self.compact_spots
-        else:
-            temp_list = self.large_spots
-        closest_spot = min(temp_list, key=attrgetter('distance_to_entrance'))
-        return closest_spot
+        with self.size_locks[size]:
+            key = self.free_spots[size].peek()
+        if key is None:
+            return None
+        return self.get_spot(key)
 
-    def set_ticket_matrix(self):
+    def get_spot(self, key):
         """
-        Utility funtion to set self.ticket_map
+        Utility funtion to get the ParkingSpot at a location key
+
+        Args:
+            key(tuple(int,int,int)): (level, row, space) of the spot, indexes start at 1
+
+        Returns:
+            ParkingSpot object at the given location
         """
-        self.ticket_map = copy.deepcopy(self.levels)
-        for level in self.ticket_map:
-            for i in range(0, level.rows):
-                for j in range(0, level.spaces):
-                    level.level_matrix[i][j] = None
+        return self.levels[key[0] - 1].get_spot(key[1], key[2])
 
     def spot_available(self, size, handicapped):
         """
-        Utility funtion to display a unpark transaction
+        Utility funtion to check if a spot is open for a size and handicap privilege
 
         Args:
             size(str): size type to be parked
@@ -156,22 +354,14 @@ class ParkingComplex():
         Returns:
             bool: a spot exists for this size and handicap privilege
         """
-        h_full = all(spot.filled == True for spot in self.handicap_spots)
-        c_full = all(spot.filled == True for spot in self.compact_spots)
-        l_full = all(spot.filled == True for spot in self.large_spots)
-        if h_full and c_full and l_full:
-            return False
-        if handicapped and size == "large_car" and h_full and l_full:
-            return False
-        if not handicapped and size == "compact_car" and c_full and l_full:
-            return False
-        if not handicapped and size == "large_car" and l_full:
-            return False
-        return True
+        for size_t in SPOT_PREFERENCES[(size, handicapped)]:
+            if not self.free_spots[size_t].is_empty():
+                return True
+        return False
 
     def get_best_spot(self, customer):
         """
-        Utility funtion to display a unpark transaction
+        Utility funtion to get the current best spot for a customer without taking it
 
         Args:
             customer(Customer): the customer that needs a spot
@@ -180,7 +370,7 @@ class ParkingComplex():
             ParkingSpot object from self.best_spots list
         """
         if customer.handicapped:
-            if customer.size == "large_car" and all(spot.filled == True for spot in self.handicap_spots):
+            if customer.size == "large_car" and self.handicap_spots.is_empty():
                 return self.best_spots[2]
             else:
                 return self.best_spots[0]
@@ -189,244 +379,870 @@ class ParkingComplex():
         else:
             return self.best_spots[2]
 
+    def reserve_spot(self, customer, entrance=None):
+        """
+        Utility funtion to atomically take the best open spot for a customer out of the free spot indexes
+
+        Note: each size index is popped under its own size lock, so two callers can never be given
+              the same spot
+
+        Args:
+            customer(Customer): the customer that needs a spot
+            entrance(str): id of the entrance the customer came in by, default is self.entrances[0]
+
+        Returns:
+            tuple(int,int,int): (level, row, space) of the taken spot
+            or
+            None: no spots available
+        """
+        free_spots = self.free_spots if entrance is None else self.entrance_spots[entrance]
+        for size_t in SPOT_PREFERENCES[(customer.size, customer.handicapped)]:
+            with self.size_locks[size_t]:
+                key = free_spots[size_t].pop()
+            if key is not None:
+                return key
+        return None
+
     def update_matrixs(self, ticket, parking):
         """
-        Utility/Delegation function updates self.levels and self.ticket_map states with the given then displays
+        Utility/Delegation function updates self.levels and self.open_tickets states with the given ticket,
+        notifies self.listeners then snapshots the transaction for display
 
-        Note: this funciton changes a shared resouce and exists in a crital section
+        Note: this funciton changes a shared resouce and exists in a crital section,
+              the caller must hold the level lock of the ticket's location
 
         Args:
             ticket(Ticket): ticket to update matrixs with
             parking(bool): boolean of customer parking versus unparking
+
+        Returns:
+            frame for self.renderer.render, to be called after the critical section
+        """
+        self.set_spot_state(ticket, parking)
+        for listener in self.listeners:
+            listener.on_transaction(self, ticket, parking)
+        return self.renderer.snapshot(self, ticket, parking)
+
+    def set_spot_state(self, ticket, parking):
         """
+        Utility function updates self.levels, self.open_tickets and the free spot indexes with the given ticket
+
+        Note: the caller must hold the level lock of the ticket's location
+
+        Args:
+            ticket(Ticket): ticket to update matrixs with
+            parking(bool): boolean of customer parking versus unparking
+        """
+        key = spot_key(ticket.p_spot)
         if parking:
-            self.ticket_map[ticket.p_spot.location.level - 1].level_matrix[ticket.p_spot.location.row - 1][ticket.p_spot.location.space - 1] = ticket
-            self.levels[ticket.p_spot.location.level - 1].level_matrix[ticket.p_spot.location.row - 1][ticket.p_spot.location.space - 1].filled = True
-            if(ticket.p_spot.size_t == "handicap"):
-                self.handicap_spots.remove(ticket.p_spot)
-            elif(ticket.p_spot.size_t == "compact"):
-                self.compact_spots.remove(ticket.p_spot)
-            else:
-                self.large_spots.remove(ticket.p_spot)
-            self.display_park(ticket)
+            self.open_tickets[key] = ticket
+            self.levels[key[0] - 1].set_filled(key[1], key[2], True)
+            with self.size_locks[ticket.p_spot.size_t]:
+                self.free_spots[ticket.p_spot.size_t].discard(key)
         else:
-            self.ticket_map[ticket.p_spot.location.level - 1].level_matrix[ticket.p_spot.location.row - 1][ticket.p_spot.location.space - 1] = None
-            self.levels[ticket.p_spot.location.level - 1].level_matrix[ticket.p_spot.location.row - 1][ticket.p_spot.location.space - 1].filled = False
-            if(ticket.p_spot.size_t == "handicap"):
-                self.handicap_spots.append(ticket.p_spot)
-            elif(ticket.p_spot.size_t == "compact"):
-                self.compact_spots.append(ticket.p_spot)
-            else:
-                self.large_spots.append(ticket.p_spot)
-            self.display_unpark(ticket)
-
-    def display_park(self, ticket):
-        """
-        Utility funtion to display a park transaction
-
-        Args:
-            ticket(Ticket): ticket to display
-        """
-        print "\n\n\n\nPark:"
-        print "-"*148
-        print "Welcome to the " + park_unpark.parking_complex.name + " Parking Complex"
-        print "Here are your ticket details:\n"
-        print "\tTicket ID:\t\t", ticket.id
-        print "\tDetected Car Size:\t", ticket.customer.size
-        print "\tStart Time:\t\t", ticket.start_t
-        print "\tLocation:\t\tLevel:" + str(ticket.p_spot.location.level) + "   Row:" + str(ticket.p_spot.location.row) + "   Space:" + str(ticket.p_spot.location.space)
-        print "\n\tLocate 'Park' in the complex map below for directions to your given spot"
-        for level in self.ticket_map:
-            print "\n\n\nLevel", level.level
-            for n in range(0, level.spaces): print "S" + str(n+1), "\t\t",
-            print "\n"
-            for i in range(0, level.rows):
-                print "\nR" + str(i + 1),
-                for j in range(0, level.spaces):
-                    if level.level_matrix[i][j] == ticket:
-                        print "Park\t\t",
-                    elif level.level_matrix[i][j] != None:
-                        print str(level.level_matrix[i][j].description) + "\t\t",
-                    else:
-                        print "0\t\t",
-
-    def display_unpark(self, ticket):
-        """
-        Utility funtion to display a unpark transaction
-
-        Args:
-            ticket(Ticket): ticket to display
-        """
-        print "\n\n\n\nUnpark:"
-        print "-"*145
-        print "Thank for parking at Lastline's " + park_unpark.parking_complex.name + " Complex"
-        print "Here is your receipt Details:\n"
-        print "\tTicket ID:\t\t", ticket.id
-        print "\tDetected Car Size:\t", ticket.customer.size
-        print "\tStart Time:\t\t", ticket.start_t
-        print "\tFinish Time:\t\t", ticket.end_t
-        m, s = divmod(ticket.delta_t, 60)
-        h, m = divmod(m, 60)
-        print "\tElapsed Time:\t\t%d:%02d:%02d" % (h, m, s)
-        print "\tCharge Due:\t\t", ticket.format_charge()
-        print "\n\tHave a good day!"
-        for level in self.ticket_map:
-            print "\n\n\nLevel", level.level
-            for n in range(0, level.spaces): print "S" + str(n+1), "\t\t",
-            print "\n"
-            for i in range(0, level.rows):
-                print "\nR" + str(i + 1),
-                for j in range(0, level.spaces):
-                    if level.level == ticket.p_spot.location.level and i == ticket.p_spot.location.row - 1 and j == ticket.p_spot.location.space - 1:
-                        print "unparking\t",
-                    elif level.level_matrix[i][j] != None:
-                        print str(level.level_matrix[i][j].description) + "\t\t",
-                    else:
-                        print "0\t\t",
-
-    def park_customer(self, size, handicapped):
+            del self.open_tickets[key]
+            self.levels[key[0] - 1].set_filled(key[1], key[2], False)
+            self.release_spot(key, ticket.p_spot.size_t)
+
+    def release_spot(self, key, size_t):
+        """
+        Utility function to return a spot to the free spot index of every entrance
+
+        Args:
+            key(tuple(int,int,int)): (level, row, space) of the spot
+            size_t(str): size type of the spot
+        """
+        with self.size_locks[size_t]:
+            if key not in self.free_spots[size_t]:
+                self.free_spots[size_t].add(key, self.spot_distance(self.entrances[0], key))
+                for entrance in self.entrances[1:]:
+                    self.entrance_spots[entrance][size_t].push(key, self.spot_distance(entrance, key))
+
+    def add_listener(self, listener):
+        """
+        Utility function to have listener.on_transaction(complex, ticket, parking) called for every transaction
+
+        Args:
+            listener(object): object with a on_transaction method
+        """
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        """
+        Utility function to stop notifying a listener
+
+        Args:
+            listener(object): listener given to add_listener
+        """
+        self.listeners.remove(listener)
+
+    def restore(self, occupancies, open_tickets, next_ticket_id):
+        """
+        Utility function to load saved occupancy and open tickets into this complex in bulk,
+        listeners are not notified and nothing is displayed, outstanding reservations are dropped
+
+        Args:
+            occupancies(list): occupancy bytes of each level, see ParkingComplexLevel.occupancy
+            open_tickets(dict): maps the (level, row, space) key of each occupied location to its open Ticket
+            next_ticket_id(int): id the next ticket will be given
+        """
+        with self.all_locks():
+            self.reservations.clear()
+            for level, occupancy in zip(self.levels, occupancies):
+                level.occupancy[:] = occupancy
+                level.recount()
+            for free_spots in self.entrance_spots.values():
+                for index in free_spots.values():
+                    index.heap = []
+                    index.free.clear()
+            for level in self.levels:
+                self.update_spot_lists(level)
+            self.open_tickets.update(open_tickets)
+            self.tickets.extend(open_tickets.values())
+            self.ticket_ids = itertools.count(next_ticket_id)
+        self.update_best_spots()
+
+    def park_customer(self, size, handicapped, entrance=None):
         """
         Utility funtion to park a customer for a given size and handicap privilege
 
+        Note: safe to call from many threads, the spot is reserved under its size lock and the level
+              is updated under its level lock
+
         Args:
             size(str): size type to be parked
             handicapped(bool): boolean of customer hanicapped privileges
+            entrance(str): id of the entrance the customer came in by, default is self.entrances[0]
 
         Returns:
             tuple(int,int,int): location of where to park customer
             or
             None: no spots available
+        """
+        self.expire_reservations()
+        new_customer = Customer(size, handicapped)
+        key = self.reserve_spot(new_customer, entrance)
+        if key is None:
+            return None
+        return self.open_ticket(key, new_customer)
+
+    def open_ticket(self, key, customer):
+        """
+        Utility funtion to park a customer in a spot already taken out of the free spot indexes
+
+        Args:
+            key(tuple(int,int,int)): (level, row, space) of the taken spot
+            customer(Customer): the customer to park
 
         Returns:
-            ticket.charge(float): the customers fee for parking
+            tuple(int,int,int): key
         """
-        if(self.spot_available(size, handicapped)):
-            self.ticket_count += 1
-            new_customer = Customer(size, handicapped)
-            best_spot = self.get_best_spot(new_customer)
-            new_ticket = Ticket(best_spot, new_customer, self.ticket_count)
-            self.tickets.append(new_ticket)
-            self.resource_lock.acquire()
-            self.update_matrixs(new_ticket, True)
-            self.update_best_spots()
-            self.resource_lock.release()
-            return (int(best_spot.location.level), int(best_spot.location.row), int(best_spot.location.space))
-        else:
+        new_ticket = Ticket(self.get_spot(key), customer, next(self.ticket_ids))
+        with self.level_locks[key[0] - 1]:
+            frame = self.update_matrixs(new_ticket, True)
+        self.tickets.append(new_ticket)
+        self.update_best_spots()
+        self.renderer.render(frame)
+        return key
+
+    def reserve(self, size, handicapped, ttl, entrance=None):
+        """
+        Utility funtion to hold the best open spot for a customer until it is claimed or ttl seconds pass
+
+        Args:
+            size(str): size type to be parked
+            handicapped(bool): boolean of customer hanicapped privileges
+            ttl(float): seconds the spot is held for
+            entrance(str): id of the entrance the customer will come in by, default is self.entrances[0]
+
+        Returns:
+            int: reservation id to claim or cancel
+            or
+            None: no spots available
+        """
+        self.expire_reservations()
+        customer = Customer(size, handicapped)
+        key = self.reserve_spot(customer, entrance)
+        if key is None:
+            return None
+        reservation = self.reservations.hold(key, self.get_spot(key).size_t, customer, ttl)
+        self.update_best_spots()
+        return reservation.id
+
+    def claim(self, reservation_id):
+        """
+        Utility funtion to park the customer of a reservation in its held spot
+
+        Args:
+            reservation_id(int): id returned by reserve
+
+        Returns:
+            tuple(int,int,int): location of where to park customer
+            or
+            None: no such reservation, it was claimed, cancelled or has expired
+        """
+        self.expire_reservations()
+        reservation = self.reservations.take(reservation_id)
+        if reservation is None:
             return None
+        return self.open_ticket(reservation.key, reservation.customer)
+
+    def cancel(self, reservation_id):
+        """
+        Utility funtion to give the held spot of a reservation back
+
+        Args:
+            reservation_id(int): id returned by reserve
+
+        Returns:
+            bool: the reservation was outstanding
+        """
+        reservation = self.reservations.take(reservation_id)
+        if reservation is None:
+            return False
+        self.release_spot(reservation.key, reservation.size_t)
+        self.update_best_spots()
+        return True
+
+    def expire_reservations(self):
+        """
+        Utility funtion to give back the held spots of expired reservations, a single check while no
+        wheel tick has passed
+
+        Returns:
+            int: number of reservations expired
+        """
+        expired = self.reservations.expire()
+        for reservation in expired:
+            self.release_spot(reservation.key, reservation.size_t)
+        if expired:
+            self.update_best_spots()
+        return len(expired)
 
     def unpark_customer(self, location):
         """
         Utility funtion to unpark a customer from a given location
 
+        Note: safe to call from many threads, the level is updated under its level lock
+
         Args:
             location(tuple): contains the indexs of where to unpark a customer
 
         Returns:
             ticket.charge(float): the customers fee for parking
+            or
+            None: the location was unparked by a concurrent call
         """
-        for level in self.ticket_map:
-            for i in range(0, level.rows):
-                for j in range(0, level.spaces):
-                    if level.level_matrix[i][j] != None:
-                        if(level.level == location[0] and level.level_matrix[i][j].p_spot.location.row == location[1] and level.level_matrix[i][j].p_spot.location.space == location[2]):
-                            ticket = level.level_matrix[i][j]
-        ticket.close()
-    	self.resource_lock.acquire()
-        self.update_matrixs(ticket, False)
+        with self.level_locks[location[0] - 1]:
+            ticket = self.open_tickets.get(location)
+            if ticket is None:
+                return None
+            ticket.close(self.tariff)
+            frame = self.update_matrixs(ticket, False)
+        self.tickets.close(ticket)
         self.update_best_spots()
-        self.resource_lock.release()
+        self.renderer.render(frame)
         return ticket.charge
 
-    def check_park_input(self, size, handicapped):
+    @contextmanager
+    def all_locks(self):
+        """
+        Utility funtion to hold every level lock then every size lock, the same order single
+        park and unpark calls nest them in
+        """
+        locks = self.level_locks + [self.size_locks[size_t] for size_t in SPACE_TYPES]
+        for lock in locks:
+            lock.acquire()
+        try:
+            yield
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+    def park_customers(self, requests):
+        """
+        Utility funtion to park a batch of customers in order, holding the locks once for the whole batch
+
+        Args:
+            requests(list): (size, handicapped) or (size, handicapped, entrance) of each customer
+
+        Returns:
+            list: location of where to park each customer, None where no spot was available,
+                the same results as calling park_customer for each request in order
+        """
+        self.expire_reservations()
+        locations = []
+        new_tickets = []
+        frames = []
+        with self.all_locks():
+            for request in requests:
+                new_customer = Customer(request[0], request[1])
+                key = self.reserve_spot(new_customer, request[2] if len(request) > 2 else None)
+                locations.append(key)
+                if key is None:
+                    continue
+                new_ticket = Ticket(self.get_spot(key), new_customer, next(self.ticket_ids))
+                frames.append(self.update_matrixs(new_ticket, True))
+                new_tickets.append(new_ticket)
+        for new_ticket in new_tickets:
+            self.tickets.append(new_ticket)
+        self.update_best_spots()
+        for frame in frames:
+            self.renderer.render(frame)
+        return locations
+
+    def unpark_customers(self, locations):
+        """
+        Utility funtion to unpark a batch of customers in order, holding the locks once for the whole batch
+
+        Args:
+            locations(list): contains the indexs of where to unpark each customer
+
+        Returns:
+            list: the fee for parking of each customer, None where the location was already empty
+        """
+        charges = []
+        closed = []
+        frames = []
+        with self.all_locks():
+            for location in locations:
+                ticket = self.open_tickets.get(location)
+                if ticket is None:
+                    charges.append(None)
+                    continue
+                ticket.close(self.tariff)
+                frames.append(self.update_matrixs(ticket, False))
+                closed.append(ticket)
+                charges.append(ticket.charge)
+        for ticket in closed:
+            self.tickets.close(ticket)
+        self.update_best_spots()
+        for frame in frames:
+            self.renderer.render(frame)
+        return charges
+
+    def stats(self):
+        """
+        Utility funtion to get a snapshot of the occupancy of the complex from the level counters,
+        O(levels) and lock free, so a concurrent transaction may show on some levels and not others
+
+        Returns:
+            dict: {"capacity", "occupied", "free": counts by size type, "total_capacity", "total_occupied",
+                "total_free": counts, "occupancy": occupied ratio, "open_tickets": number of open tickets,
+                "held": number of reserved spots, counted as free, "levels": the same counts of each level
+                with its "level" number}
+        """
+        capacity = [0] * len(SPACE_TYPES)
+        occupied_counts = [0] * len(SPACE_TYPES)
+        levels = []
+        for level in self.levels:
+            level_stats = level.stats()
+            for code, size_t in enumerate(SPACE_TYPES):
+                capacity[code] += level_stats["capacity"][size_t]
+                occupied_counts[code] += level_stats["occupied"][size_t]
+            levels.append(level_stats)
+        stats = occupancy_stats(capacity, occupied_counts, open_tickets=len(self.open_tickets),
+                                held=len(self.reservations))
+        stats["levels"] = levels
+        return stats
+
+    def flush(self):
+        """
+        Utility funtion to write every buffered closed ticket to the ticket log
+        """
+        self.tickets.flush()
+
+    def check_park_input(self, size, handicapped, entrance=None):
         """
         Utility funtion to parse input given to park_park.unpark input for invalid exceptions
 
         Args:
             size(str): size type to be parked
             handicapped(bool): boolean of customer hanicapped privileges
+            entrance(str): entrance id, optional
 
         Returns:
-            tuple:(bool:Valid input,str:exception detail)
+            tuple:(bool:Valid input,str:exception detail,str:error code)
         """
         if type(size) is not str:
-            return (True, "Given 'size' parameter not of Type: Str")
+            return SIZE_NOT_STR
         if type(handicapped) is not bool:
-            return (True, "Given 'has_handicapped_placard' parameter not of Type: Bool")
-        if(size not in ['compact_car', 'large_car']):
-            return (True, "Given 'size' parameter not a defined as a option")
-        return (False, None)
+            return PLACARD_NOT_BOOL
+        if size not in CAR_SIZE_CODES:
+            return SIZE_UNKNOWN
+        if entrance is not None and entrance not in self.entrance_spots:
+            return ENTRANCE_UNKNOWN
+        return VALID_INPUT
+
+    def check_reserve_input(self, size, handicapped, ttl, entrance=None):
+        """
+        Utility funtion to parse input given to park_unpark.reserve for invalid exceptions
+
+        Args:
+            size(str): size type to be parked
+            handicapped(bool): boolean of customer hanicapped privileges
+            ttl(float): seconds the spot is held for
+            entrance(str): entrance id, optional
+
+        Returns:
+            tuple:(bool:Valid input,str:exception detail,str:error code)
+        """
+        if type(ttl) not in (int, float) or ttl <= 0:
+            return TTL_INVALID
+        return self.check_park_input(size, handicapped, entrance)
+
+    def check_reservation_input(self, reservation_id):
+        """
+        Utility funtion to parse input given to park_unpark.claim and park_unpark.cancel for invalid exceptions
+
+        Args:
+            reservation_id(int): reservation id
+
+        Returns:
+            tuple:(bool:Valid input,str:exception detail,str:error code)
+        """
+        if type(reservation_id) is not int:
+            return RESERVATION_ID_NOT_INT
+        return VALID_INPUT
 
     def check_unpark_input(self, location):
         """
-        Utility funtion to parse input given to park_unpark.unpark for invalid exceptions
+        Utility funtion to parse input given to park_unpark.unpark for invalid exceptions, O(1) with
+        the bounds of the location's own level
 
         Args:
             location(tuple): contains the indexs of where to unpark a customer
 
         Returns:
-            tuple:(bool:Valid input,str:exception detail)
+            tuple:(bool:Valid input,str:exception detail,str:error code)
         """
         if type(location) is not tuple:
-            return (True, "Given 'location' parameter not of type: Tuple")
-        if type(location[0]) is not int or type(location[1]) is not int or type(location[2]) is not int:
-            return (True, "Given 'location' parameter tuple index's not of type: Int")
-        if location[0] < 1 or location[1] < 1 or location[2] < 1:
-            return (True, "Given 'location' parameter has a index below bounds")
-        if location[0] > len(self.levels):
-            return (True, "Given 'location' parameter level index above bounds")
-        for level in self.levels:
-            if location[1] > level.rows:
-                return (True, "Given 'location' parameter row index above bounds")
-            if location[2] > level.spaces:
-                return (True, "Given 'location' parameter space index above bounds")
-        if self.levels[location[0]-1].level_matrix[location[1]-1][location[2]-1].filled == False:
-            return (True, "Given 'location' parameter is empty")
-        return (False, None)
+            return LOCATION_NOT_TUPLE
+        if len(location) != 3:
+            return LOCATION_LENGTH
+        level, row, space = location
+        if type(level) is not int or type(row) is not int or type(space) is not int:
+            return LOCATION_NOT_INT
+        if level < 1 or row < 1 or space < 1:
+            return LOCATION_BELOW_BOUNDS
+        if level > len(self.level_bounds):
+            return LEVEL_ABOVE_BOUNDS
+        rows, spaces = self.level_bounds[level - 1]
+        if row > rows:
+            return ROW_ABOVE_BOUNDS
+        if space > spaces:
+            return SPACE_ABOVE_BOUNDS
+        if location not in self.open_tickets:
+            return LOCATION_EMPTY
+        return VALID_INPUT
+
+
+class FreeSpotIndex():
+    """
+    Defines a FreeSpotIndex instance, a priority queue of the open parking spots of one size type
+
+    Spots are ordered by distance to entrance, ties broken by (level, row, space).
+    Removal is lazy: a taken spot leaves the free set in O(1) and its stale heap entry
+    is dropped the next time it reaches the top of the heap.
+    Keys are packed into single ints to keep the index small, see pack_location.
+
+    The indexes of one size type at each entrance share a single free set, see ParkingComplex.entrance_spots:
+    taking a spot from one of them takes it from all, returning it is an add() on one index and a push()
+    on each of the others.
+
+    Args:
+        free(set): free set shared with another index, optional
+
+    Attributes:
+        heap(list): heap of (distance_to_entrance << 48 | packed location) entries
+        free(set): packed locations of the currently open spots
+    """
+    def __init__(self, free=None):
+        self.heap = []
+        self.free = free if free is not None else set()
+
+    def __len__(self):
+        return len(self.free)
+
+    def __contains__(self, key):
+        return pack_location(key) in self.free
+
+    def is_empty(self):
+        """
+        Utility funtion to check if every spot in this index is filled
+
+        Returns:
+            bool: no open spots remain
+        """
+        return not self.free
+
+    def add(self, key, distance):
+        """
+        Utility funtion to return a spot to the index, O(log n)
+
+        Args:
+            key(tuple(int,int,int)): (level, row, space) of the spot
+            distance(int): the spot's distance to entrance
+        """
+        packed = pack_location(key)
+        if packed in self.free:
+            return
+        self.free.add(packed)
+        heapq.heappush(self.heap, (distance << DISTANCE_SHIFT) | packed)
+        if len(self.heap) > 2 * len(self.free) + 64:
+            self.compact()
+
+    def push(self, key, distance):
+        """
+        Utility funtion to rank a spot just returned to the shared free set, O(log n)
+
+        Args:
+            key(tuple(int,int,int)): (level, row, space) of the spot
+            distance(int): the spot's distance to this index's entrance
+        """
+        heapq.heappush(self.heap, (distance << DISTANCE_SHIFT) | pack_location(key))
+        if len(self.heap) > 2 * len(self.free) + 64:
+            self.compact()
+
+    def rank(self, entries):
+        """
+        Utility funtion to bulk rank spots already loaded into the shared free set, O(n)
+
+        Args:
+            entries(list): (distance_to_entrance, (level, row, space)) entries to rank
+        """
+        self.heap.extend((distance << DISTANCE_SHIFT) | pack_location(key) for distance, key in entries)
+        heapq.heapify(self.heap)
+
+    def extend(self, entries):
+        """
+        Utility funtion to bulk load open spots into the index, O(n)
+
+        Args:
+            entries(list): (distance_to_entrance, (level, row, space)) entries to add
+        """
+        free = self.free
+        heap = self.heap
+        for distance, key in entries:
+            packed = pack_location(key)
+            if packed not in free:
+                free.add(packed)
+                heap.append((distance << DISTANCE_SHIFT) | packed)
+        heapq.heapify(heap)
+
+    def discard(self, key):
+        """
+        Utility funtion to remove a spot from the index, O(1)
+
+        Args:
+            key(tuple(int,int,int)): (level, row, space) of the spot
+        """
+        self.free.discard(pack_location(key))
+
+    def peek(self):
+        """
+        Utility funtion to get the closest open spot without removing it, amortized O(log n)
+
+        Returns:
+            tuple(int,int,int): (level, row, space) of the closest open spot
+            or
+            None: no open spots
+        """
+        heap = self.heap
+        free = self.free
+        while heap and heap[0] & LOCATION_MASK not in free:
+            heapq.heappop(heap)
+        if heap:
+            return unpack_location(heap[0] & LOCATION_MASK)
+        return None
+
+    def pop(self):
+        """
+        Utility funtion to take the closest open spot out of the index, amortized O(log n)
+
+        Returns:
+            tuple(int,int,int): (level, row, space) of the taken spot
+            or
+            None: no open spots
+        """
+        key = self.peek()
+        if key is not None:
+            self.free.discard(heapq.heappop(self.heap) & LOCATION_MASK)
+        return key
+
+    def compact(self):
+        """
+        Utility funtion to drop stale heap entries left behind by discard, and the duplicate entries
+        push leaves when a spot taken through another entrance is returned, so each open spot keeps
+        exactly one entry. A spot's distance is fixed per index so its duplicates are equal ints.
+        """
+        free = self.free
+        self.heap = list(set(entry for entry in self.heap if entry & LOCATION_MASK in free))
+        heapq.heapify(self.heap)
+
+
+#bit layout of a packed location: level << 32 | row << 16 | space
+LOCATION_MASK = (1 << 48) - 1
+DISTANCE_SHIFT = 48
+
+
+def pack_location(key):
+    """
+    Utility funtion to pack a (level, row, space) key into one int, each index must be below 65536
+
+    Args:
+        key(tuple(int,int,int)): (level, row, space) of a spot
+    """
+    return (key[0] << 32) | (key[1] << 16) | key[2]
+
+
+def unpack_location(packed):
+    """
+    Utility funtion to unpack an int made by pack_location
+
+    Args:
+        packed(int): packed location
+
+    Returns:
+        tuple(int,int,int): (level, row, space) of the spot
+    """
+    return (int(packed >> 32), int((packed >> 16) & 0xFFFF), int(packed & 0xFFFF))
+
+
+def spot_key(spot):
+    """
+    Utility funtion to get the (level, row, space) key of a ParkingSpot
+
+    Args:
+        spot(ParkingSpot): spot to build a key for
+    """
+    return (spot.location.level, spot.location.row, spot.location.space)
+
+
+class ComplexTemplate():
+    """
+    Defines a ComplexTemplate instance, the empty state of a ParkingComplex captured once, a fresh complex
+    is stamped out of it by copying flat arrays instead of parsing its config and ranking every spot again.
+    A template is never changed after it is made.
+
+    Args:
+        complex(ParkingComplex): complex to capture, no spot may be filled or held
+
+    Attributes:
+        name(str): name of the parking complex
+        levels(list): (rows, spaces, type_codes) of each level, type codes are shared with every stamped level
+        entrances(list): entrance ids, the first is the default entrance
+        row_distances(dict): see ParkingComplex.row_distances
+        unreachable(int): see ParkingComplex.unreachable
+        heaps(dict): maps an entrance id to a dict of size type to the heap of its FreeSpotIndex
+        free(dict): maps a size type to the frozenset of packed locations of its spots
+    """
+    def __init__(self, complex):
+        self.name = complex.name
+        self.levels = [(level.rows, level.spaces, level.type_codes) for level in complex.levels]
+        self.entrances = list(complex.entrances)
+        self.row_distances = complex.row_distances
+        self.unreachable = complex.unreachable
+        self.heaps = dict((entrance, dict((size_t, list(index.heap)) for size_t, index in free_spots.items()))
+                          for entrance, free_spots in complex.entrance_spots.items())
+        self.free = dict((size_t, frozenset(index.free)) for size_t, index in complex.free_spots.items())
+
+
+def complex_template(config_path, layout_cache_path=None):
+    """
+    Utility funtion to get the ComplexTemplate of a config file, parsed and ranked once per
+    (path, mtime, size) of the file
+
+    Args:
+        config_path(str): path to config file
+        layout_cache_path(str): binary copy of the config, see config_loader.load_cached_layout, optional
+
+    Returns:
+        ComplexTemplate
+    """
+    config_path = os.path.abspath(config_path)
+    status = os.stat(config_path)
+    key = (config_path, status.st_mtime, status.st_size)
+    with TEMPLATES_LOCK:
+        template = TEMPLATES.get(key)
+    if template is None:
+        template = ParkingComplex(None, "none", load_cached_layout(config_path, layout_cache_path)).template
+        with TEMPLATES_LOCK:
+            for stale in [stale for stale in TEMPLATES if stale[0] == config_path]:
+                del TEMPLATES[stale]
+            TEMPLATES[key] = template
+    return template
+
+
+def occupancy_stats(capacity, occupied_counts, **extra):
+    """
+    Utility funtion to build the stats dict of capacity and occupied counts
+
+    Args:
+        capacity(list): number of spaces of each config_loader.SPACE_TYPES code
+        occupied_counts(list): number of filled spaces of each config_loader.SPACE_TYPES code
+        extra(dict): other entries of the stats dict
+
+    Returns:
+        dict: see ParkingComplex.stats
+    """
+    total_capacity = sum(capacity)
+    total_occupied = sum(occupied_counts)
+    stats = {"capacity": dict(zip(SPACE_TYPES, capacity)),
+             "occupied": dict(zip(SPACE_TYPES, occupied_counts)),
+             "free": dict((size_t, total - filled) for size_t, total, filled in zip(SPACE_TYPES, capacity, occupied_counts)),
+             "total_capacity": total_capacity,
+             "total_occupied": total_occupied,
+             "total_free": total_capacity - total_occupied,
+             "occupancy": float(total_occupied) / total_capacity if total_capacity else 0.0}
+    stats.update(extra)
+    return stats
+
+
+def distance_to_entrance(level, row, space):
+    """
+    Utility funtion to get the travel distance from the entrance to a location
+
+    Note: the distance is calculated logically by assumption of entrance location(1,1,1),
+            see readme.md for more details
+    """
+    return level + row + space
 
 
 class ParkingComplexLevel():
     """
     Defines a ParkingComplexLevel instance inside of a ParkingComplex class
 
+    Each level stores one type code byte and one occupancy byte per space in row-major order,
+    ParkingSpot and Location objects are only made when a caller asks for them.
+
     Args:
         level(int): level number inside of parking complex
         rows(int): number of rows this level has
         spaces(int): number of rows this level has
-        space_types(list): contains the type of each space for level matrix
-            options:["handicap","compact","large"]
+        space_types(list|bytearray): contains the type of each space for level matrix in row-major order,
+            either type names options:["handicap","compact","large"] or config_loader.SPACE_TYPES codes
 
     Attributes:
         level(int): level number inside of parking complex
         rows(int): number of rows this level has
         spaces(int): number of rows this level has
-        level_matrix([ParkingSpot][ParkingSpot]): matrix containg a ParkingSpot object at each index
+        type_codes(bytearray): config_loader.SPACE_TYPES code of each space
+        occupancy(bytearray): 1 for each filled space, 0 for each open space
+        capacity(list): number of spaces of each config_loader.SPACE_TYPES code
+        occupied_counts(list): number of filled spaces of each config_loader.SPACE_TYPES code,
+            kept up to date by set_filled
+        level_matrix([ParkingSpot][ParkingSpot]): matrix containg a ParkingSpot object at each index,
+            built on access
 
     """
     def __init__(self, level, rows, spaces, space_types):
         self.level = level
         self.rows = rows
         self.spaces = spaces
-        self.level_matrix = [[0 for i in range(spaces)] for i in xrange(rows)]
+        self.type_codes = None
+        self.occupancy = None
+        self.capacity = None
+        self.occupied_counts = None
         self.set_level_matrix(space_types)
 
     def set_level_matrix(self, space_types):
         """
-        Utility funtion to set self.level_matrix with ParkingSpot objects
+        Utility funtion to set self.type_codes and self.occupancy for the level
+
+        Args:
+            space_types(list|bytearray): the type of each space in row-major order, space_types[i * self.spaces + j]
+                is the type of row i + 1, space j + 1
+        """
+        if len(space_types) != self.rows * self.spaces:
+            raise ValueError("Level {} expects {} space types, {} given".format(self.level, self.rows * self.spaces, len(space_types)))
+        if isinstance(space_types, bytearray):
+            self.type_codes = space_types
+        else:
+            self.type_codes = encode_space_types(space_types)
+        self.occupancy = bytearray(len(self.type_codes))
+        self.capacity = [self.type_codes.count(bytearray([code])) for code in range(0, len(SPACE_TYPES))]
+        self.occupied_counts = [0] * len(SPACE_TYPES)
+
+    @property
+    def level_matrix(self):
+        """
+        Utility funtion to build the full matrix of ParkingSpot objects for this level, O(rows * spaces)
+        """
+        return [[self.get_spot(i, j) for j in xrange(1, self.spaces + 1)] for i in xrange(1, self.rows + 1)]
+
+    def offset(self, row, space):
+        """
+        Utility funtion to get the row-major offset of a space
+
+        Args:
+            row(int): row number, starts at 1
+            space(int): space number, starts at 1
+        """
+        return (row - 1) * self.spaces + space - 1
+
+    def get_spot(self, row, space):
+        """
+        Utility funtion to make the ParkingSpot at a row and space of this level
+
+        Args:
+            row(int): row number, starts at 1
+            space(int): space number, starts at 1
+
+        Returns:
+            ParkingSpot object backed by this level's occupancy
+        """
+        size_t = SPACE_TYPES[self.type_codes[self.offset(row, space)]]
+        return ParkingSpot(size_t, Location(self.level, row, space), self)
+
+    def is_filled(self, row, space):
+        """
+        Utility funtion to check if a space is filled
+
+        Args:
+            row(int): row number, starts at 1
+            space(int): space number, starts at 1
+        """
+        return self.occupancy[self.offset(row, space)] != 0
+
+    def set_filled(self, row, space, filled):
+        """
+        Utility funtion to set a space filled or open
 
         Args:
-            spaces(int): number of rows this level has
+            row(int): row number, starts at 1
+            space(int): space number, starts at 1
+            filled(bool): boolean of the space being filled
         """
-        for i in range(0, self.rows):
-            for j in range(0, self.spaces):
-                temp_location = Location(self.level, i+1, j+1)
-                p_type = space_types[int(str(i) + str(j))]
-                temp_p_spot = ParkingSpot(p_type, temp_location)
-                self.level_matrix[i][j] = temp_p_spot
+        offset = self.offset(row, space)
+        value = 1 if filled else 0
+        if self.occupancy[offset] != value:
+            self.occupancy[offset] = value
+            self.occupied_counts[self.type_codes[offset]] += 1 if filled else -1
 
+    def recount(self):
+        """
+        Utility funtion to rebuild self.occupied_counts from self.occupancy, O(rows * spaces)
+        """
+        occupied_counts = [0] * len(SPACE_TYPES)
+        for code, filled in itertools.izip(self.type_codes, self.occupancy):
+            if filled:
+                occupied_counts[code] += 1
+        self.occupied_counts = occupied_counts
+
+    def stats(self):
+        """
+        Utility funtion to get the capacity, occupied and free counts of this level, O(1)
 
-class Location():
+        Returns:
+            dict: see ParkingComplex.stats
+        """
+        return occupancy_stats(self.capacity, list(self.occupied_counts), level=self.level)
+
+
+class Location(namedtuple("Location", ["level", "row", "space"])):
     """
-    Defines a Location instance inside of a ParkingSpot class
+    Defines a Location instance inside of a ParkingSpot class, an immutable (level, row, space) tuple
 
     Args:
         level(int): level number of this location
@@ -439,13 +1255,10 @@ class Location():
         space(int): space number of this location
 
     """
-    def __init__(self, level, row, space):
-        self.level = level
-        self.row = row
-        self.space = space
+    __slots__ = ()
 
 
-class ParkingSpot():
+class ParkingSpot(object):
     """
     Defines a ParkingSpot instance inside of a ParkingComplexLevel class
 
@@ -453,34 +1266,52 @@ class ParkingSpot():
         size_t(str): the size of the parking spot
             options:["handicap","compact","large"]
         location(Location): location of this parking spot in the complex
+        complex_level(ParkingComplexLevel): level whose occupancy backs self.filled, optional
 
     Attributes:
         size_t(str): the size of the parking spot
             options:["handicap","compact","large"]
         location(Location): location of this parking spot in the complex
-        filled(bool): boolean of parking spot being empty
+        complex_level(ParkingComplexLevel): level whose occupancy backs self.filled, or None
+        filled(bool): boolean of parking spot being filled
         distance_to_entrance(int): the travel distance in complex from entrance to this parking spot
             Note: the distance is calculated logically by assumption of entrance location(1,1,1),
                     see readme.md for more details
 
     """
-    def __init__(self, size_t, location):
+    __slots__ = ("size_t", "location", "complex_level", "_filled", "distance_to_entrance")
+
+    def __init__(self, size_t, location, complex_level=None):
         self.size_t = size_t
         self.location = location
-        self.filled = False
+        self.complex_level = complex_level
+        self._filled = False
         self.distance_to_entrance = 0
         self.set_distance_to_entrance()
 
+    @property
+    def filled(self):
+        if self.complex_level is not None:
+            return self.complex_level.is_filled(self.location.row, self.location.space)
+        return self._filled
+
+    @filled.setter
+    def filled(self, filled):
+        if self.complex_level is not None:
+            self.complex_level.set_filled(self.location.row, self.location.space, filled)
+        else:
+            self._filled = filled
+
     def set_distance_to_entrance(self):
         """
         Utility funtion to set self.distance_to_entrance
         """
-        self.distance_to_entrance = self.location.level + self.location.row + self.location.space
+        self.distance_to_entrance = distance_to_entrance(self.location.level, self.location.row, self.location.space)
 
 
-class Customer():
+class Customer(namedtuple("Customer", ["size", "handicapped"])):
     """
-    Defines a ParkingSpot instance inside of a ParkingComplexLevel class
+    Defines a Customer instance inside of a Ticket class, an immutable (size, handicapped) tuple
 
     Args:
         size(str): the size of the parking spot
@@ -493,20 +1324,18 @@ class Customer():
         handicapped(bool): boolean of customer handicapped privileges
 
     """
+    __slots__ = ()
 
-    def __init__(self, size, handicapped):
-        self.size = size
-        self.handicapped = handicapped
 
-
-class Ticket():
+class Ticket(object):
     """
-    Defines a ParkingSpot instance inside of a ParkingComplexLevel class
+    Defines a Ticket instance inside of a ParkingComplex class
 
     Args:
         p_spot(ParkingSpot): parking spot associated with this ticket
         customer(Customer): customer associated with this ticket
         id(int): ticket id number in this complex
+        start_t(datetime): date of when this car parked, default is now
 
     Attributes:
         p_spot(ParkingSpot): parking spot associated with this ticket
@@ -518,16 +1347,19 @@ class Ticket():
         description(str): string to denoted a value in printed map
         charge(float): amount charged for park time
     """
-    def __init__(self, p_spot, customer, id):
+    __slots__ = ("p_spot", "customer", "id", "start_t", "end_t", "delta_t", "description", "charge")
+
+    def __init__(self, p_spot, customer, id, start_t=None):
         self.p_spot = p_spot
         self.customer = customer
         self.id = id
-        self.start_t = None
+        self.start_t = start_t
         self.end_t = None
         self.delta_t = None
         self.description = None
         self.charge = None
-        self.set_start_t()
+        if start_t is None:
+            self.set_start_t()
         self.set_description()
 
     def set_start_t(self):
@@ -563,10 +1395,17 @@ class Ticket():
             d = "LAR"
         self.description = d
 
-    def set_charge(self):
+    def set_charge(self, tariff=None):
         """
         Utility/Delegation funtion to set self.delta_t and determind the rate then set self.charge
+
+        Args:
+            tariff(Tariff): pricing to use instead of the flat rates, optional
         """
+        if tariff is not None:
+            self.set_delta_t()
+            self.charge = tariff.charge(self)
+            return
         if(self.customer.handicapped or self.p_spot.size_t == "compact"):
             rate = 5.00
         else:
@@ -596,12 +1435,15 @@ class Ticket():
         total = rate * intervals
         self.charge = float(round(total, 2))
 
-    def close(self):
+    def close(self, tariff=None):
         """
         Delegation funtion to close a ticket by setting self.end_t and self.charge
+
+        Args:
+            tariff(Tariff): pricing to use instead of the flat rates, optional
         """
         self.set_end_t()
-        self.set_charge()
+        self.set_charge(tariff)
 
     def format_charge(self):
         """
@@ -7,9 +7,30 @@ Tests module:
 
 from park_unpark import *
 import park_unpark
+import config_loader
+import ticket_log
+import sharding
+import journal
+import storage
+import billing
+import tariff
+import instrumentation
+import walking
+import reservations
+import analytics
+import json
 import unittest
 import time
 import datetime
+import sys
+import os
+import random
+import threading
+import tempfile
+import shutil
+import subprocess
+import StringIO
+from array import array
 
 
 class Tests(unittest.TestCase):
@@ -36,6 +57,23 @@ class Tests(unittest.TestCase):
         self.assertRaises(park_unpark.InvalidInputError, park_unpark.unpark, (1, 1, 45))
         self.assertRaises(park_unpark.InvalidInputError, park_unpark.unpark, (1, 1, 1))
 
+        # bounds are those of the location's own level, level 1 has 6 rows and level 2 has 8
+        complex = park_unpark.parking_complex
+        self.assertEqual(complex.check_unpark_input((2, 7, 1))[2], "location_empty")
+        self.assertEqual(complex.check_unpark_input((1, 7, 1))[2], "row_above_bounds")
+        self.assertEqual(complex.check_unpark_input((1, 2)), LOCATION_LENGTH)
+        stdout = sys.stdout
+        sys.stdout = StringIO.StringIO()
+        try:
+            with self.assertRaises(park_unpark.InvalidInputError) as raised:
+                park_unpark.unpark((1, 1, 11))
+        finally:
+            printed, sys.stdout = sys.stdout.getvalue(), stdout
+        self.assertEqual(raised.exception.code, "space_above_bounds")
+        self.assertEqual(printed, "")
+        self.assertEqual(park_unpark.unpark_trusted((1, 1, 1)), None)
+        self.assertEqual(park_unpark.unpark_trusted(park_unpark.park_trusted("large_car", False)), 7.5)
+
     def test_valid_park_unpark_output(self):
         print "\n\n\nTest: park unpark output"
         print "*" * 145
@@ -75,6 +113,833 @@ class Tests(unittest.TestCase):
         self.assertEqual(first_large_location, (2, 5, 1))
         self.assertEqual(first_large_rate, 7.5)
 
+    def test_open_ticket_lookup(self):
+        print "\n\n\nTest: open ticket lookup"
+        print "*" * 145
+
+        park_unpark.init()
+        p = park_unpark.park('large_car', False)
+        ticket = park_unpark.parking_complex.open_tickets[p]
+        self.assertEqual(ticket.id, 1)
+        park_unpark.unpark(p)
+        self.assertEqual(p in park_unpark.parking_complex.open_tickets, False)
+        self.assertRaises(park_unpark.InvalidInputError, park_unpark.unpark, p)
+
+    def test_renderers(self):
+        print "\n\n\nTest: renderers"
+        print "*" * 145
+
+        outputs = {}
+        for renderer in ["none", "summary", "map"]:
+            park_unpark.init(renderer)
+            stdout = sys.stdout
+            sys.stdout = StringIO.StringIO()
+            try:
+                p = park_unpark.park('compact_car', False)
+                park_unpark.unpark(p)
+                outputs[renderer] = sys.stdout.getvalue()
+            finally:
+                sys.stdout = stdout
+        self.assertEqual(outputs["none"], "")
+        self.assertEqual("Charge Due:\t\t $5.00" in outputs["summary"], True)
+        self.assertEqual("Level 3" in outputs["summary"], False)
+        self.assertEqual("Level 3" in outputs["map"], True)
+        self.assertEqual("Park\t\t" in outputs["map"], True)
+
+    def test_wide_level(self):
+        print "\n\n\nTest: wide level"
+        print "*" * 145
+
+        # 12 rows of 40 spaces, row 1 handicap, rows 2-6 compact, rows 7-12 large
+        space_types = ["handicap"] * 40 + ["compact"] * 200 + ["large"] * 240
+        fd, path = tempfile.mkstemp(suffix=".txt")
+        with os.fdopen(fd, "w") as config:
+            config.write("Deck,1\n12,40\n" + "\n".join(space_types) + "\n")
+        try:
+            complex = ParkingComplex(path, "none")
+        finally:
+            os.remove(path)
+        level = complex.levels[0]
+        self.assertEqual(level.level_matrix[0][39].size_t, "handicap")
+        self.assertEqual(level.level_matrix[1][0].size_t, "compact")
+        self.assertEqual(level.level_matrix[5][39].size_t, "compact")
+        self.assertEqual(level.level_matrix[6][0].size_t, "large")
+        self.assertEqual(level.level_matrix[11][39].location.space, 40)
+        self.assertEqual((len(complex.handicap_spots), len(complex.compact_spots), len(complex.large_spots)), (40, 200, 240))
+        self.assertEqual(complex.park_customer("large_car", False), (1, 7, 1))
+
+    def test_config_formats(self):
+        print "\n\n\nTest: config formats"
+        print "*" * 145
+
+        text_layout = config_loader.load_layout("redwood.txt")
+        compact_layout = config_loader.load_layout("redwood.cfg")
+        fd, path = tempfile.mkstemp(suffix=".bin")
+        os.close(fd)
+        try:
+            config_loader.write_binary_layout(text_layout, path)
+            binary_layout = config_loader.load_layout(path)
+            binary_complex = ParkingComplex(path, "none")
+        finally:
+            os.remove(path)
+        for layout in [compact_layout, binary_layout]:
+            self.assertEqual(layout.name, "Redwood")
+            self.assertEqual([(l.rows, l.spaces, l.type_codes) for l in layout.levels],
+                             [(l.rows, l.spaces, l.type_codes) for l in text_layout.levels])
+
+        # mixed runs inside a row
+        fd, path = tempfile.mkstemp(suffix=".cfg")
+        with os.fdopen(fd, "w") as config:
+            config.write("Mixed,1\n2,10\nrow 1: handicap*4, compact*6\nrow 2: large\n")
+        try:
+            mixed_complex = ParkingComplex(path, "none")
+        finally:
+            os.remove(path)
+        self.assertEqual([spot.size_t for spot in mixed_complex.levels[0].level_matrix[0][3:5]], ["handicap", "compact"])
+        self.assertEqual(mixed_complex.levels[0].level_matrix[1][9].size_t, "large")
+
+        # row lines of a 4 row level must cover each row exactly once
+        for rows in ["rows 1-2: compact\nrows 2-3: large\n",
+                     "rows 1-2: compact\nrow 4: large\n",
+                     "rows 1-2: compact\nrows 3-5: large\n",
+                     "rows 2-1: compact\nrows 3-4: large\n"]:
+            fd, path = tempfile.mkstemp(suffix=".cfg")
+            with os.fdopen(fd, "w") as config:
+                config.write("Rows,1\n4,3\n" + rows)
+            try:
+                self.assertRaises(ValueError, config_loader.load_layout, path)
+            finally:
+                os.remove(path)
+
+        self.assertEqual(binary_complex.park_customer("large_car", False), (2, 5, 1))
+
+    def test_occupancy_bitmap(self):
+        print "\n\n\nTest: occupancy bitmap"
+        print "*" * 145
+
+        park_unpark.init("none")
+        level = park_unpark.parking_complex.levels[1]
+        p = park_unpark.park('compact_car', False)
+        self.assertEqual(p, (2, 1, 1))
+        self.assertEqual(level.occupancy[0], 1)
+        self.assertEqual(level.get_spot(1, 1).filled, True)
+        self.assertEqual(level.level_matrix[0][0].filled, True)
+        park_unpark.unpark(p)
+        self.assertEqual(level.get_spot(1, 1).filled, False)
+        self.assertEqual(level.type_codes[level.offset(5, 1)], config_loader.SPACE_TYPE_CODES["large"])
+
+    def test_ticket_history(self):
+        print "\n\n\nTest: ticket history"
+        print "*" * 145
+
+        fd, path = tempfile.mkstemp(suffix=".log")
+        os.close(fd)
+        os.remove(path)
+        try:
+            park_unpark.init("none", ticket_log_path=path, recent_tickets=2)
+            locations = [park_unpark.park('compact_car', False) for n in range(0, 4)]
+            for location in locations[:3]:
+                park_unpark.unpark(location)
+            history = park_unpark.parking_complex.tickets
+            self.assertEqual(len(history), 4)
+            self.assertEqual(history[3].end_t, None)
+            self.assertEqual(history[2].charge, 5)
+            self.assertRaises(IndexError, history.__getitem__, 0)
+            park_unpark.parking_complex.flush()
+            records = list(ticket_log.read_ticket_log(path))
+            self.assertEqual([record.id for record in records], [1, 2, 3])
+            self.assertEqual((records[0].level, records[0].row, records[0].space), locations[0])
+            self.assertEqual((records[0].size_t, records[0].size, records[0].handicapped), ("compact", "compact_car", False))
+            self.assertEqual(records[0].charge, 5)
+            self.assertEqual(abs(records[0].start_t - history[3].start_t) < datetime.timedelta(seconds=60), True)
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def test_concurrent_park_unpark(self):
+        print "\n\n\nTest: concurrent park unpark"
+        print "*" * 145
+
+        park_unpark.init("none")
+        complex = park_unpark.parking_complex
+        held = {}
+        held_lock = threading.Lock()
+        errors = []
+        check_interval = sys.getcheckinterval()
+        sys.setcheckinterval(1)
+
+        def gate(seed):
+            rng = random.Random(seed)
+            mine = []
+            try:
+                for n in range(0, 400):
+                    if mine and rng.random() < 0.4:
+                        location = mine.pop(rng.randrange(len(mine)))
+                        with held_lock:
+                            del held[location]
+                        complex.unpark_customer(location)
+                    else:
+                        location = complex.park_customer(rng.choice(['compact_car', 'large_car']), rng.random() < 0.2)
+                        if location is not None:
+                            with held_lock:
+                                if location in held:
+                                    errors.append((location, held[location], seed))
+                                held[location] = seed
+                            mine.append(location)
+            except Exception as e:
+                errors.append(e)
+
+        try:
+            gates = [threading.Thread(target=gate, args=(seed,)) for seed in range(0, 8)]
+            for g in gates:
+                g.start()
+            for g in gates:
+                g.join()
+        finally:
+            sys.setcheckinterval(check_interval)
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(complex.open_tickets.keys()), sorted(held.keys()))
+        free = sum(len(index) for index in complex.free_spots.values())
+        self.assertEqual(free + len(held), 220)
+        filled = sum(sum(level.occupancy) for level in complex.levels)
+        self.assertEqual(filled, len(held))
+
+    def test_batch_park_unpark(self):
+        print "\n\n\nTest: batch park unpark"
+        print "*" * 145
+
+        rng = random.Random(7)
+        requests = [(rng.choice(['compact_car', 'large_car']), rng.random() < 0.3) for n in range(0, 240)]
+        park_unpark.init("none")
+        sequential = [park_unpark.park(*request) for request in requests]
+        park_unpark.init("none")
+        batch = park_unpark.park_many(requests)
+        self.assertEqual(batch, sequential)
+        self.assertEqual(batch.count(None) > 0, True)
+
+        # invalid batches change nothing
+        parked = [location for location in batch if location is not None]
+        self.assertRaises(park_unpark.InvalidInputError, park_unpark.unpark_many, [parked[0], parked[0]])
+        self.assertRaises(park_unpark.InvalidInputError, park_unpark.park_many, [('compact_car', False), ('bus', False)])
+        self.assertEqual(len(park_unpark.parking_complex.open_tickets), len(parked))
+
+        charges = park_unpark.unpark_many(parked[:10])
+        self.assertEqual(len(charges), 10)
+        self.assertEqual(all(isinstance(charge, float) for charge in charges), True)
+        self.assertEqual(len(park_unpark.parking_complex.open_tickets), len(parked) - 10)
+
+    def test_single_writer(self):
+        print "\n\n\nTest: single writer"
+        print "*" * 145
+
+        park_unpark.init("none", single_writer=True)
+        try:
+            pending = [park_unpark.park_async('compact_car', n % 2 == 0) for n in range(0, 50)]
+            locations = [p.result(5) for p in pending]
+            self.assertEqual(len(set(locations)), 50)
+            self.assertEqual(locations[0], (1, 1, 1))
+
+            results = []
+            gates = [threading.Thread(target=lambda: results.append(park_unpark.park('large_car', False))) for n in range(0, 8)]
+            for g in gates:
+                g.start()
+            for g in gates:
+                g.join()
+            self.assertEqual(len(set(results)), 8)
+
+            self.assertEqual(isinstance(park_unpark.unpark(locations[0]), float), True)
+            self.assertRaises(park_unpark.InvalidInputError, park_unpark.unpark, locations[0])
+            self.assertRaises(park_unpark.InvalidInputError, park_unpark.unpark_async(locations[0]).result, 5)
+        finally:
+            park_unpark.init("none")
+        self.assertEqual(park_unpark.gate_writer, None)
+
+    def test_registry(self):
+        print "\n\n\nTest: registry"
+        print "*" * 145
+
+        config_dir = tempfile.mkdtemp()
+        try:
+            shutil.copy("redwood.txt", os.path.join(config_dir, "redwood.txt"))
+            shutil.copy("redwood.cfg", os.path.join(config_dir, "sequoia.cfg"))
+            park_unpark.init("none", instrument=True, analytics=True)
+            loaded = park_unpark.init_registry(config_dir)
+        finally:
+            shutil.rmtree(config_dir)
+        self.assertEqual(loaded, ["redwood", "sequoia"])
+        # the instruments and analytics of the complex init() served are dropped with it
+        self.assertEqual((park_unpark.gate_instruments, park_unpark.gate_analytics), (None, None))
+        self.assertEqual(park_unpark.parking_complex, park_unpark.registry.get("redwood"))
+
+        # complexes are independent
+        self.assertEqual(park_unpark.park('compact_car', True, "redwood"), (1, 1, 1))
+        self.assertEqual(park_unpark.park('compact_car', True, "sequoia"), (1, 1, 1))
+        self.assertEqual(park_unpark.park('compact_car', True), (1, 1, 2))
+        self.assertEqual(park_unpark.park_many([('large_car', False)], "sequoia"), [(2, 5, 1)])
+        self.assertEqual(park_unpark.unpark((1, 1, 1), "sequoia"), 5)
+        self.assertEqual(len(park_unpark.registry.get("redwood").open_tickets), 2)
+        self.assertEqual(len(park_unpark.registry.get("sequoia").open_tickets), 1)
+        self.assertRaises(park_unpark.InvalidInputError, park_unpark.park, 'compact_car', True, "cedar")
+        park_unpark.init("none")
+        self.assertEqual(park_unpark.registry, None)
+
+    def test_sharded_router(self):
+        print "\n\n\nTest: sharded router"
+        print "*" * 145
+
+        config_dir = tempfile.mkdtemp()
+        try:
+            for complex_id in ["redwood", "sequoia", "cedar"]:
+                shutil.copy("redwood.cfg", os.path.join(config_dir, complex_id + ".cfg"))
+            router = sharding.ShardRouter(config_dir, 2)
+        finally:
+            shutil.rmtree(config_dir)
+        try:
+            self.assertEqual(sorted(set(router.shard_of.values())), [0, 1])
+            self.assertEqual(router.park('compact_car', True, "cedar"), (1, 1, 1))
+            results = router.run([("park", "redwood", ('large_car', False)),
+                                  ("park", "sequoia", ('compact_car', False)),
+                                  ("park", "redwood", ('large_car', False)),
+                                  ("park", "redwood", ('bus', False))])
+            self.assertEqual(results[:3], [(2, 5, 1), (2, 1, 1), (2, 5, 2)])
+            self.assertEqual(isinstance(results[3], park_unpark.InvalidInputError), True)
+            self.assertEqual(router.unpark((1, 1, 1), "cedar"), 5)
+            self.assertRaises(park_unpark.InvalidInputError, router.unpark, (1, 1, 1), "cedar")
+            self.assertRaises(park_unpark.InvalidInputError, router.park, 'compact_car', True, "oak")
+            # the complex id is passed by keyword, it is not taken for the entrance
+            results = router.run([("park", "sequoia", ('compact_car', False), {"entrance": "main"}),
+                                  ("park", "sequoia", ('compact_car', False), {"entrance": "north"}),
+                                  ("unpark", "sequoia", ((2, 1, 1), "sequoia")),
+                                  ("unpark", "sequoia", ((2, 1, 1),))])
+            self.assertEqual(results[0], (1, 3, 1))
+            self.assertEqual(results[1].code, "entrance_unknown")
+            # any other exception is sent back and the worker keeps serving
+            self.assertEqual(isinstance(results[2], TypeError), True)
+            self.assertEqual(results[3], 5)
+            self.assertEqual(router.park('compact_car', False, "sequoia", "main"), (2, 1, 1))
+            self.assertRaises(TypeError, router.run_one, ("unpark", "sequoia", ((2, 1, 2), "sequoia")))
+        finally:
+            router.close()
+
+    def test_concurrent_router(self):
+        print "\n\n\nTest: concurrent router"
+        print "*" * 145
+
+        config_dir = tempfile.mkdtemp()
+        try:
+            for complex_id in ["redwood", "sequoia", "cedar"]:
+                shutil.copy("redwood.cfg", os.path.join(config_dir, complex_id + ".cfg"))
+            router = sharding.ShardRouter(config_dir, 2)
+        finally:
+            shutil.rmtree(config_dir)
+        errors = []
+
+        # each gate parks and unparks in its own complex, a reply handed to another gate would
+        # give it a location from the wrong complex or unpark a spot it does not hold
+        def gate(complex_id, size):
+            mine = []
+            try:
+                for n in range(0, 150):
+                    if len(mine) > 3:
+                        charge = router.unpark(mine.pop(0), complex_id)
+                        if charge != {'compact_car': 5, 'large_car': 7.5}[size]:
+                            errors.append((complex_id, charge))
+                    location = router.park(size, False, complex_id)
+                    if location in mine:
+                        errors.append((complex_id, location))
+                    mine.append(location)
+                results = router.run([("unpark", complex_id, (location,)) for location in mine])
+                if any(isinstance(result, Exception) for result in results):
+                    errors.append((complex_id, results))
+            except Exception as e:
+                errors.append(e)
+
+        try:
+            gates = [threading.Thread(target=gate, args=(complex_id, size))
+                     for complex_id in ["redwood", "sequoia", "cedar"] for size in ['compact_car', 'large_car']]
+            for g in gates:
+                g.start()
+            for g in gates:
+                g.join()
+        finally:
+            router.close()
+        self.assertEqual(errors, [])
+
+    def test_journal_recovery(self):
+        print "\n\n\nTest: journal recovery"
+        print "*" * 145
+
+        journal_dir = tempfile.mkdtemp()
+        try:
+            park_unpark.init("none", journal_dir=journal_dir)
+            self.assertEqual(park_unpark.park('compact_car', True), (1, 1, 1))
+            self.assertEqual(park_unpark.park('large_car', False), (2, 5, 1))
+            self.assertEqual(park_unpark.park('compact_car', False), (2, 1, 1))
+            self.assertEqual(park_unpark.unpark((2, 5, 1)), 7.5)
+
+            # crash without a final snapshot, recovery replays the journal
+            park_unpark.gate_journal.close(snapshot=False)
+            park_unpark.gate_journal = None
+            self.assertEqual(journal.read_snapshot(os.path.join(journal_dir, journal.SNAPSHOT_FILE))[1], 1)
+            park_unpark.init("none", journal_dir=journal_dir)
+            complex = park_unpark.parking_complex
+            self.assertEqual(sorted(complex.open_tickets), [(1, 1, 1), (2, 1, 1)])
+            self.assertEqual(complex.open_tickets[(2, 1, 1)].id, 3)
+            self.assertEqual(complex.levels[0].is_filled(1, 1), True)
+            self.assertEqual(complex.levels[1].is_filled(5, 1), False)
+            self.assertEqual(park_unpark.park('compact_car', True), (1, 1, 2))
+            self.assertEqual(complex.open_tickets[(1, 1, 2)].id, 4)
+            self.assertEqual(park_unpark.unpark((1, 1, 1)), 5)
+
+            # clean shutdown snapshots, recovery replays nothing
+            park_unpark.init("none", journal_dir=journal_dir)
+            self.assertEqual(os.path.getsize(os.path.join(journal_dir, journal.JOURNAL_FILE)), 0)
+            self.assertEqual(sorted(park_unpark.parking_complex.open_tickets), [(1, 1, 2), (2, 1, 1)])
+            self.assertEqual(park_unpark.park('compact_car', True), (1, 1, 1))
+            self.assertEqual(park_unpark.parking_complex.open_tickets[(1, 1, 1)].id, 5)
+        finally:
+            park_unpark.init("none")
+            shutil.rmtree(journal_dir)
+
+    def test_sqlite_store(self):
+        print "\n\n\nTest: sqlite store"
+        print "*" * 145
+
+        db_dir = tempfile.mkdtemp()
+        db_path = os.path.join(db_dir, "redwood.db")
+        try:
+            self.assertRaises(ValueError, storage.open_complex, os.path.join(db_dir, "empty.db"))
+            park_unpark.init("none", database_path=db_path)
+            store = park_unpark.gate_store
+            self.assertEqual(park_unpark.park('compact_car', True), (1, 1, 1))
+            self.assertEqual(park_unpark.park('large_car', False), (2, 5, 1))
+            self.assertEqual(park_unpark.park('compact_car', False), (2, 1, 1))
+            self.assertEqual(park_unpark.unpark((2, 5, 1)), 7.5)
+            store.sync()
+            self.assertEqual(store.open_ticket_count(), 2)
+            self.assertEqual(store.occupancy_by_level(), {1: 1, 2: 1})
+            self.assertEqual(store.revenue_by_size(), {"large": (1, 750)})
+            self.assertEqual(len(store.tickets_between(datetime.datetime(2000, 1, 1), datetime.datetime(3000, 1, 1))), 3)
+
+            # reboot from the database, the config file is not read again
+            park_unpark.init("none", config_path="missing.txt", database_path=db_path)
+            complex = park_unpark.parking_complex
+            self.assertEqual(complex.name, "Redwood")
+            self.assertEqual(sorted(complex.open_tickets), [(1, 1, 1), (2, 1, 1)])
+            self.assertEqual(complex.levels[1].is_filled(1, 1), True)
+            self.assertEqual(park_unpark.park('large_car', False), (2, 5, 1))
+            self.assertEqual(complex.open_tickets[(2, 5, 1)].id, 4)
+            self.assertEqual(park_unpark.unpark((1, 1, 1)), 5)
+            park_unpark.gate_store.sync()
+            self.assertEqual(park_unpark.gate_store.revenue_by_size(), {"handicap": (1, 500), "large": (1, 750)})
+
+            # a database and a journal would both recover the complex, the combined boot is refused
+            self.assertEqual(complex.levels[1].is_filled(1, 1), True)
+            self.assertRaises(ValueError, park_unpark.init, "none", config_path="missing.txt",
+                              journal_dir=os.path.join(db_dir, "journal"), database_path=db_path)
+            self.assertIs(park_unpark.parking_complex, complex)
+            self.assertEqual(os.path.exists(os.path.join(db_dir, "journal")), False)
+
+            # the tariff next to the config prices tickets of a complex booted from the database
+            config_path = os.path.join(db_dir, "garage.cfg")
+            shutil.copy("redwood.cfg", config_path)
+            with open(os.path.join(db_dir, "garage.tariff"), "w") as definition:
+                definition.write("rate large: 10.00\n")
+            tariff_db_path = os.path.join(db_dir, "tariff.db")
+            for boot in range(0, 2):
+                park_unpark.init("none", config_path=config_path, database_path=tariff_db_path)
+                self.assertEqual(park_unpark.parking_complex.tariff is not None, True)
+                self.assertEqual(park_unpark.unpark(park_unpark.park('large_car', False)), 10)
+        finally:
+            park_unpark.init("none")
+            shutil.rmtree(db_dir)
+
+    def test_batch_billing(self):
+        print "\n\n\nTest: batch billing"
+        print "*" * 145
+
+        park_unpark.init("none")
+        complex = park_unpark.parking_complex
+        durations = [0, 899, 900, 959, 960, 1799, 1800, 1801, 7385, 40000]
+        customers = [('compact_car', True), ('compact_car', False), ('large_car', False), ('large_car', True)]
+        tickets = []
+        for n, seconds in enumerate(durations):
+            for size, handicapped in customers:
+                ticket = complex.open_tickets[park_unpark.park(size, handicapped)]
+                ticket.start_t = ticket.start_t - datetime.timedelta(seconds=seconds, microseconds=n * 99991)
+                park_unpark.unpark(spot_key(ticket.p_spot))
+                tickets.append(ticket)
+        charges, revenue = billing.bill(billing.ticket_columns(tickets))
+        self.assertEqual(list(charges), [ticket_log.to_cents(ticket.charge) for ticket in tickets])
+        self.assertEqual(sum(cents for count, cents in revenue.values()),
+                         sum(ticket_log.to_cents(ticket.charge) for ticket in tickets))
+        self.assertEqual(sum(count for count, cents in revenue.values()), len(tickets))
+
+        # overrides are rounded up to the penny
+        columns = (array("d", [0, 0]), array("d", [1861e6, 60e6]),
+                   array("B", [2, 1]), array("B", [0, 0]))
+        charges, revenue = billing.bill(columns, {"large": 7.333, "compact": 0.0001})
+        self.assertEqual(list(charges), [2200, 1])
+        self.assertEqual(revenue, {"handicap": (0, 0), "compact": (1, 1), "large": (1, 2200)})
+        self.assertRaises(ValueError, billing.rate_table, {"large": 7.33333})
+
+    def test_tariff(self):
+        print "\n\n\nTest: tariff"
+        print "*" * 145
+
+        config_dir = tempfile.mkdtemp()
+        try:
+            shutil.copy("redwood.cfg", os.path.join(config_dir, "garage.cfg"))
+            with open(os.path.join(config_dir, "garage.tariff"), "w") as definition:
+                definition.write("# weekday tariff\n"
+                                 "rate large: 10.00\n"
+                                 "period 07:00-10:00: 1.5\n"
+                                 "daily cap: 60.00\n"
+                                 "event 2026-07-04 18:00 - 2026-07-04 23:30: 3\n")
+            park_unpark.init("none", config_path=os.path.join(config_dir, "garage.cfg"))
+        finally:
+            shutil.rmtree(config_dir)
+        complex = park_unpark.parking_complex
+        garage_tariff = complex.tariff
+        self.assertEqual(garage_tariff.flat, False)
+        location = park_unpark.park('large_car', False)
+        ticket = complex.open_tickets[location]
+        self.assertEqual(park_unpark.unpark(location), garage_tariff.charge(ticket))
+        # tickets with fixed times, off-peak and inside the 07:00-10:00 period
+        for start, charge in [(datetime.datetime(2026, 7, 1, 5, 0), 20), (datetime.datetime(2026, 7, 1, 7, 30), 30)]:
+            ticket.start_t, ticket.end_t = start, start + datetime.timedelta(minutes=30)
+            ticket.set_charge(garage_tariff)
+            self.assertEqual(ticket.charge, charge)
+
+        day = datetime.datetime(2026, 7, 1)
+        def price(start, minutes, size_t="large", handicapped=False):
+            start_us = billing.to_microseconds(start - ticket_log.EPOCH)
+            return garage_tariff.price_cents(start_us, start_us + minutes * 60 * 1000000,
+                                             garage_tariff.class_of(size_t, handicapped))
+        self.assertEqual(price(day.replace(hour=5), 0), 1000)
+        self.assertEqual(price(day.replace(hour=5), 60), 4000)
+        self.assertEqual(price(day.replace(hour=6, minute=30), 60), 5000)
+        self.assertEqual(price(day.replace(hour=6, minute=30), 60, "compact"), 2500)
+        self.assertEqual(price(day.replace(hour=6, minute=30), 60, "large", True), 2500)
+        # capped per 24 hours from entry
+        self.assertEqual(price(day.replace(hour=11), 5 * 60), 6000)
+        self.assertEqual(price(day.replace(hour=11), 3 * 24 * 60 + 60), 3 * 6000 + 4000)
+        # event rates
+        self.assertEqual(price(datetime.datetime(2026, 7, 4, 17, 30), 60, "compact"), 500 * 2 + 1500 * 2)
+        self.assertEqual(price(datetime.datetime(2026, 7, 4, 17, 30), 60), 6000)
+
+        # a flat tariff prices like Ticket.set_charge
+        flat = tariff.Tariff()
+        for seconds in [0, 899, 900, 959, 960, 1801, 40000]:
+            ticket = Ticket(ParkingSpot("large", Location(1, 1, 1)), Customer("large_car", False), 1)
+            ticket.end_t = ticket.start_t + datetime.timedelta(seconds=seconds)
+            ticket.set_charge()
+            charge = ticket.charge
+            ticket.set_charge(flat)
+            self.assertEqual(ticket.charge, charge)
+
+    def test_stats(self):
+        print "\n\n\nTest: stats"
+        print "*" * 145
+
+        park_unpark.init("none")
+        complex = park_unpark.parking_complex
+        stats = complex.stats()
+        self.assertEqual(stats["total_capacity"], 220)
+        self.assertEqual(stats["total_free"], 220)
+        self.assertEqual(stats["occupancy"], 0.0)
+        self.assertEqual([level["capacity"] for level in stats["levels"]],
+                         [{"handicap": 20, "compact": 40, "large": 0}, {"handicap": 0, "compact": 40, "large": 40},
+                          {"handicap": 0, "compact": 40, "large": 40}])
+
+        park_unpark.park('compact_car', True)
+        park_unpark.park('large_car', False)
+        park_unpark.park_many([('compact_car', False), ('compact_car', False)])
+        park_unpark.unpark((2, 5, 1))
+        stats = complex.stats()
+        self.assertEqual(stats["open_tickets"], 3)
+        self.assertEqual(stats["occupied"], {"handicap": 1, "compact": 2, "large": 0})
+        self.assertEqual(stats["total_occupied"], 3)
+        self.assertEqual(stats["occupancy"], 3 / 220.0)
+        self.assertEqual(stats["levels"][0]["occupied"], {"handicap": 1, "compact": 1, "large": 0})
+        self.assertEqual(stats["levels"][1]["free"], {"handicap": 0, "compact": 39, "large": 40})
+
+        # counters match a full scan
+        for level in complex.levels:
+            scanned = [0, 0, 0]
+            for row in level.level_matrix:
+                for spot in row:
+                    if spot.filled:
+                        scanned[config_loader.SPACE_TYPE_CODES[spot.size_t]] += 1
+            self.assertEqual(level.occupied_counts, scanned)
+
+    def test_instrumentation(self):
+        print "\n\n\nTest: instrumentation"
+        print "*" * 145
+
+        histogram = instrumentation.Histogram()
+        for value in range(1, 10001):
+            histogram.record(value)
+        for percent in [50, 99, 99.9]:
+            exact = int(10000 * percent / 100)
+            self.assertEqual(abs(histogram.percentile(percent) - exact) <= exact // 64 + 1, True)
+        self.assertEqual(histogram.percentile(100), 10000)
+        self.assertEqual(instrumentation.Histogram().percentile(50), None)
+
+        park_unpark.init("none", instrument=True)
+        instruments = park_unpark.gate_instruments
+        complex = park_unpark.parking_complex
+        park_unpark.park('compact_car', True)
+        park_unpark.park('large_car', False)
+        park_unpark.unpark((1, 1, 1))
+        self.assertRaises(InvalidInputError, park_unpark.park, 'bus', False)
+        stats = instruments.to_dict()
+        self.assertEqual(stats["check_park_input"]["count"], 3)
+        self.assertEqual(stats["park_customer"]["count"], 2)
+        self.assertEqual(stats["update_matrixs"]["count"], 3)
+        self.assertEqual(stats["render"]["count"], 3)
+        self.assertEqual(stats["resource_lock.wait"]["count"], stats["resource_lock.hold"]["count"])
+        self.assertEqual(stats["resource_lock.hold"]["count"] >= 3, True)
+        # the level and size locks park and unpark run under are timed too, nested acquires once
+        self.assertEqual(stats["level_lock.wait"]["count"], stats["level_lock.hold"]["count"])
+        self.assertEqual(stats["level_lock.hold"]["count"], 3)
+        self.assertEqual(stats["size_lock.hold"]["count"] >= 3, True)
+        self.assertEqual(json.loads(instruments.to_json())["unpark_customer"]["count"], 1)
+        self.assertEqual(instruments.to_text().splitlines()[0].split()[:3], ["stage", "(us)", "count"])
+
+        instruments.uninstall()
+        self.assertEqual("update_matrixs" in complex.__dict__, False)
+        self.assertEqual(isinstance(complex.level_locks[0], instrumentation.TimedLock), False)
+        park_unpark.park('compact_car', True)
+        self.assertEqual(instruments.to_dict()["park_customer"]["count"], 2)
+        park_unpark.init("none")
+        self.assertEqual(park_unpark.gate_instruments, None)
+
+    def test_walking_graph(self):
+        print "\n\n\nTest: walking graph"
+        print "*" * 145
+
+        config_dir = tempfile.mkdtemp()
+        path = os.path.join(config_dir, "ramps.cfg")
+        with open(path, "w") as config:
+            config.write("Ramps,3\n3,4\nrows 1-3: compact\n3,4\nrows 1-3: compact\n1,4\nrow 1: large\n"
+                         "entrance west: gate\nentrance east: 2/3\n"
+                         "path gate -> 1/1: 1\npath 1/1 <-> 1/2: 2\npath 1/2 <-> 1/3: 2\n"
+                         "path 1/3 <-> 2/3: 5\npath 2/3 <-> 2/2: 2\npath 2/2 <-> 2/1: 2\n")
+        try:
+            layout = config_loader.load_layout(path)
+            self.assertEqual(list(layout.graph.entrances), ["west", "east"])
+            complex = ParkingComplex(path, "none")
+            self.assertEqual(complex.row_distances["west"][(2, 3)], 10)
+            self.assertEqual(complex.row_distances["east"][(1, 1)], 9)
+            # one-way: the gate is not reachable from east, level 3 is reachable from neither
+            self.assertEqual(complex.spot_distance("east", (3, 1, 2)), walking.UNREACHABLE + 3 + 1 + 2)
+
+            self.assertEqual(complex.park_customer("compact_car", False), (1, 1, 1))
+            self.assertEqual(complex.park_customer("compact_car", False, "east"), (2, 3, 1))
+            self.assertEqual(complex.park_customer("compact_car", False, "east"), (2, 3, 2))
+            self.assertEqual(complex.park_customer("large_car", False, "east"), (3, 1, 1))
+            # a spot returned to the complex is ranked at every entrance again
+            complex.unpark_customer((2, 3, 1))
+            self.assertEqual(complex.park_customer("compact_car", False, "east"), (2, 3, 1))
+            complex.unpark_customer((1, 1, 1))
+            self.assertEqual(complex.park_customer("compact_car", False, "west"), (1, 1, 1))
+            self.assertEqual(complex.check_park_input("compact_car", False, "north")[0], True)
+            self.assertEqual(complex.park_customers([("compact_car", False, "east"), ("compact_car", False)]),
+                             [(2, 2, 1), (1, 1, 2)])
+
+            # churn through one entrance keeps one live entry per spot in the other entrance's heap
+            churned = ParkingComplex(path, "none")
+            east = churned.entrance_spots["east"]["compact"]
+            for n in range(0, 5000):
+                churned.unpark_customer(churned.park_customer("compact_car", False, "west"))
+                self.assertEqual(len(east.heap) <= 2 * len(east) + 64, True)
+            east.compact()
+            self.assertEqual(len(east.heap), len(east))
+            self.assertEqual(churned.park_customer("compact_car", False, "east"), (2, 3, 1))
+
+            # the graph is kept by the compact and binary formats
+            for write, name in [(config_loader.write_compact_layout, "copy.cfg"),
+                                (config_loader.write_binary_layout, "copy.pcx")]:
+                copy_path = os.path.join(config_dir, name)
+                write(layout, copy_path)
+                copy = ParkingComplex(copy_path, "none")
+                self.assertEqual(copy.row_distances, ParkingComplex(path, "none").row_distances)
+                self.assertEqual(copy.park_customer("compact_car", False, "east"), (2, 3, 1))
+        finally:
+            shutil.rmtree(config_dir)
+
+        # configs without a graph keep the level + row + space distance
+        park_unpark.init("none")
+        self.assertEqual(park_unpark.parking_complex.entrances, [walking.DEFAULT_ENTRANCE])
+        self.assertEqual(park_unpark.park('compact_car', False, entrance="main"), (2, 1, 1))
+        self.assertRaises(InvalidInputError, park_unpark.park, 'compact_car', False, None, "north")
+
+    def test_reservations(self):
+        print "\n\n\nTest: reservations"
+        print "*" * 145
+
+        park_unpark.init("none")
+        complex = park_unpark.parking_complex
+        now = [complex.reservations.clock()]
+        complex.reservations.clock = lambda: now[0]
+
+        reservation_id = park_unpark.reserve('compact_car', True, 60)
+        self.assertEqual(complex.best_spots[0].location, (1, 1, 2))
+        self.assertEqual(park_unpark.park('compact_car', True), (1, 1, 2))
+        self.assertEqual(complex.stats()["held"], 1)
+        self.assertEqual(park_unpark.claim(reservation_id), (1, 1, 1))
+        self.assertEqual(complex.open_tickets[(1, 1, 1)].customer, Customer('compact_car', True))
+        self.assertEqual(park_unpark.claim(reservation_id), None)
+
+        reservation_id = park_unpark.reserve('large_car', False, 30)
+        self.assertEqual(park_unpark.cancel(reservation_id), True)
+        self.assertEqual(park_unpark.cancel(reservation_id), False)
+        self.assertEqual(park_unpark.park('large_car', False), (2, 5, 1))
+
+        # an expired hold is given back by the next park
+        reservation_id = park_unpark.reserve('large_car', False, 30)
+        now[0] += 29
+        self.assertEqual(park_unpark.park('large_car', False), (2, 6, 1))
+        now[0] += 2
+        self.assertEqual(park_unpark.park('large_car', False), (2, 5, 2))
+        self.assertEqual(park_unpark.claim(reservation_id), None)
+        self.assertEqual(complex.stats()["held"], 0)
+
+        self.assertRaises(InvalidInputError, park_unpark.reserve, 'compact_car', False, 0)
+        self.assertRaises(InvalidInputError, park_unpark.claim, "1")
+
+        # the wheel fires each timer once its tick has passed, holds beyond one round wait in their slot
+        wheel = reservations.TimerWheel(0.0, tick=1.0, slots=64)
+        dues = dict((n, wheel.schedule(n, n * 0.37)) for n in range(1, 1001))
+        wheel.cancel(500, dues[500])
+        fired = wheel.advance(100.0) + wheel.advance(100.5)
+        self.assertEqual(sorted(fired), [n for n in range(1, 271) if n * 0.37 <= 100.0])
+        fired = wheel.advance(1000.0)
+        self.assertEqual(sorted(fired), [n for n in range(271, 1001) if n != 500])
+
+    def test_templates(self):
+        print "\n\n\nTest: templates"
+        print "*" * 145
+
+        park_unpark.init("none")
+        template = park_unpark.parking_complex.template
+        park_unpark.init("none")
+        complex = park_unpark.parking_complex
+        self.assertIs(complex.template, template)
+
+        self.assertEqual(park_unpark.park('compact_car', True), (1, 1, 1))
+        self.assertEqual(park_unpark.park('large_car', False), (2, 5, 1))
+        reservation_id = park_unpark.reserve('large_car', False, 60)
+        park_unpark.reset()
+        self.assertEqual(complex.stats()["total_occupied"], 0)
+        self.assertEqual(complex.stats()["held"], 0)
+        self.assertEqual(park_unpark.claim(reservation_id), None)
+        self.assertEqual(park_unpark.park('large_car', False), (2, 5, 1))
+        self.assertEqual(complex.open_tickets[(2, 5, 1)].id, 3)
+        self.assertEqual(sum(len(index) for index in complex.free_spots.values()), 219)
+
+        # ticket ids continue across a reset, the ticket log never sees an id twice
+        fd, log_path = tempfile.mkstemp(suffix=".log")
+        os.close(fd)
+        os.remove(log_path)
+        try:
+            park_unpark.init("none", ticket_log_path=log_path)
+            park_unpark.unpark(park_unpark.park('large_car', False))
+            park_unpark.park('compact_car', False)
+            park_unpark.reset()
+            park_unpark.unpark(park_unpark.park('large_car', False))
+            self.assertEqual(len(park_unpark.parking_complex.tickets), 3)
+            park_unpark.parking_complex.flush()
+            self.assertEqual([record.id for record in ticket_log.read_ticket_log(log_path)], [1, 3])
+        finally:
+            park_unpark.init("none")
+            if os.path.exists(log_path):
+                os.remove(log_path)
+
+        config_dir = tempfile.mkdtemp()
+        config_path = os.path.join(config_dir, "garage.cfg")
+        cache_path = os.path.join(config_dir, "garage.pcx")
+        try:
+            with open(config_path, "w") as config:
+                config.write("Before,1\n2,3\nrows 1-2: compact\nentrance a: 1/2\nentrance b: 1/1\n")
+            park_unpark.init("none", config_path=config_path, layout_cache_path=cache_path)
+            self.assertAlmostEqual(os.path.getmtime(cache_path), os.path.getmtime(config_path), 3)
+            cached = os.path.getmtime(cache_path)
+            TEMPLATES.clear()
+            park_unpark.init("none", config_path=config_path, layout_cache_path=cache_path)
+            self.assertEqual(os.path.getmtime(cache_path), cached)
+            self.assertEqual(park_unpark.park('compact_car', False, entrance="a"), (1, 2, 1))
+            park_unpark.reset()
+            self.assertEqual(park_unpark.park('compact_car', False, entrance="b"), (1, 1, 1))
+            self.assertEqual(park_unpark.park('compact_car', False, entrance="a"), (1, 2, 1))
+
+            # an edited config is parsed again and its cache rewritten
+            with open(config_path, "w") as config:
+                config.write("After,1\n2,3\nrows 1-2: large\n")
+            os.utime(config_path, (1000000000, 1000000000))
+            park_unpark.init("none", config_path=config_path, layout_cache_path=cache_path)
+            self.assertEqual(park_unpark.parking_complex.name, "After")
+            self.assertEqual(config_loader.load_layout(cache_path).name, "After")
+            self.assertEqual(os.path.getmtime(cache_path), 1000000000)
+        finally:
+            park_unpark.init("none")
+            shutil.rmtree(config_dir)
+
+    def test_analytics(self):
+        print "\n\n\nTest: analytics"
+        print "*" * 145
+
+        park_unpark.init("none")
+        complex = park_unpark.parking_complex
+        now = [36000.0]
+        stream = analytics.Analytics(bucket_seconds=3600, buckets=3, clock=lambda: now[0])
+        stream.attach(complex)
+        park_unpark.park('compact_car', True)
+        park_unpark.park('large_car', False)
+        now[0] += 1800
+        complex.open_tickets[(2, 5, 1)].start_t -= datetime.timedelta(seconds=3700)
+        charge = park_unpark.unpark((2, 5, 1))
+
+        self.assertEqual(stream.occupancy(), [{"start": 36000.0, "mean": 2.0, "peak": 2, "arrivals": 2, "departures": 1}])
+        self.assertEqual(stream.occupancy(level=2)[0]["mean"], 1.0)
+        dwell = stream.summary("dwell", "large")
+        self.assertEqual((dwell["count"], dwell["max"]), (1, 3700))
+        self.assertTrue(abs(dwell["p50"] - 3700) <= 3700 / 64)
+        self.assertEqual(stream.summary("dwell", "compact")["count"], 0)
+        self.assertEqual(stream.summary("charge", level=2)["max"], ticket_log.to_cents(charge))
+        self.assertEqual(stream.by_size("charge")["large"]["count"], 1)
+        self.assertRaises(ValueError, stream.summary, "speed")
+
+        # skipped hours are filled in, only the last 3 windows are kept
+        now[0] += 7200
+        self.assertEqual([(window["start"], window["mean"]) for window in stream.occupancy()],
+                         [(36000.0, 1.5), (39600.0, 1.0), (43200.0, 1.0)])
+        self.assertEqual(stream.revenue(), [(36000.0, ticket_log.to_cents(charge)), (39600.0, 0), (43200.0, 0)])
+        now[0] += 36000
+        self.assertEqual(len(stream.windows), 3)
+        self.assertEqual(stream.summary("dwell")["count"], 0)
+        self.assertEqual(stream.occupancy()[-1]["mean"], 1.0)
+
+        park_unpark.init("none", analytics=True)
+        park_unpark.park('large_car', False)
+        self.assertEqual(park_unpark.gate_analytics.occupied[1], 1)
+        park_unpark.reset()
+        self.assertEqual(park_unpark.gate_analytics.occupied, [0, 0, 0])
+
+    def test_import_order(self):
+        print "\n\n\nTest: import order"
+        print "*" * 145
+
+        # each module imports cleanly as the first import of a fresh interpreter
+        for module in ["billing", "tariff", "registry"]:
+            script = ("import {}\nimport park_unpark\npark_unpark.init('none')\n"
+                      "print park_unpark.unpark(park_unpark.park('large_car', False))\n").format(module)
+            child = subprocess.Popen([sys.executable, "-c", script], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            output, errors = child.communicate()
+            self.assertEqual((module, child.returncode, errors), (module, 0, ""))
+            self.assertEqual(output, "7.5\n")
+
     def test_spot_availble(self):
         print "\n\n\nTest: spot available"
         print "*" * 145
@@ -131,6 +996,28 @@ class Tests(unittest.TestCase):
                       park_unpark.parking_complex.best_spots[2].location.space)
         self.assertEqual(best_large_t, (2, 8, 2))
 
+    def test_free_spot_index(self):
+        print "\n\n\nTest: free spot index"
+        print "*" * 145
+
+        # unparked spot becomes the best spot again
+        park_unpark.init()
+        first = park_unpark.park('compact_car', True)
+        second = park_unpark.park('compact_car', True)
+        park_unpark.unpark(first)
+        self.assertEqual(park_unpark.parking_complex.handicap_spots.peek(), first)
+        self.assertEqual(park_unpark.park('compact_car', True), first)
+        self.assertEqual(len(park_unpark.parking_complex.handicap_spots), 18)
+
+        # ties broken by level, row, space
+        index = FreeSpotIndex()
+        index.add((1, 2, 1), 4)
+        index.add((1, 1, 2), 4)
+        index.discard((1, 1, 2))
+        self.assertEqual(index.pop(), (1, 2, 1))
+        self.assertEqual(index.is_empty(), True)
+        self.assertEqual(index.pop(), None)
+
     def test_valid_rate_chargeing(self):
         print "\n\n\nTest: valid rate chargeing"
         print "*" * 145
@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+"""
+analytics module:
+  Streaming occupancy, dwell time and revenue aggregates of a ParkingComplex over rolling windows
+
+  Notes: an Analytics instance is a complex listener, every park and unpark updates the aggregates of
+         the current window in O(1) inside the level lock and no ticket is kept. Windows are
+         bucket_seconds long and only the last `buckets` of them are kept, dwell times and charges
+         go to log-linear histograms (instrumentation.Histogram) per level and spot size type, so
+         memory stays bounded however many tickets are closed. Queries merge the kept windows and
+         never read ticket history.
+
+"""
+from collections import deque
+import threading
+import time
+
+from config_loader import SPACE_TYPES, SPACE_TYPE_CODES
+from instrumentation import Histogram
+from ticket_log import to_cents
+
+#seconds per window and number of windows kept by default, 24 hourly windows
+BUCKET_SECONDS = 3600
+BUCKETS = 24
+#metrics kept per level and spot size type
+METRICS = ("dwell", "charge")
+
+
+class Window():
+    """
+    Defines a Window instance, the aggregates of one bucket_seconds long window
+
+    Args:
+        start(float): time the window starts at
+        occupied(list): spots filled on each level when the window starts
+
+    Attributes:
+        start(float): time the window starts at
+        arrivals(list): parks on each level
+        departures(list): unparks on each level
+        peak(list): most spots filled at once on each level
+        occupied_seconds(list): spots filled times seconds on each level, integrated up to integrated_to
+        integrated_to(list): time each level's occupied_seconds is integrated up to
+        revenue_cents(int): charges of the unparks
+        cells(dict): maps (level, size type) to a {"dwell": Histogram of seconds, "charge": Histogram of cents}
+    """
+    def __init__(self, start, occupied):
+        self.start = start
+        self.arrivals = [0] * len(occupied)
+        self.departures = [0] * len(occupied)
+        self.peak = list(occupied)
+        self.occupied_seconds = [0.0] * len(occupied)
+        self.integrated_to = [start] * len(occupied)
+        self.revenue_cents = 0
+        self.cells = {}
+
+    def integrate(self, level, occupied, now):
+        """
+        Utility function to add the occupancy of a level from its last integration up to now, O(1)
+
+        Args:
+            level(int): level index, starts at 0
+            occupied(int): spots filled on the level since its last integration
+            now(float): time to integrate up to
+        """
+        self.occupied_seconds[level] += occupied * (now - self.integrated_to[level])
+        self.integrated_to[level] = now
+
+    def cell(self, level, size_t):
+        """
+        Utility function to get the histograms of a level and spot size type, made on first use
+        """
+        cell = self.cells.get((level, size_t))
+        if cell is None:
+            cell = self.cells[(level, size_t)] = dict((metric, Histogram()) for metric in METRICS)
+        return cell
+
+
+class Analytics():
+    """
+    Defines an Analytics instance, the rolling window aggregates of one ParkingComplex
+
+    Args:
+        bucket_seconds(int): seconds per window
+        buckets(int): number of windows kept, the current one included
+        clock(function): returns the current time in seconds, default is time.time
+
+    Attributes:
+        bucket_seconds(int): seconds per window
+        clock(function): returns the current time in seconds
+        windows(deque): the kept Window objects, oldest first, the last is the current window
+        occupied(list): spots filled on each level now
+        complex(ParkingComplex): complex being analysed, set by attach
+        lock(threading.Lock): locking the windows and counters
+    """
+    def __init__(self, bucket_seconds=BUCKET_SECONDS, buckets=BUCKETS, clock=time.time):
+        self.bucket_seconds = bucket_seconds
+        self.clock = clock
+        self.windows = deque(maxlen=buckets)
+        self.occupied = []
+        self.complex = None
+        self.lock = threading.Lock()
+
+    def attach(self, complex):
+        """
+        Utility function to start analysing every transaction of complex from its current occupancy
+
+        Args:
+            complex(ParkingComplex): complex to analyse
+        """
+        self.complex = complex
+        with complex.all_locks():
+            self.on_reset(complex)
+            complex.add_listener(self)
+
+    def detach(self):
+        """
+        Utility function to stop analysing self.complex, the windows are kept for queries
+        """
+        if self.complex is not None and self in self.complex.listeners:
+            self.complex.remove_listener(self)
+
+    def on_reset(self, complex):
+        """
+        Utility function to restart the occupancy counters from the complex, called by ParkingComplex.reset
+        """
+        with self.lock:
+            self.occupied = [sum(level.occupied_counts) for level in complex.levels]
+            self.windows.clear()
+            self.current_window(self.clock())
+
+    def current_window(self, now):
+        """
+        Utility function to get the window now falls in, starting new windows as time passes,
+        O(1) amortized, the caller must hold self.lock
+
+        Args:
+            now(float): current time
+        """
+        start = now - now % self.bucket_seconds
+        if self.windows and self.windows[-1].start == start:
+            return self.windows[-1]
+        if self.windows:
+            last = self.windows[-1]
+            end = last.start + self.bucket_seconds
+            for level, occupied in enumerate(self.occupied):
+                last.integrate(level, occupied, min(end, now))
+            first = max(end, start - (self.windows.maxlen - 1) * self.bucket_seconds)
+        else:
+            first = start
+        while first <= start:
+            window = Window(first, self.occupied)
+            if first < start:
+                for level, occupied in enumerate(self.occupied):
+                    window.integrate(level, occupied, first + self.bucket_seconds)
+            self.windows.append(window)
+            first += self.bucket_seconds
+        return self.windows[-1]
+
+    def on_transaction(self, complex, ticket, parking):
+        """
+        Utility function to add a park or unpark to the current window, O(1)
+
+        Args:
+            complex(ParkingComplex): complex of the transaction
+            ticket(Ticket): ticket of the transaction
+            parking(bool): boolean of customer parking versus unparking
+        """
+        level = ticket.p_spot.location.level - 1
+        with self.lock:
+            now = self.clock()
+            window = self.current_window(now)
+            window.integrate(level, self.occupied[level], now)
+            if parking:
+                self.occupied[level] += 1
+                window.arrivals[level] += 1
+                if self.occupied[level] > window.peak[level]:
+                    window.peak[level] = self.occupied[level]
+            else:
+                self.occupied[level] -= 1
+                window.departures[level] += 1
+                charge_cents = to_cents(ticket.charge)
+                window.revenue_cents += charge_cents
+                cell = window.cell(level + 1, ticket.p_spot.size_t)
+                cell["dwell"].record(int(ticket.delta_t))
+                cell["charge"].record(charge_cents)
+
+    def occupancy(self, level=None):
+        """
+        Utility function to get the occupancy curve of the kept windows
+
+        Args:
+            level(int): level number, default is the whole complex
+
+        Returns:
+            list: {"start": window start time, "mean": time weighted mean of filled spots, "peak": most
+                filled spots (summed over levels for the whole complex), "arrivals", "departures"} of each
+                window, oldest first
+        """
+        levels = range(0, len(self.occupied)) if level is None else [level - 1]
+        curve = []
+        with self.lock:
+            now = self.clock()
+            self.current_window(now)
+            for window in self.windows:
+                end = min(window.start + self.bucket_seconds, now)
+                occupied_seconds = 0.0
+                for n in levels:
+                    occupied_seconds += window.occupied_seconds[n]
+                    if window is self.windows[-1]:
+                        occupied_seconds += self.occupied[n] * (end - window.integrated_to[n])
+                elapsed = end - window.start
+                if elapsed <= 0:
+                    occupied_seconds, elapsed = float(sum(self.occupied[n] for n in levels)), 1
+                curve.append({"start": window.start,
+                              "mean": occupied_seconds / elapsed,
+                              "peak": sum(window.peak[n] for n in levels),
+                              "arrivals": sum(window.arrivals[n] for n in levels),
+                              "departures": sum(window.departures[n] for n in levels)})
+        return curve
+
+    def revenue(self):
+        """
+        Utility function to get the revenue of the kept windows
+
+        Returns:
+            list: (window start time, revenue in cents) of each window, oldest first
+        """
+        with self.lock:
+            self.current_window(self.clock())
+            return [(window.start, window.revenue_cents) for window in self.windows]
+
+    def summary(self, metric, size_t=None, level=None):
+        """
+        Utility function to merge the histograms of a metric over the kept windows
+
+        Args:
+            metric(str): "dwell" in seconds or "charge" in cents
+            size_t(str): spot size type, default is every size type
+            level(int): level number, default is every level
+
+        Returns:
+            dict: count, min, mean, max and approximate percentiles, see instrumentation.Histogram.summary
+        """
+        if metric not in METRICS:
+            raise ValueError("Unknown metric {}, one of {}".format(metric, ", ".join(METRICS)))
+        if size_t is not None and size_t not in SPACE_TYPE_CODES:
+            raise ValueError("Unknown space type: {}".format(size_t))
+        merged = Histogram()
+        with self.lock:
+            self.current_window(self.clock())
+            for window in self.windows:
+                for (cell_level, cell_size_t), cell in window.cells.items():
+                    if (level is None or cell_level == level) and (size_t is None or cell_size_t == size_t):
+                        merged.merge(cell[metric])
+        return merged.summary()
+
+    def by_size(self, metric):
+        """
+        Utility function to get summary(metric) of each spot size type
+
+        Returns:
+            dict: maps each size type to its summary
+        """
+        return dict((size_t, self.summary(metric, size_t)) for size_t in SPACE_TYPES)
@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+"""
+benchmarks package:
+  Stand alone benchmarks for the parking complex backend, run from the project root
+
+  e.g. python -m benchmarks.memory
+
+"""
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+memory benchmark:
+  Reports bytes per parking spot and per open ticket for the slotted classes in Classes
+  against the original per-instance __dict__ classes
+
+  to run:
+  python -m benchmarks.memory
+
+"""
+from __future__ import absolute_import
+
+import sys
+import datetime
+from types import NoneType
+
+import park_unpark
+from Classes import ParkingComplex, Location, ParkingSpot, Customer, Ticket
+from config_loader import GarageLayout, LevelLayout
+
+#values shared between objects, not counted towards an object's size
+SHARED_TYPES = (str, unicode, int, long, float, bool, NoneType, type)
+
+
+class LegacyLocation():
+    def __init__(self, level, row, space):
+        self.level = level
+        self.row = row
+        self.space = space
+
+
+class LegacyParkingSpot():
+    def __init__(self, size_t, location):
+        self.size_t = size_t
+        self.location = location
+        self.filled = False
+        self.distance_to_entrance = location.level + location.row + location.space
+
+
+class LegacyCustomer():
+    def __init__(self, size, handicapped):
+        self.size = size
+        self.handicapped = handicapped
+
+
+class LegacyTicket():
+    def __init__(self, p_spot, customer, id):
+        self.p_spot = p_spot
+        self.customer = customer
+        self.id = id
+        self.start_t = datetime.datetime.now()
+        self.end_t = None
+        self.delta_t = None
+        self.description = "COM"
+        self.charge = None
+
+
+def deep_sizeof(obj, seen=None):
+    """
+    Utility function to get the bytes held by an object and everything it owns
+
+    Args:
+        obj(object): object to measure
+        seen(set): ids of objects already counted
+    """
+    if seen is None:
+        seen = set()
+    if isinstance(obj, SHARED_TYPES) or id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in obj.iteritems():
+            size += deep_sizeof(key, seen) + deep_sizeof(value, seen)
+    elif isinstance(obj, (list, tuple, set)):
+        for item in obj:
+            size += deep_sizeof(item, seen)
+    if hasattr(obj, "__dict__") and not isinstance(obj, tuple):
+        size += deep_sizeof(obj.__dict__, seen)
+    for cls in getattr(type(obj), "__mro__", ()):
+        for name in cls.__dict__.get("__slots__", ()):
+            if hasattr(obj, name):
+                size += deep_sizeof(getattr(obj, name), seen)
+    return size
+
+
+def legacy_spot_bytes():
+    """
+    Utility function to get the bytes per spot of the original level matrix, one ParkingSpot and Location
+    per space plus the matrix slot and the deep copied ticket_map slot
+    """
+    spot = LegacyParkingSpot("compact", LegacyLocation(1, 1, 1))
+    return deep_sizeof(spot) + 2 * 8
+
+
+def legacy_ticket_bytes():
+    """
+    Utility function to get the bytes per open ticket of the original classes
+    """
+    spot = LegacyParkingSpot("compact", LegacyLocation(1, 1, 1))
+    return deep_sizeof(LegacyTicket(spot, LegacyCustomer("compact_car", False), 1))
+
+
+def current_spot_bytes(spots=100000):
+    """
+    Utility function to get the bytes per open spot of a ParkingComplex, the level bytearrays
+    plus the free spot index entries
+
+    Args:
+        spots(int): number of spots in the measured complex
+    """
+    levels = [LevelLayout(100, 100, bytearray([1]) * 10000) for n in range(0, spots // 10000)]
+    complex = ParkingComplex(None, "none", GarageLayout("Benchmark", levels))
+    total = deep_sizeof(complex.levels)
+    for index in complex.free_spots.values():
+        total += deep_sizeof(index.heap) + deep_sizeof(index.free)
+        total += sum(sys.getsizeof(entry) for entry in index.heap)
+        total += sum(sys.getsizeof(key) for key in index.free)
+    return float(total) / (len(levels) * 10000)
+
+
+def current_ticket_bytes():
+    """
+    Utility function to get the bytes per open ticket of the current classes
+    """
+    spot = ParkingSpot("compact", Location(1, 1, 1))
+    return deep_sizeof(Ticket(spot, Customer("compact_car", False), 1))
+
+
+def main():
+    print "bytes per spot:        before %8.1f   after %8.1f" % (legacy_spot_bytes(), current_spot_bytes())
+    print "bytes per open ticket: before %8.1f   after %8.1f" % (legacy_ticket_bytes(), current_ticket_bytes())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+sharding benchmark:
+  Reports park/unpark throughput of a sharding.ShardRouter on a synthetic 50 garage workload
+  for an increasing number of worker processes
+
+  to run:
+  python -m benchmarks.sharding [garages] [requests_per_garage]
+
+"""
+from __future__ import absolute_import
+
+import random
+import shutil
+import sys
+import tempfile
+import time
+import os
+
+from config_loader import GarageLayout, LevelLayout, write_binary_layout
+from sharding import ShardRouter
+
+
+def write_garages(config_dir, garages, levels=4, rows=10, spaces=25, seed=1):
+    """
+    Utility function to write synthetic binary garage configs
+
+    Args:
+        config_dir(str): directory to write to
+        garages(int): number of garages
+        levels(int): number of levels per garage
+        rows(int): number of rows per level
+        spaces(int): number of spaces per row
+        seed(int): random seed of the space type mix
+    """
+    rng = random.Random(seed)
+    for n in range(0, garages):
+        level_layouts = []
+        for level in range(0, levels):
+            handicap_rows = 1 if level == 0 else 0
+            large_rows = rng.randint(2, rows // 2)
+            codes = bytearray([0] * (handicap_rows * spaces) +
+                              [1] * ((rows - handicap_rows - large_rows) * spaces) +
+                              [2] * (large_rows * spaces))
+            level_layouts.append(LevelLayout(rows, spaces, codes))
+        write_binary_layout(GarageLayout("Garage%02d" % n, level_layouts), os.path.join(config_dir, "garage%02d.pcx" % n))
+
+
+def run_workload(router, garages, requests_per_garage, batch_per_garage=50, seed=2):
+    """
+    Utility function to replay a seeded park/unpark workload through a router
+
+    Returns:
+        tuple:(int:requests run,float:seconds)
+    """
+    rng = random.Random(seed)
+    parked = dict(("garage%02d" % n, []) for n in range(0, garages))
+    total = 0
+    start = time.time()
+    while total < garages * requests_per_garage:
+        requests = []
+        for complex_id, locations in parked.items():
+            for n in range(0, batch_per_garage):
+                if locations and rng.random() < 0.45:
+                    requests.append(("unpark", complex_id, (locations.pop(rng.randrange(len(locations))),)))
+                else:
+                    requests.append(("park", complex_id, (rng.choice(["compact_car", "large_car"]), rng.random() < 0.1)))
+        for request, result in zip(requests, router.run(requests)):
+            if request[0] == "park" and result is not None:
+                parked[request[1]].append(result)
+        total += len(requests)
+    return total, time.time() - start
+
+
+def main():
+    garages = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    requests_per_garage = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    config_dir = tempfile.mkdtemp()
+    try:
+        write_garages(config_dir, garages)
+        for workers in [1, 2, 4, 8]:
+            router = ShardRouter(config_dir, workers)
+            try:
+                total, seconds = run_workload(router, garages, requests_per_garage)
+            finally:
+                router.close()
+            print "workers %d: %8d requests %7.2fs %10.0f requests/s" % (workers, total, seconds, total / seconds)
+    finally:
+        shutil.rmtree(config_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+"""
+benchmark suite:
+  Replays seeded traffic models against generated garages through park_unpark and saves
+  throughput, per call latency percentiles, peak RSS and init() startup time as JSON
+
+  Every (garage, model) case runs in its own process so peak RSS and startup time are its own.
+  The same seed always generates the same garages and the same requests.
+
+  to run:
+  python -m benchmarks.suite [--sizes 200,1000,10000,100000] [--models rush,churn]
+                             [--requests 20000] [--seed 1] [--output results.json]
+  python -m benchmarks.suite --compare old.json new.json
+
+"""
+from __future__ import absolute_import
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import shutil
+import tempfile
+import time
+from timeit import default_timer as clock
+
+import park_unpark
+from config_loader import GarageLayout, LevelLayout, write_compact_layout
+from instrumentation import Histogram
+
+DEFAULT_SIZES = (200, 1000, 10000, 100000)
+#rows per level of generated garages
+LEVEL_ROWS = 40
+
+
+def generate_layout(spaces, seed):
+    """
+    Utility function to generate a garage of about the given number of spaces, one handicap row
+    on the first level, then compact and large rows mixed 60/40
+
+    Args:
+        spaces(int): number of spaces wanted
+        seed(int): random seed of the row mix
+
+    Returns:
+        GarageLayout
+    """
+    rng = random.Random(seed)
+    row_spaces = 20 if spaces <= 2000 else 50
+    total_rows = max(2, -(-spaces // row_spaces))
+    levels = max(1, -(-total_rows // LEVEL_ROWS))
+    rows = -(-total_rows // levels)
+    level_layouts = []
+    for level in range(0, levels):
+        codes = bytearray()
+        for row in range(0, rows):
+            if level == 0 and row == 0:
+                code = 0
+            else:
+                code = 1 if rng.random() < 0.6 else 2
+            codes.extend([code] * row_spaces)
+        level_layouts.append(LevelLayout(rows, row_spaces, codes))
+    return GarageLayout("Garage{}".format(spaces), level_layouts)
+
+
+def rush(rng, capacity, parked):
+    """
+    Morning rush: arrivals only, with an occasional early leaver
+    """
+    if parked and rng.random() < 0.05:
+        return "unpark"
+    return "park"
+
+
+def churn(rng, capacity, parked):
+    """
+    Steady churn: arrivals and departures keep the garage around 60% full
+    """
+    if parked > 0.6 * capacity:
+        return "unpark" if rng.random() < 0.7 else "park"
+    return "park" if rng.random() < 0.7 else ("unpark" if parked else "park")
+
+
+def thrash(rng, capacity, parked):
+    """
+    Full garage thrash: fill the garage, then keep it full, every departure is followed by arrivals
+    that include rejected ones
+    """
+    if parked >= capacity:
+        return "unpark" if rng.random() < 0.4 else "park"
+    return "park"
+
+
+def handicap(rng, capacity, parked):
+    """
+    Handicap heavy: the traffic of churn with 40% handicapped customers, see MODELS
+    """
+    return churn(rng, capacity, parked)
+
+
+#name: (next operation, share of handicapped customers, share of the garage filled before timing starts)
+MODELS = {"rush": (rush, 0.05, 0.0), "churn": (churn, 0.05, 0.6), "thrash": (thrash, 0.05, 1.0),
+          "handicap": (handicap, 0.4, 0.6)}
+
+
+def run_case(config_path, model, requests, seed):
+    """
+    Utility function to init park_unpark from a config then replay a traffic model through it
+
+    Args:
+        config_path(str): config file of the garage
+        model(str): name of a MODELS traffic model
+        requests(int): number of park/unpark calls
+        seed(int): random seed of the traffic
+
+    Returns:
+        dict: measurements of the case
+    """
+    next_operation, handicap_share, prefill = MODELS[model]
+    start = clock()
+    park_unpark.init("none", config_path=config_path)
+    init_seconds = clock() - start
+    capacity = park_unpark.parking_complex.stats()["total_capacity"]
+    rng = random.Random(seed)
+    latencies = {"park": Histogram(), "unpark": Histogram()}
+    parked = []
+    while len(parked) < int(prefill * capacity):
+        batch = [random_customer(rng, handicap_share) for n in range(0, min(1000, int(prefill * capacity) - len(parked)))]
+        locations = [location for location in park_unpark.park_many(batch) if location is not None]
+        if not locations:
+            break
+        parked.extend(locations)
+    rejected = 0
+    start = clock()
+    for n in xrange(0, requests):
+        operation = next_operation(rng, capacity, len(parked))
+        if operation == "park":
+            size, handicapped = random_customer(rng, handicap_share)
+            call_start = clock()
+            location = park_unpark.park(size, handicapped)
+            latencies["park"].record(int((clock() - call_start) * 1000000))
+            if location is None:
+                rejected += 1
+            else:
+                parked.append(location)
+        else:
+            index = rng.randrange(len(parked))
+            parked[index], parked[-1] = parked[-1], parked[index]
+            location = parked.pop()
+            call_start = clock()
+            park_unpark.unpark(location)
+            latencies["unpark"].record(int((clock() - call_start) * 1000000))
+    seconds = clock() - start
+    return {"spaces": capacity, "model": model, "requests": requests, "seed": seed,
+            "init_seconds": init_seconds, "seconds": seconds, "throughput": requests / seconds,
+            "prefilled": int(prefill * capacity), "rejected": rejected, "parked_at_end": len(parked),
+            "park_us": latencies["park"].summary(), "unpark_us": latencies["unpark"].summary(),
+            "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+
+
+def random_customer(rng, handicap_share):
+    """
+    Utility function to draw the (size, has_handicapped_placard) of an arriving customer, 35% large cars
+    """
+    return ("large_car" if rng.random() < 0.35 else "compact_car"), rng.random() < handicap_share
+
+
+def case_worker(connection, config_path, model, requests, seed):
+    """
+    Utility function run by each case process, sends back the result of run_case
+    """
+    connection.send(run_case(config_path, model, requests, seed))
+    connection.close()
+
+
+def run_suite(sizes, models, requests, seed):
+    """
+    Utility function to run every (garage size, traffic model) case, each in a fresh process
+
+    Returns:
+        dict: {"meta": run details, "results": measurements of each case}
+    """
+    config_dir = tempfile.mkdtemp()
+    results = []
+    try:
+        for spaces in sizes:
+            config_path = os.path.join(config_dir, "garage{}.cfg".format(spaces))
+            write_compact_layout(generate_layout(spaces, seed), config_path)
+            for model in models:
+                receiver, sender = multiprocessing.Pipe(False)
+                process = multiprocessing.Process(target=case_worker, args=(sender, config_path, model, requests, seed))
+                process.start()
+                result = receiver.recv()
+                process.join()
+                results.append(result)
+                print_result(result)
+    finally:
+        shutil.rmtree(config_dir)
+    meta = {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+            "platform": platform.platform(), "sizes": list(sizes), "models": list(models),
+            "requests": requests, "seed": seed}
+    return {"meta": meta, "results": results}
+
+
+def print_result(result):
+    print "%7d spaces %-9s init %6.3fs %9.0f calls/s  park p50/p99/p999 %4s/%5s/%6s us  " \
+          "unpark p50/p99/p999 %4s/%5s/%6s us  peak rss %7d kB" % (
+              result["spaces"], result["model"], result["init_seconds"], result["throughput"],
+              result["park_us"]["p50"], result["park_us"]["p99"], result["park_us"]["p999"],
+              result["unpark_us"]["p50"], result["unpark_us"]["p99"], result["unpark_us"]["p999"],
+              result["peak_rss_kb"])
+
+
+def compare(old_path, new_path):
+    """
+    Utility function to print the change of each case measured in both result files
+
+    Args:
+        old_path(str): results saved by an earlier run
+        new_path(str): results saved by a later run
+    """
+    with open(old_path) as old_file, open(new_path) as new_file:
+        old = dict(((r["spaces"], r["model"]), r) for r in json.load(old_file)["results"])
+        new = json.load(new_file)["results"]
+    for result in new:
+        before = old.get((result["spaces"], result["model"]))
+        if before is None:
+            continue
+        print "%7d spaces %-9s throughput %+6.1f%%  park p99 %+6.1f%%  unpark p99 %+6.1f%%  init %+6.1f%%  rss %+6.1f%%" % (
+            result["spaces"], result["model"],
+            change(before["throughput"], result["throughput"]),
+            change(before["park_us"]["p99"], result["park_us"]["p99"]),
+            change(before["unpark_us"]["p99"], result["unpark_us"]["p99"]),
+            change(before["init_seconds"], result["init_seconds"]),
+            change(before["peak_rss_kb"], result["peak_rss_kb"]))
+
+
+def change(before, after):
+    """
+    Utility function to get the percent change from before to after, 0 if either is missing
+    """
+    if not before or after is None:
+        return 0.0
+    return 100.0 * (after - before) / before
+
+
+def main():
+    parser = argparse.ArgumentParser(description="park_unpark benchmark suite")
+    parser.add_argument("--sizes", default=",".join(str(size) for size in DEFAULT_SIZES))
+    parser.add_argument("--models", default=",".join(sorted(MODELS)))
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    options = parser.parse_args()
+    if options.compare:
+        compare(*options.compare)
+        return
+    models = options.models.split(",")
+    for model in models:
+        if model not in MODELS:
+            parser.error("unknown model {}, one of {}".format(model, ", ".join(sorted(MODELS))))
+    report = run_suite([int(size) for size in options.sizes.split(",")], models, options.requests, options.seed)
+    with open(options.output, "w") as output:
+        json.dump(report, output, indent=2, sort_keys=True)
+    print "saved", options.output
+
+
+if __name__ == '__main__':
+    main()
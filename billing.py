@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+billing module:
+  Prices many closed tickets in one pass over column arrays, for end of day reconciliation
+
+  Notes: times are whole microseconds and charges are integer cents, so every result is exact.
+         Time columns are array("d"), a double holds every whole microsecond count below 2 ** 53
+         (about 285 years), array("q") does not exist in Python 2.
+         A charge is the rate times the number of started 15 minute intervals of the whole minutes
+         parked, at least one interval, rounded up to the penny. With the default rates the results
+         equal Ticket.set_charge.
+
+"""
+from array import array
+from decimal import Decimal
+from itertools import izip
+import operator
+
+from config_loader import SPACE_TYPES, SPACE_TYPE_CODES
+from ticket_log import EPOCH, read_ticket_log
+
+INTERVAL_MINUTES = 15
+MICROSECONDS_PER_MINUTE = 60 * 1000000
+#rate units per dollar, rates are kept in hundredths of a cent
+RATE_UNITS = 10000
+
+#dollars per interval, "handicapped" applies to every handicapped customer, the others to the spot
+#size type of everyone else (matching Ticket.set_charge a handicap spot is only discounted for handicapped customers)
+DEFAULT_RATES = {"handicapped": 5.00, "handicap": 7.50, "compact": 5.00, "large": 7.50}
+
+
+def to_microseconds(delta):
+    """
+    Utility function to convert a timedelta to integer microseconds exactly
+
+    Args:
+        delta(timedelta): duration to convert
+    """
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+def rate_table(rates=None):
+    """
+    Utility function to build the rate of each (spot size type code, handicapped) pair
+
+    Args:
+        rates(dict): dollars per interval overriding DEFAULT_RATES, see DEFAULT_RATES for keys
+
+    Returns:
+        list: rate units of spot size type code c and handicapped flag h at index c * 2 + h
+
+    Raises:
+        ValueError: a rate is not a whole number of hundredths of a cent
+    """
+    merged = dict(DEFAULT_RATES)
+    merged.update(rates or {})
+    units = {}
+    for name, dollars in merged.items():
+        value = Decimal(str(dollars)) * RATE_UNITS
+        if value != value.to_integral_value():
+            raise ValueError("Rate {} of {} is finer than a hundredth of a cent".format(dollars, name))
+        units[name] = int(value)
+    table = []
+    for size_t in SPACE_TYPES:
+        table.extend([units[size_t], units["handicapped"]])
+    return table
+
+
+def ticket_columns(tickets):
+    """
+    Utility function to turn closed tickets into billing columns
+
+    Args:
+        tickets(iterable): closed Ticket objects
+
+    Returns:
+        tuple: (start_us, end_us, size_codes, handicapped) arrays, see charge_cents
+    """
+    start_us, end_us, size_codes, handicapped = array("d"), array("d"), array("B"), array("B")
+    for ticket in tickets:
+        start_us.append(to_microseconds(ticket.start_t - EPOCH))
+        end_us.append(to_microseconds(ticket.end_t - EPOCH))
+        size_codes.append(SPACE_TYPE_CODES[ticket.p_spot.size_t])
+        handicapped.append(ticket.customer.handicapped)
+    return start_us, end_us, size_codes, handicapped
+
+
+def log_columns(file_path):
+    """
+    Utility function to read the records of a ticket log into billing columns
+
+    Args:
+        file_path(str): path to ticket log, see ticket_log.TicketLog
+
+    Returns:
+        tuple: (start_us, end_us, size_codes, handicapped) arrays, see charge_cents
+    """
+    start_us, end_us, size_codes, handicapped = array("d"), array("d"), array("B"), array("B")
+    for record in read_ticket_log(file_path):
+        start_us.append(to_microseconds(record.start_t - EPOCH))
+        end_us.append(to_microseconds(record.end_t - EPOCH))
+        size_codes.append(SPACE_TYPE_CODES[record.size_t])
+        handicapped.append(record.handicapped)
+    return start_us, end_us, size_codes, handicapped
+
+
+def charge_cents(start_us, end_us, size_codes, handicapped, rates=None, minimum_interval_seconds=None, tariff=None):
+    """
+    Utility function to price every ticket of the given columns in one pass
+
+    Args:
+        start_us(array): start time of each ticket in microseconds since ticket_log.EPOCH
+        end_us(array): end time of each ticket in microseconds since ticket_log.EPOCH
+        size_codes(array): config_loader.SPACE_TYPES code of the spot of each ticket
+        handicapped(array): 1 for each handicapped customer, 0 otherwise
+        rates(dict): dollars per interval overriding DEFAULT_RATES
+        minimum_interval_seconds(int): stays shorter than this are charged one interval,
+            default is park_unpark.MINIMUM_PARKING_INTERVAL_SECONDS
+        tariff(Tariff): price with this tariff instead, rates and minimum_interval_seconds are ignored
+
+    Returns:
+        array: charge of each ticket in cents
+    """
+    if tariff is not None:
+        return array("l", [tariff.price_cents(int(start), int(end), (code << 1) | flag)
+                           for start, end, code, flag in izip(start_us, end_us, size_codes, handicapped)])
+    if minimum_interval_seconds is None:
+        #imported on use, park_unpark imports this module through Classes and tariff
+        import park_unpark
+        minimum_interval_seconds = park_unpark.MINIMUM_PARKING_INTERVAL_SECONDS
+    minimum_us = minimum_interval_seconds * 1000000
+    table = rate_table(rates)
+    cents_units = RATE_UNITS // 100
+    deltas = map(int, map(operator.sub, end_us, start_us))
+    return array("l", [-(-table[(code << 1) | flag] *
+                         (1 if delta < minimum_us else -(-(delta // MICROSECONDS_PER_MINUTE) // INTERVAL_MINUTES))
+                         // cents_units)
+                       for delta, code, flag in izip(deltas, size_codes, handicapped)])
+
+
+def revenue_by_size(charges, size_codes):
+    """
+    Utility function to total charges by spot size type
+
+    Args:
+        charges(array): charge of each ticket in cents
+        size_codes(array): config_loader.SPACE_TYPES code of the spot of each ticket
+
+    Returns:
+        dict: maps each spot size type to (ticket count, revenue in cents)
+    """
+    counts = [0] * len(SPACE_TYPES)
+    totals = [0] * len(SPACE_TYPES)
+    for charge, code in izip(charges, size_codes):
+        counts[code] += 1
+        totals[code] += charge
+    return dict((size_t, (counts[code], totals[code])) for code, size_t in enumerate(SPACE_TYPES))
+
+
+def bill(columns, rates=None, tariff=None):
+    """
+    Utility/Delegation function to price billing columns and total their revenue
+
+    Args:
+        columns(tuple): (start_us, end_us, size_codes, handicapped) arrays, see ticket_columns and log_columns
+        rates(dict): dollars per interval overriding DEFAULT_RATES
+        tariff(Tariff): price with this tariff instead of rates
+
+    Returns:
+        tuple(array,dict): charge of each ticket in cents and the revenue of each spot size type, see revenue_by_size
+    """
+    charges = charge_cents(*columns, rates=rates, tariff=tariff)
+    return charges, revenue_by_size(charges, columns[2])
@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+"""
+config_loader module:
+  Loads parking complex layouts from config files
+
+  Notes: three formats are accepted, see readme.md for details
+    - text: one line per parking space (redwood.txt)
+    - compact text: run-length row lines, e.g. "rows 1-2: handicap" (redwood.cfg)
+    - binary: packed header plus one type code byte per space, memory-mapped on load
+  Text and compact text configs may end with the entrance and path lines of a walking.WalkingGraph,
+  binary configs keep the same lines as text after the type codes.
+
+"""
+import mmap
+import os
+import struct
+
+from walking import parse_graph_lines
+
+#space type of each type code
+SPACE_TYPES = ("handicap", "compact", "large")
+#type code of each space type
+SPACE_TYPE_CODES = dict((size_t, code) for code, size_t in enumerate(SPACE_TYPES))
+
+BINARY_MAGIC = "PCX1"
+#name length, number of levels
+BINARY_HEADER = struct.Struct("<HH")
+#rows, spaces
+BINARY_LEVEL = struct.Struct("<HH")
+#seconds two mtimes may differ by and be equal, os.utime keeps microseconds of a float mtime
+MTIME_RESOLUTION = 0.001
+
+
+class GarageLayout():
+    """
+    Defines a GarageLayout instance, the parsed contents of a config file
+
+    Args:
+        name(str): name of the parking complex
+        levels(list): contains a list of LevelLayout objects
+        graph(WalkingGraph): entrances and aisle/ramp paths, optional
+
+    Attributes:
+        name(str): name of the parking complex
+        levels(list): contains a list of LevelLayout objects
+        graph(WalkingGraph): entrances and aisle/ramp paths, or None for the level + row + space distance
+    """
+    def __init__(self, name, levels, graph=None):
+        self.name = name
+        self.levels = levels
+        self.graph = graph
+
+
+class LevelLayout():
+    """
+    Defines a LevelLayout instance inside of a GarageLayout class
+
+    Args:
+        rows(int): number of rows this level has
+        spaces(int): number of spaces in each row
+        type_codes(bytearray): type code of each space in row-major order
+
+    Attributes:
+        rows(int): number of rows this level has
+        spaces(int): number of spaces in each row
+        type_codes(bytearray): type code of each space in row-major order, see SPACE_TYPES
+    """
+    def __init__(self, rows, spaces, type_codes):
+        if len(type_codes) != rows * spaces:
+            raise ValueError("Level expects {} space types, {} given".format(rows * spaces, len(type_codes)))
+        self.rows = rows
+        self.spaces = spaces
+        self.type_codes = type_codes
+
+    def space_types(self):
+        """
+        Utility function to get the type of each space in row-major order
+
+        Returns:
+            list: space types, options:["handicap","compact","large"]
+        """
+        return [SPACE_TYPES[code] for code in self.type_codes]
+
+
+def encode_space_types(space_types):
+    """
+    Utility function to convert a list of space types into type codes
+
+    Args:
+        space_types(list): space types, options:["handicap","compact","large"]
+
+    Returns:
+        bytearray: type code of each space
+    """
+    try:
+        return bytearray(SPACE_TYPE_CODES[size_t] for size_t in space_types)
+    except KeyError as e:
+        raise ValueError("Unknown space type: {}".format(e.args[0]))
+
+
+def load_layout(file_path):
+    """
+    Utility function to load a GarageLayout from any accepted config format
+
+    Args:
+        file_path(str): path to config file
+
+    Returns:
+        GarageLayout: the parsed layout
+    """
+    with open(file_path, "rb") as config:
+        magic = config.read(len(BINARY_MAGIC))
+    if magic == BINARY_MAGIC:
+        return load_binary_layout(file_path)
+    return load_text_layout(file_path)
+
+
+def load_cached_layout(file_path, cache_path=None):
+    """
+    Utility function to load a GarageLayout through a binary copy of its config, the copy is given the
+    config's mtime and rewritten whenever the two differ
+
+    Args:
+        file_path(str): path to config file
+        cache_path(str): path of the binary copy, None loads file_path directly
+
+    Returns:
+        GarageLayout: the parsed layout
+    """
+    if cache_path is None:
+        return load_layout(file_path)
+    mtime = os.path.getmtime(file_path)
+    if os.path.exists(cache_path) and abs(os.path.getmtime(cache_path) - mtime) < MTIME_RESOLUTION:
+        return load_binary_layout(cache_path)
+    layout = load_layout(file_path)
+    write_binary_layout(layout, cache_path + ".tmp")
+    os.utime(cache_path + ".tmp", (mtime, mtime))
+    os.rename(cache_path + ".tmp", cache_path)
+    return layout
+
+
+def load_text_layout(file_path):
+    """
+    Utility function to load a GarageLayout from a text or compact text config
+
+    Each level line "rows,spaces" is followed either by rows * spaces space type lines, or by
+    row lines covering every row of the level:
+        rows 1-2: handicap
+        row 3: handicap*4, compact*6
+
+    Lines after the last level are the walking graph, see walking.parse_graph_lines
+
+    Args:
+        file_path(str): path to config file
+
+    Returns:
+        GarageLayout: the parsed layout
+    """
+    with open(file_path) as config:
+        lines = [line.strip() for line in config]
+    lines = [line for line in lines if line and not line.startswith("#")]
+    name_levels_tup = lines[0].split(",")
+    name = name_levels_tup[0].strip()
+    num_levels = int(name_levels_tup[1])
+    levels = []
+    index = 1
+    for n in range(0, num_levels):
+        row_space_tuple = lines[index].split(",")
+        rows = int(row_space_tuple[0])
+        spaces = int(row_space_tuple[1])
+        index += 1
+        if index < len(lines) and lines[index].startswith("row"):
+            type_codes, index = parse_row_lines(lines, index, rows, spaces)
+        else:
+            type_codes = encode_space_types(lines[index:index + rows * spaces])
+            index += rows * spaces
+        levels.append(LevelLayout(rows, spaces, type_codes))
+    return GarageLayout(name, levels, parse_graph_lines(lines[index:]))
+
+
+def parse_row_lines(lines, index, rows, spaces):
+    """
+    Utility function to parse the run-length row lines of one level
+
+    Args:
+        lines(list): stripped config lines
+        index(int): index of the first row line of the level
+        rows(int): number of rows the level has
+        spaces(int): number of spaces in each row
+
+    Returns:
+        tuple:(bytearray:type codes of the level,int:index of the line after the level)
+
+    Raises:
+        ValueError: a row line is malformed, overlaps another or is out of range, or the level's
+            row lines end before every row is covered
+    """
+    type_codes = bytearray(rows * spaces)
+    covered = set()
+    while len(covered) < rows:
+        if index >= len(lines) or not lines[index].startswith("row"):
+            missing = [row for row in range(1, rows + 1) if row not in covered]
+            raise ValueError("Level row lines cover {} of {} rows, row {} is missing".format(len(covered), rows,
+                                                                                           missing[0]))
+        row_range, row_types = lines[index].split(":", 1)
+        row_range = row_range.split(None, 1)[1].split("-")
+        first_row = int(row_range[0])
+        last_row = int(row_range[-1])
+        if not 1 <= first_row <= last_row <= rows:
+            raise ValueError("Row line '{}' is out of the level's rows 1-{}".format(lines[index], rows))
+        for row in range(first_row, last_row + 1):
+            if row in covered:
+                raise ValueError("Row line '{}' overlaps row {} of an earlier line".format(lines[index], row))
+            covered.add(row)
+        row_codes = bytearray()
+        for run in row_types.split(","):
+            run = run.split("*")
+            count = int(run[1]) if len(run) > 1 else spaces
+            row_codes += encode_space_types([run[0].strip()]) * count
+        if len(row_codes) != spaces:
+            raise ValueError("Row line '{}' has {} spaces, expected {}".format(lines[index], len(row_codes), spaces))
+        for row in range(first_row, last_row + 1):
+            type_codes[(row - 1) * spaces:row * spaces] = row_codes
+        index += 1
+    return type_codes, index
+
+
+def load_binary_layout(file_path):
+    """
+    Utility function to load a GarageLayout from a binary config, the file is memory-mapped
+    and each level's type codes are sliced from the map in one copy
+
+    Args:
+        file_path(str): path to binary config file
+
+    Returns:
+        GarageLayout: the parsed layout
+    """
+    with open(file_path, "rb") as config:
+        data = mmap.mmap(config.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        offset = len(BINARY_MAGIC)
+        name_length, num_levels = BINARY_HEADER.unpack_from(data, offset)
+        offset += BINARY_HEADER.size
+        name = data[offset:offset + name_length].decode("utf-8")
+        offset += name_length
+        dimensions = []
+        for n in range(0, num_levels):
+            dimensions.append(BINARY_LEVEL.unpack_from(data, offset))
+            offset += BINARY_LEVEL.size
+        levels = []
+        for rows, spaces in dimensions:
+            type_codes = bytearray(data[offset:offset + rows * spaces])
+            offset += rows * spaces
+            levels.append(LevelLayout(rows, spaces, type_codes))
+        graph_lines = [line.strip() for line in data[offset:].splitlines() if line.strip()]
+    finally:
+        data.close()
+    return GarageLayout(str(name), levels, parse_graph_lines(graph_lines))
+
+
+def write_binary_layout(layout, file_path):
+    """
+    Utility function to write a GarageLayout as a binary config
+
+    Args:
+        layout(GarageLayout): layout to write
+        file_path(str): path to write to
+    """
+    name = layout.name.encode("utf-8")
+    with open(file_path, "wb") as config:
+        config.write(BINARY_MAGIC)
+        config.write(BINARY_HEADER.pack(len(name), len(layout.levels)))
+        config.write(name)
+        for level in layout.levels:
+            config.write(BINARY_LEVEL.pack(level.rows, level.spaces))
+        for level in layout.levels:
+            config.write(level.type_codes)
+        if layout.graph is not None:
+            config.write("\n".join(layout.graph.lines) + "\n")
+
+
+def write_compact_layout(layout, file_path):
+    """
+    Utility function to write a GarageLayout as a compact text config, consecutive identical rows
+    are merged into one "rows a-b:" line
+
+    Args:
+        layout(GarageLayout): layout to write
+        file_path(str): path to write to
+    """
+    lines = ["{},{}".format(layout.name, len(layout.levels))]
+    for level in layout.levels:
+        lines.append("{},{}".format(level.rows, level.spaces))
+        rows = [level.type_codes[i * level.spaces:(i + 1) * level.spaces] for i in range(0, level.rows)]
+        first_row = 0
+        for i in range(1, level.rows + 1):
+            if i < level.rows and rows[i] == rows[first_row]:
+                continue
+            lines.append("rows {}-{}: {}".format(first_row + 1, i, format_row_runs(rows[first_row])))
+            first_row = i
+    if layout.graph is not None:
+        lines.extend(layout.graph.lines)
+    with open(file_path, "w") as config:
+        config.write("\n".join(lines) + "\n")
+
+
+def format_row_runs(row_codes):
+    """
+    Utility function to format the type codes of one row as compact text runs
+
+    Args:
+        row_codes(bytearray): type codes of the row
+
+    Returns:
+        str: e.g. "handicap" or "handicap*4, compact*6"
+    """
+    runs = []
+    for code in row_codes:
+        if runs and runs[-1][0] == code:
+            runs[-1][1] += 1
+        else:
+            runs.append([code, 1])
+    if len(runs) == 1:
+        return SPACE_TYPES[runs[0][0]]
+    return ", ".join("{}*{}".format(SPACE_TYPES[code], count) for code, count in runs)
@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+"""
+instrumentation module:
+  Optional timing of the park/unpark stages of a ParkingComplex with HDR style latency histograms
+
+  Notes: instrumenting a complex shadows its stage methods with timed wrappers on the instance and
+         swaps its resource_lock, level locks and size locks for TimedLocks, uninstalling removes them
+         again. The level and size locks of a kind share one pair of wait and hold histograms. A complex that was
+         never instrumented runs the plain methods, so disabled instrumentation costs nothing.
+         Install and uninstall while no transaction is running.
+
+"""
+import json
+import threading
+from timeit import default_timer as clock
+
+#complex methods timed as stages, in the order park and unpark reach them
+STAGES = ("check_park_input", "check_unpark_input", "park_customer", "unpark_customer", "park_customers",
+          "unpark_customers", "reserve_spot", "update_matrixs", "update_best_spots")
+#renderer methods timed as stages
+RENDER_STAGES = ("snapshot", "render")
+#complex locks timed, each reported as "<lock>.wait" and "<lock>.hold"
+LOCKS = ("resource_lock", "level_lock", "size_lock")
+#percentiles reported by dumps
+PERCENTILES = (50, 90, 99, 99.9)
+
+#sub-bucket bits of a Histogram, values are kept within 1 / 2 ** (SUB_BUCKET_BITS - 1) of their true value
+SUB_BUCKET_BITS = 7
+
+
+class Histogram():
+    """
+    Defines a Histogram instance, a log-linear (HDR style) histogram of integer values
+
+    Values below 2 ** SUB_BUCKET_BITS are counted exactly, larger values fall in buckets whose width
+    is under 1.6% of their value, so percentiles of microsecond latencies stay accurate from
+    microseconds to minutes with a few hundred buckets.
+
+    Attributes:
+        counts(dict): maps a bucket index to its count
+        count(int): number of values recorded
+        total(int): sum of values recorded
+        min(int): smallest value recorded, or None
+        max(int): largest value recorded, or None
+        lock(threading.Lock): locking access to the counts
+    """
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+        self.lock = threading.Lock()
+
+    def record(self, value):
+        """
+        Utility function to count a value
+
+        Args:
+            value(int): non-negative value
+        """
+        index = bucket_index(value)
+        with self.lock:
+            self.counts[index] = self.counts.get(index, 0) + 1
+            self.count += 1
+            self.total += value
+            if self.min is None or value < self.min:
+                self.min = value
+            if self.max is None or value > self.max:
+                self.max = value
+
+    def merge(self, other):
+        """
+        Utility function to add the counts of another histogram
+
+        Args:
+            other(Histogram): histogram to add, unchanged
+        """
+        with other.lock:
+            counts = dict(other.counts)
+            count, total, low, high = other.count, other.total, other.min, other.max
+        if not count:
+            return
+        with self.lock:
+            for index, bucket_count in counts.iteritems():
+                self.counts[index] = self.counts.get(index, 0) + bucket_count
+            self.count += count
+            self.total += total
+            if self.min is None or low < self.min:
+                self.min = low
+            if self.max is None or high > self.max:
+                self.max = high
+
+    def percentile(self, percent):
+        """
+        Utility function to get the value at a percentile, the highest value of its bucket
+
+        Args:
+            percent(float): percentile in [0, 100]
+
+        Returns:
+            int
+            or
+            None: nothing has been recorded
+        """
+        with self.lock:
+            if not self.count:
+                return None
+            rank = max(1, int(-(-self.count * percent // 100)))
+            seen = 0
+            for index in sorted(self.counts):
+                seen += self.counts[index]
+                if seen >= rank:
+                    return min(bucket_highest(index), self.max)
+            return self.max
+
+    def mean(self):
+        """
+        Utility function to get the mean value, or None if nothing has been recorded
+        """
+        return float(self.total) / self.count if self.count else None
+
+    def summary(self):
+        """
+        Utility function to get the count, min, mean, max and PERCENTILES of the histogram
+
+        Returns:
+            dict
+        """
+        summary = {"count": self.count, "min": self.min, "mean": self.mean(), "max": self.max}
+        for percent in PERCENTILES:
+            summary["p{}".format(percent).replace(".", "")] = self.percentile(percent)
+        return summary
+
+
+def bucket_index(value):
+    """
+    Utility function to get the Histogram bucket of a value
+    """
+    sub_buckets = 1 << SUB_BUCKET_BITS
+    if value < sub_buckets:
+        return value
+    shift = value.bit_length() - SUB_BUCKET_BITS
+    return sub_buckets + (shift - 1) * (sub_buckets >> 1) + (value >> shift) - (sub_buckets >> 1)
+
+
+def bucket_highest(index):
+    """
+    Utility function to get the highest value counted in a Histogram bucket
+    """
+    sub_buckets = 1 << SUB_BUCKET_BITS
+    if index < sub_buckets:
+        return index
+    shift, offset = divmod(index - sub_buckets, sub_buckets >> 1)
+    shift += 1
+    return (((sub_buckets >> 1) + offset + 1) << shift) - 1
+
+
+def timed(histogram, function):
+    """
+    Utility function to wrap function so each call records its microseconds in histogram
+    """
+    def timed_function(*args, **kwargs):
+        start = clock()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            histogram.record(int((clock() - start) * 1000000))
+    timed_function.__name__ = function.__name__
+    return timed_function
+
+
+class TimedLock():
+    """
+    Defines a TimedLock instance, a lock recording how long callers wait for it and hold it
+
+    A reentrant lock is timed from its outermost acquire to its outermost release, nested acquires
+    by the holder record nothing.
+
+    Args:
+        lock(threading.Lock): lock to wrap, or a threading.RLock
+        wait(Histogram): microseconds waited for each acquire
+        hold(Histogram): microseconds held for each release
+
+    Attributes:
+        lock(threading.Lock): wrapped lock
+        wait(Histogram): microseconds waited for each acquire
+        hold(Histogram): microseconds held for each release
+        acquired_at(float): clock() of the current holder's acquire
+        depth(int): acquires of the current holder not yet released
+    """
+    def __init__(self, lock, wait, hold):
+        self.lock = lock
+        self.wait = wait
+        self.hold = hold
+        self.acquired_at = None
+        self.depth = 0
+
+    def acquire(self, blocking=True):
+        start = clock()
+        acquired = self.lock.acquire(blocking)
+        if acquired:
+            self.depth += 1
+            if self.depth == 1:
+                self.acquired_at = clock()
+                self.wait.record(int((self.acquired_at - start) * 1000000))
+        return acquired
+
+    def release(self):
+        self.depth -= 1
+        if self.depth:
+            self.lock.release()
+            return
+        held = clock() - self.acquired_at
+        self.lock.release()
+        self.hold.record(int(held * 1000000))
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class Instrumentation():
+    """
+    Defines an Instrumentation instance, the stage timers and lock timers of one ParkingComplex
+
+    Args:
+        complex(ParkingComplex): complex to instrument, instrumented until uninstall()
+
+    Attributes:
+        complex(ParkingComplex): instrumented complex
+        stages(dict): maps a stage name to its Histogram of microseconds per call
+        resource_lock_wait(Histogram): microseconds waited for complex.resource_lock
+        resource_lock_hold(Histogram): microseconds complex.resource_lock was held
+        level_lock_wait(Histogram): microseconds waited for any of complex.level_locks
+        level_lock_hold(Histogram): microseconds any of complex.level_locks was held
+        size_lock_wait(Histogram): microseconds waited for any of complex.size_locks
+        size_lock_hold(Histogram): microseconds any of complex.size_locks was held
+        plain_lock(threading.Lock): the resource_lock replaced by a TimedLock
+        plain_level_locks(list): the level_locks replaced by TimedLocks
+        plain_size_locks(dict): the size_locks replaced by TimedLocks
+    """
+    def __init__(self, complex):
+        self.complex = complex
+        self.stages = {}
+        self.resource_lock_wait = Histogram()
+        self.resource_lock_hold = Histogram()
+        self.level_lock_wait = Histogram()
+        self.level_lock_hold = Histogram()
+        self.size_lock_wait = Histogram()
+        self.size_lock_hold = Histogram()
+        self.plain_lock = None
+        self.plain_level_locks = None
+        self.plain_size_locks = None
+        self.install()
+
+    def install(self):
+        """
+        Utility function to shadow the stage methods of self.complex with timed wrappers and swap
+        its locks for TimedLocks
+        """
+        self.stages = dict((stage, Histogram()) for stage in STAGES + RENDER_STAGES)
+        for stage in STAGES:
+            setattr(self.complex, stage, timed(self.stages[stage], getattr(self.complex, stage)))
+        for stage in RENDER_STAGES:
+            setattr(self.complex.renderer, stage, timed(self.stages[stage], getattr(self.complex.renderer, stage)))
+        self.plain_lock = self.complex.resource_lock
+        self.complex.resource_lock = TimedLock(self.plain_lock, self.resource_lock_wait, self.resource_lock_hold)
+        self.plain_level_locks = self.complex.level_locks
+        self.complex.level_locks = [TimedLock(lock, self.level_lock_wait, self.level_lock_hold)
+                                    for lock in self.plain_level_locks]
+        self.plain_size_locks = self.complex.size_locks
+        self.complex.size_locks = dict((size_t, TimedLock(lock, self.size_lock_wait, self.size_lock_hold))
+                                       for size_t, lock in self.plain_size_locks.items())
+
+    def uninstall(self):
+        """
+        Utility function to restore the plain methods and locks of self.complex
+        """
+        for stage in STAGES:
+            self.complex.__dict__.pop(stage, None)
+        for stage in RENDER_STAGES:
+            self.complex.renderer.__dict__.pop(stage, None)
+        self.complex.resource_lock = self.plain_lock
+        self.complex.level_locks = self.plain_level_locks
+        self.complex.size_locks = self.plain_size_locks
+
+    def reset(self):
+        """
+        Utility function to clear every histogram
+        """
+        for histogram in self.histograms().values():
+            histogram.__init__()
+
+    def histograms(self):
+        """
+        Utility function to get every histogram by name, lock histograms are "<lock>.wait/hold" of each of LOCKS
+        """
+        histograms = dict(self.stages)
+        for lock in LOCKS:
+            histograms[lock + ".wait"] = getattr(self, lock + "_wait")
+            histograms[lock + ".hold"] = getattr(self, lock + "_hold")
+        return histograms
+
+    def to_dict(self):
+        """
+        Utility function to summarize every histogram that recorded something, values in microseconds
+
+        Returns:
+            dict: maps a histogram name to its Histogram.summary()
+        """
+        return dict((name, histogram.summary()) for name, histogram in self.histograms().items() if histogram.count)
+
+    def to_json(self):
+        """
+        Utility function to dump self.to_dict() as JSON
+        """
+        return json.dumps(self.to_dict(), sort_keys=True)
+
+    def to_text(self):
+        """
+        Utility function to dump self.to_dict() as a table, one histogram per line
+        """
+        columns = ["count", "min", "mean", "p50", "p90", "p99", "p999", "max"]
+        lines = ["{:<22}".format("stage (us)") + "".join("{:>10}".format(column) for column in columns)]
+        summaries = self.to_dict()
+        order = list(STAGES + RENDER_STAGES) + [lock + suffix for lock in LOCKS for suffix in (".wait", ".hold")]
+        for name in order:
+            if name not in summaries:
+                continue
+            summary = summaries[name]
+            cells = ["{:>10.1f}".format(summary["mean"]) if column == "mean" else "{:>10}".format(summary[column])
+                     for column in columns]
+            lines.append("{:<22}".format(name) + "".join(cells))
+        return "\n".join(lines)
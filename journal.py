@@ -0,0 +1,410 @@
+# -*- coding: utf-8 -*-
+"""
+journal module:
+  Defines the write-ahead journal of park/unpark transactions and the occupancy snapshots it is
+  compacted into, so a restarted complex recovers its open tickets
+
+  Notes: every transaction is appended to an in memory batch inside its critical section, a
+         background thread writes and fsyncs the batch every commit_interval seconds or once it
+         holds commit_batch records (group commit), one fsync covers many transactions.
+         Every snapshot_interval records the journal is rotated and a snapshot of occupancy and
+         open tickets is written, recovery is one snapshot load plus a replay of the records
+         written after it.
+
+         Files kept in a journal directory:
+           snapshot.pcs    latest snapshot, replaced atomically with a rename
+           journal.log     records written since the latest snapshot
+           journal.old     records of the rotated journal until the snapshot after them is written
+
+"""
+import os
+import struct
+import threading
+
+import Classes
+from ticket_log import CAR_SIZES, CAR_SIZE_CODES, to_seconds, from_seconds, to_cents
+
+#record kinds
+PARK = 0
+UNPARK = 1
+
+#kind, sequence number, ticket id, level, row, space, car size code, handicapped, seconds, charge cents
+#seconds is the start time of a park record and the end time of an unpark record
+RECORD = struct.Struct("<BQIHHHBBdq")
+
+SNAPSHOT_MAGIC = "PCS1"
+#magic, last sequence number, next ticket id, level count
+SNAPSHOT_HEADER = struct.Struct("<4sQII")
+#spaces on a level
+LEVEL_HEADER = struct.Struct("<I")
+#ticket id, level, row, space, car size code, handicapped, start seconds
+OPEN_TICKET = struct.Struct("<IHHHBBd")
+
+SNAPSHOT_FILE = "snapshot.pcs"
+JOURNAL_FILE = "journal.log"
+OLD_JOURNAL_FILE = "journal.old"
+
+
+def pack_record(kind, seq, ticket):
+    """
+    Utility function to pack a transaction into a journal record
+
+    Args:
+        kind(int): PARK or UNPARK
+        seq(int): sequence number of the transaction
+        ticket(Ticket): ticket of the transaction, closed for UNPARK
+
+    Returns:
+        str: RECORD.size bytes
+    """
+    location = ticket.p_spot.location
+    if kind == PARK:
+        seconds, cents = to_seconds(ticket.start_t), 0
+    else:
+        seconds, cents = to_seconds(ticket.end_t), to_cents(ticket.charge)
+    return RECORD.pack(kind, seq, ticket.id, location.level, location.row, location.space,
+                       CAR_SIZE_CODES[ticket.customer.size], ticket.customer.handicapped, seconds, cents)
+
+
+def read_journal(file_path, batch_records=4096):
+    """
+    Utility function to iterate the raw records of a journal, a torn record at the end is ignored
+
+    Args:
+        file_path(str): path to journal, a missing journal has no records
+        batch_records(int): number of records read from disk at a time
+
+    Returns:
+        generator of RECORD tuples
+    """
+    if not os.path.exists(file_path):
+        return
+    with open(file_path, "rb") as journal:
+        while True:
+            data = journal.read(RECORD.size * batch_records)
+            if not data:
+                break
+            for offset in xrange(0, len(data) - RECORD.size + 1, RECORD.size):
+                yield RECORD.unpack_from(data, offset)
+            if len(data) % RECORD.size:
+                break
+
+
+def write_snapshot(file_path, seq, next_ticket_id, occupancies, open_tickets):
+    """
+    Utility function to write a snapshot to a temporary file, fsync it, then rename it over file_path
+
+    Args:
+        file_path(str): path to snapshot
+        seq(int): sequence number of the last transaction in the snapshot
+        next_ticket_id(int): id the next ticket will be given
+        occupancies(list): occupancy bytes of each level
+        open_tickets(list): OPEN_TICKET tuples of each open ticket
+    """
+    chunks = [SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, seq, next_ticket_id, len(occupancies))]
+    for occupancy in occupancies:
+        chunks.append(LEVEL_HEADER.pack(len(occupancy)))
+        chunks.append(str(occupancy))
+    chunks.append(LEVEL_HEADER.pack(len(open_tickets)))
+    chunks.extend(OPEN_TICKET.pack(*open_ticket) for open_ticket in open_tickets)
+    temp_path = file_path + ".tmp"
+    with open(temp_path, "wb") as snapshot:
+        snapshot.write("".join(chunks))
+        snapshot.flush()
+        os.fsync(snapshot.fileno())
+    os.rename(temp_path, file_path)
+
+
+def read_snapshot(file_path):
+    """
+    Utility function to read a snapshot
+
+    Args:
+        file_path(str): path to snapshot
+
+    Returns:
+        tuple: (seq, next_ticket_id, occupancies, open_tickets) see write_snapshot,
+            open_tickets maps a (level, row, space) key to its OPEN_TICKET tuple
+        or
+        None: there is no snapshot
+
+    Raises:
+        ValueError: file is not a snapshot
+    """
+    if not os.path.exists(file_path):
+        return None
+    with open(file_path, "rb") as snapshot:
+        data = snapshot.read()
+    magic, seq, next_ticket_id, level_count = SNAPSHOT_HEADER.unpack_from(data, 0)
+    if magic != SNAPSHOT_MAGIC:
+        raise ValueError("{} is not a snapshot".format(file_path))
+    offset = SNAPSHOT_HEADER.size
+    occupancies = []
+    for n in xrange(0, level_count):
+        spaces, = LEVEL_HEADER.unpack_from(data, offset)
+        offset += LEVEL_HEADER.size
+        occupancies.append(bytearray(data[offset:offset + spaces]))
+        offset += spaces
+    ticket_count, = LEVEL_HEADER.unpack_from(data, offset)
+    offset += LEVEL_HEADER.size
+    open_tickets = {}
+    for n in xrange(0, ticket_count):
+        open_ticket = OPEN_TICKET.unpack_from(data, offset)
+        open_tickets[open_ticket[1:4]] = open_ticket
+        offset += OPEN_TICKET.size
+    return seq, next_ticket_id, occupancies, open_tickets
+
+
+def recover(complex, directory):
+    """
+    Utility function to restore the open tickets of a complex from the snapshot and journals of a directory
+
+    Args:
+        complex(ParkingComplex): freshly built complex with no tickets
+        directory(str): journal directory
+
+    Returns:
+        tuple(int,int): sequence number of the last recovered transaction and the next ticket id
+    """
+    state = read_snapshot(os.path.join(directory, SNAPSHOT_FILE))
+    if state is None:
+        state = (0, 1, [bytearray(len(level.occupancy)) for level in complex.levels], {})
+    seq, next_ticket_id, occupancies, open_tickets = state
+    if len(occupancies) != len(complex.levels):
+        raise ValueError("Snapshot has {} levels, complex has {}".format(len(occupancies), len(complex.levels)))
+    last_seq = seq
+    for file_name in (OLD_JOURNAL_FILE, JOURNAL_FILE):
+        for kind, record_seq, id, level, row, space, car_code, handicapped, seconds, cents in \
+                read_journal(os.path.join(directory, file_name)):
+            if record_seq <= seq:
+                continue
+            key = (level, row, space)
+            offset = complex.levels[level - 1].offset(row, space)
+            if kind == PARK:
+                open_tickets[key] = (id, level, row, space, car_code, handicapped, seconds)
+                occupancies[level - 1][offset] = 1
+                next_ticket_id = max(next_ticket_id, id + 1)
+            else:
+                open_tickets.pop(key, None)
+                occupancies[level - 1][offset] = 0
+            last_seq = max(last_seq, record_seq)
+    customers = {}
+    for size in CAR_SIZES:
+        for handicapped in (False, True):
+            customers[CAR_SIZE_CODES[size], handicapped] = Classes.Customer(size, handicapped)
+    tickets = {}
+    for key, (id, level, row, space, car_code, handicapped, seconds) in open_tickets.iteritems():
+        tickets[key] = Classes.Ticket(complex.get_spot(key), customers[car_code, bool(handicapped)], id,
+                                      from_seconds(seconds))
+    complex.restore(occupancies, tickets, next_ticket_id)
+    return last_seq, next_ticket_id
+
+
+def attach(complex, directory, commit_interval=0.005, commit_batch=1024, snapshot_interval=50000):
+    """
+    Utility function to recover a complex from a journal directory then journal its transactions there
+
+    Args:
+        complex(ParkingComplex): freshly built complex with no tickets
+        directory(str): journal directory, created if missing
+        commit_interval(float): see Journal
+        commit_batch(int): see Journal
+        snapshot_interval(int): see Journal
+
+    Returns:
+        Journal: started journal listening to complex
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    seq, next_ticket_id = recover(complex, directory)
+    journal = Journal(directory, commit_interval, commit_batch, snapshot_interval)
+    journal.seq = seq
+    journal.next_ticket_id = next_ticket_id
+    journal.start(complex)
+    return journal
+
+
+class Journal():
+    """
+    Defines a Journal instance, the group committed write-ahead journal of a ParkingComplex
+
+    Note: records are durable once committed, a crash loses at most the transactions of the last
+          commit_interval seconds, call sync() to wait for every transaction so far
+
+    Args:
+        directory(str): journal directory
+        commit_interval(float): seconds a record may wait before it is written and fsynced
+        commit_batch(int): number of waiting records that triggers a commit before commit_interval
+        snapshot_interval(int): number of committed records that triggers a snapshot, 0 never snapshots
+
+    Attributes:
+        directory(str): journal directory
+        commit_interval(float): seconds a record may wait before it is written and fsynced
+        commit_batch(int): number of waiting records that triggers a commit before commit_interval
+        snapshot_interval(int): number of committed records that triggers a snapshot
+        complex(ParkingComplex): complex being journaled
+        pending(list): packed records waiting to be committed
+        seq(int): sequence number of the last transaction
+        next_ticket_id(int): id after the largest journaled ticket id
+        since_snapshot(int): number of records committed since the last snapshot
+        file(file): open journal file or None
+        lock(threading.Condition): locking access to self.pending, self.seq and self.next_ticket_id
+        io_lock(threading.Lock): locking access to self.file
+        running(bool): boolean of the commit thread running
+        thread(threading.Thread): commit thread
+    """
+    def __init__(self, directory, commit_interval=0.005, commit_batch=1024, snapshot_interval=50000):
+        self.directory = directory
+        self.commit_interval = commit_interval
+        self.commit_batch = commit_batch
+        self.snapshot_interval = snapshot_interval
+        self.complex = None
+        self.pending = []
+        self.seq = 0
+        self.next_ticket_id = 1
+        self.since_snapshot = 0
+        self.file = None
+        self.lock = threading.Condition(threading.Lock())
+        self.io_lock = threading.Lock()
+        self.running = False
+        self.thread = None
+
+    def path(self, file_name):
+        return os.path.join(self.directory, file_name)
+
+    def start(self, complex):
+        """
+        Utility function to snapshot complex, listen to its transactions and start the commit thread
+
+        Args:
+            complex(ParkingComplex): complex to journal
+        """
+        self.complex = complex
+        self.snapshot()
+        complex.add_listener(self)
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="parking-journal")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def on_transaction(self, complex, ticket, parking):
+        """
+        Utility function to add a transaction to the pending batch, called by ParkingComplex.update_matrixs
+
+        Args:
+            complex(ParkingComplex): complex of the transaction
+            ticket(Ticket): ticket of the transaction
+            parking(bool): boolean of customer parking versus unparking
+        """
+        with self.lock:
+            self.seq += 1
+            self.pending.append(pack_record(PARK if parking else UNPARK, self.seq, ticket))
+            if ticket.id >= self.next_ticket_id:
+                self.next_ticket_id = ticket.id + 1
+            if len(self.pending) == 1 or len(self.pending) >= self.commit_batch:
+                self.lock.notify()
+
+    def run(self):
+        while True:
+            with self.lock:
+                while self.running and not self.pending:
+                    self.lock.wait()
+                if self.running and len(self.pending) < self.commit_batch:
+                    self.lock.wait(self.commit_interval)
+                running = self.running
+            self.commit()
+            if self.snapshot_interval and self.since_snapshot >= self.snapshot_interval:
+                self.snapshot()
+            if not running:
+                return
+
+    def commit(self):
+        """
+        Utility function to write and fsync every pending record in one call
+        """
+        with self.io_lock:
+            self.write_pending()
+
+    def write_pending(self):
+        """
+        Utility function to write and fsync every pending record
+
+        Note: the caller must hold self.io_lock
+        """
+        with self.lock:
+            pending, self.pending = self.pending, []
+        if not pending or self.file is None:
+            return
+        self.file.write("".join(pending))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.since_snapshot += len(pending)
+
+    def sync(self):
+        """
+        Utility function to commit every transaction journaled so far
+        """
+        self.commit()
+
+    def snapshot(self):
+        """
+        Utility function to snapshot the complex and start a new journal, the rotated journal is
+        removed once the snapshot is written
+        """
+        with self.complex.all_locks():
+            with self.io_lock:
+                self.rotate()
+                with self.lock:
+                    seq, next_ticket_id = self.seq, self.next_ticket_id
+                occupancies = [bytearray(level.occupancy) for level in self.complex.levels]
+                open_tickets = [(ticket.id, key[0], key[1], key[2], CAR_SIZE_CODES[ticket.customer.size],
+                                 ticket.customer.handicapped, to_seconds(ticket.start_t))
+                                for key, ticket in self.complex.open_tickets.iteritems()]
+        write_snapshot(self.path(SNAPSHOT_FILE), seq, next_ticket_id, occupancies, open_tickets)
+        if os.path.exists(self.path(OLD_JOURNAL_FILE)):
+            os.remove(self.path(OLD_JOURNAL_FILE))
+
+    def rotate(self):
+        """
+        Utility function to commit the current journal, move it to OLD_JOURNAL_FILE and open a new one
+
+        Note: the caller must hold self.io_lock, an old journal left by a failed snapshot is kept
+              and the current journal is appended to it
+        """
+        self.write_pending()
+        if self.file is not None:
+            self.file.close()
+        journal_path, old_path = self.path(JOURNAL_FILE), self.path(OLD_JOURNAL_FILE)
+        if os.path.exists(journal_path):
+            if os.path.exists(old_path):
+                with open(journal_path, "rb") as journal, open(old_path, "ab") as old:
+                    old.write(journal.read())
+                    old.flush()
+                    os.fsync(old.fileno())
+                os.remove(journal_path)
+            else:
+                os.rename(journal_path, old_path)
+        self.file = open(journal_path, "ab")
+        self.since_snapshot = 0
+
+    def close(self, snapshot=True):
+        """
+        Utility function to stop listening, commit every pending record and stop the commit thread
+
+        Args:
+            snapshot(bool): boolean of writing a final snapshot so the next recovery replays nothing
+        """
+        if self.complex is not None and self in self.complex.listeners:
+            self.complex.remove_listener(self)
+        if self.running:
+            with self.lock:
+                self.running = False
+                self.lock.notify()
+            self.thread.join()
+        if snapshot and self.complex is not None:
+            self.snapshot()
+        with self.io_lock:
+            self.write_pending()
+            if self.file is not None:
+                self.file.close()
+                self.file = None
@@ -7,42 +7,66 @@ park_unpark module:
 
 """
 from Classes import *
+from single_writer import SingleWriter, PendingResult
+from registry import ComplexRegistry
+import journal
+import storage
+from instrumentation import Instrumentation
+from analytics import Analytics
 import os, sys
+import threading
 
 #given global
 MINIMUM_PARKING_INTERVAL_SECONDS = 15*60
 #global complex for access across modules
 global parking_complex
+#single writer thread owning parking_complex, None when callers run requests themselves
+gate_writer = None
+#named complexes loaded by init_registry, None when only parking_complex is served
+registry = None
+#write-ahead journal of parking_complex, None when transactions are not journaled
+gate_journal = None
+#SQLite store of parking_complex, None when it is booted from config_path
+gate_store = None
+#stage timers of parking_complex, None when it is not instrumented
+gate_instruments = None
+#rolling window analytics of parking_complex, None when it is not analysed
+gate_analytics = None
 
 
 class InvalidInputError(Exception):
     """
-    Raised if the provided API input is invalid.
+    Raised if the provided API input is invalid. Nothing is printed, call print_exception to display it.
 
     Args:
         args(tuple(*args)): a tuple of parameters geiven to said function
         funciton(str): function name that rasied exception
         detail(str): detail into why a exception was thrown
+        code(str): machine-readable error code, see the check_*_input results in Classes
 
     Attributes:
         args(tuple(*args)): a tuple of parameters geiven to said function
         funciton(str): function name that rasied exception
         detail(str): detail into why a exception was thrown
+        code(str): machine-readable error code, e.g. "row_above_bounds"
     """
-    def __init__(self, args, function, detail):
+    def __init__(self, args, function, detail, code=None):
         self.args = args
         self.function = function
         self.detail = detail
-        self.print_exception()
+        self.code = code
+
+    def __str__(self):
+        return "{}() : {} : Parameter given : {}".format(self.function, self.detail, self.args)
 
     def print_exception(self):
         """
-        Utility function that updates size spot lists with parking spots on the given level
+        Utility function that prints the exception
         """
-        print "\nInvalidInputError: {}() : {} : Parameter given : {}".format(self.function, self.detail, self.args)
+        print "\nInvalidInputError: {}".format(self)
 
 
-def park(size, has_handicapped_placard):
+def park(size, has_handicapped_placard, complex_id=None, entrance=None):
     """ **** Given Doc String ****
     Return the most appropriate available parking space for this vehicle. Refer to
     challenge description for explanation of how to determine the most appropriate space
@@ -55,15 +79,24 @@ def park(size, has_handicapped_placard):
        Level, row and space numbers start at 1.
     :rtype: tuple(`int`,`int`,`int`)
     :raises InvalidInputError: if size invalid
+
+    :param complex_id: id of the registry complex to park in, default is parking_complex
+    :type complex_id: `str`
+    :param entrance: id of the entrance the vehicle came in by, the spot closest to it is given,
+       default is the first entrance of the config
+    :type entrance: `str`
     """
-    input_parse = parking_complex.check_park_input(size, has_handicapped_placard)
+    if on_other_thread():
+        return gate_writer.call(park, size, has_handicapped_placard, complex_id, entrance)
+    complex = get_complex(complex_id, sys._getframe().f_code.co_name)
+    input_parse = complex.check_park_input(size, has_handicapped_placard, entrance)
     if(input_parse[0]):
-        raise InvalidInputError((size, has_handicapped_placard), sys._getframe().f_code.co_name, input_parse[1])
+        raise InvalidInputError((size, has_handicapped_placard, entrance), sys._getframe().f_code.co_name, *input_parse[1:])
     else:
-        return parking_complex.park_customer(size, has_handicapped_placard)
+        return complex.park_customer(size, has_handicapped_placard, entrance)
 
 
-def unpark(location):
+def unpark(location, complex_id=None):
     """ **** Given Doc String ****
     Return the charge for parking at this location based on location type and time spent.
     Refer to challenge description for details on how to calculate parking rates.
@@ -73,17 +106,370 @@ def unpark(location):
     :returns: The total amount that the parker should be charged (eg: 7.5)
     :rtype: float
     :raises InvalidInputError: if location invalid or empty
+
+    :param complex_id: id of the registry complex to unpark from, default is parking_complex
+    :type complex_id: `str`
+    """
+    if on_other_thread():
+        return gate_writer.call(unpark, location, complex_id)
+    complex = get_complex(complex_id, sys._getframe().f_code.co_name)
+    input_parse = complex.check_unpark_input(location)
+    if(input_parse[0]):
+        raise InvalidInputError(location, sys._getframe().f_code.co_name, *input_parse[1:])
+    else:
+        return complex.unpark_customer(location)
+
+
+def park_many(requests, complex_id=None):
+    """
+    Park a batch of vehicles, e.g. gate events replayed after an outage. The whole batch is
+    validated before any vehicle is parked, then parked in order with the same results as
+    calling park() for each request.
+
+    :param requests: (size, has_handicapped_placard) or (size, has_handicapped_placard, entrance) of each vehicle
+    :type requests: list(tuple(`str`,`bool`))
+    :returns: parking location of each vehicle, None where no spaces were available
+    :rtype: list(tuple(`int`,`int`,`int`))
+    :raises InvalidInputError: if any request is invalid, nothing is parked
+    """
+    if on_other_thread():
+        return gate_writer.call(park_many, requests, complex_id)
+    complex = get_complex(complex_id, sys._getframe().f_code.co_name)
+    for request in requests:
+        input_parse = complex.check_park_input(*request)
+        if(input_parse[0]):
+            raise InvalidInputError(request, sys._getframe().f_code.co_name, *input_parse[1:])
+    return complex.park_customers(requests)
+
+
+def unpark_many(locations, complex_id=None):
+    """
+    Unpark a batch of vehicles in order. The whole batch is validated before any vehicle is
+    unparked, a location may appear only once.
+
+    :param locations: parking space of each vehicle as tuple (level, row, space)
+    :type locations: list(tuple(`int`,`int`,`int`))
+    :returns: the total amount each parker should be charged
+    :rtype: list(float)
+    :raises InvalidInputError: if any location is invalid or empty, nothing is unparked
+    """
+    if on_other_thread():
+        return gate_writer.call(unpark_many, locations, complex_id)
+    complex = get_complex(complex_id, sys._getframe().f_code.co_name)
+    seen = set()
+    for location in locations:
+        input_parse = complex.check_unpark_input(location)
+        if not input_parse[0] and location in seen:
+            input_parse = LOCATION_EMPTY
+        if(input_parse[0]):
+            raise InvalidInputError(location, sys._getframe().f_code.co_name, *input_parse[1:])
+        seen.add(location)
+    return complex.unpark_customers(locations)
+
+
+def park_trusted(size, has_handicapped_placard, complex_id=None, entrance=None):
+    """
+    park() for trusted internal callers whose input is already valid, nothing is validated.
+    Invalid input may raise any exception or corrupt the complex.
+
+    :returns: parking location. tuple of (level, row, space), or None if no spaces available.
+    :rtype: tuple(`int`,`int`,`int`)
+    """
+    if on_other_thread():
+        return gate_writer.call(park_trusted, size, has_handicapped_placard, complex_id, entrance)
+    return get_complex(complex_id, sys._getframe().f_code.co_name).park_customer(size, has_handicapped_placard, entrance)
+
+
+def unpark_trusted(location, complex_id=None):
+    """
+    unpark() for trusted internal callers whose location is already valid, nothing is validated.
+    A location in bounds that is not parked returns None instead of raising.
+
+    :returns: The total amount that the parker should be charged, or None if the location was empty
+    :rtype: float
+    """
+    if on_other_thread():
+        return gate_writer.call(unpark_trusted, location, complex_id)
+    return get_complex(complex_id, sys._getframe().f_code.co_name).unpark_customer(location)
+
+
+def reserve(size, has_handicapped_placard, ttl, complex_id=None, entrance=None):
+    """
+    Hold the most appropriate available parking space for a pre-booked vehicle. The space is
+    not given to park() until the hold is cancelled or ttl seconds pass without a claim().
+
+    :param size: vehicle size. For now this is 'compact_car' or 'large_car'
+    :type size: `str`
+    :param has_handicapped_placard: if True, hold a handicapped space (if available)
+    :type has_handicapped_placard: `bool`
+    :param ttl: seconds the space is held for
+    :type ttl: `float`
+    :returns: reservation id, or None if no spaces available
+    :rtype: `int`
+    :raises InvalidInputError: if size, ttl or entrance invalid
     """
-    input_parse = parking_complex.check_unpark_input(location)
+    if on_other_thread():
+        return gate_writer.call(reserve, size, has_handicapped_placard, ttl, complex_id, entrance)
+    complex = get_complex(complex_id, sys._getframe().f_code.co_name)
+    input_parse = complex.check_reserve_input(size, has_handicapped_placard, ttl, entrance)
     if(input_parse[0]):
-        raise InvalidInputError(location, sys._getframe().f_code.co_name, input_parse[1])
+        raise InvalidInputError((size, has_handicapped_placard, ttl), sys._getframe().f_code.co_name, *input_parse[1:])
+    return complex.reserve(size, has_handicapped_placard, ttl, entrance)
+
+
+def claim(reservation_id, complex_id=None):
+    """
+    Park a pre-booked vehicle in its held space.
+
+    :param reservation_id: id returned by reserve()
+    :type reservation_id: `int`
+    :returns: parking location. tuple of (level, row, space), or None if the hold was
+       claimed, cancelled or has expired
+    :rtype: tuple(`int`,`int`,`int`)
+    :raises InvalidInputError: if reservation_id invalid
+    """
+    if on_other_thread():
+        return gate_writer.call(claim, reservation_id, complex_id)
+    complex = get_complex(complex_id, sys._getframe().f_code.co_name)
+    input_parse = complex.check_reservation_input(reservation_id)
+    if(input_parse[0]):
+        raise InvalidInputError(reservation_id, sys._getframe().f_code.co_name, *input_parse[1:])
+    return complex.claim(reservation_id)
+
+
+def cancel(reservation_id, complex_id=None):
+    """
+    Give the held space of a reservation back.
+
+    :param reservation_id: id returned by reserve()
+    :type reservation_id: `int`
+    :returns: True if the hold was outstanding
+    :rtype: `bool`
+    :raises InvalidInputError: if reservation_id invalid
+    """
+    if on_other_thread():
+        return gate_writer.call(cancel, reservation_id, complex_id)
+    complex = get_complex(complex_id, sys._getframe().f_code.co_name)
+    input_parse = complex.check_reservation_input(reservation_id)
+    if(input_parse[0]):
+        raise InvalidInputError(reservation_id, sys._getframe().f_code.co_name, *input_parse[1:])
+    return complex.cancel(reservation_id)
+
+
+def park_async(size, has_handicapped_placard, complex_id=None, entrance=None):
+    """
+    Submit a park() request without waiting for it.
+
+    :returns: future parking location, call .result() to wait for it
+    :rtype: `PendingResult`
+    """
+    return submit(park, size, has_handicapped_placard, complex_id, entrance)
+
+
+def unpark_async(location, complex_id=None):
+    """
+    Submit an unpark() request without waiting for it.
+
+    :returns: future charge, call .result() to wait for it
+    :rtype: `PendingResult`
+    """
+    return submit(unpark, location, complex_id)
+
+
+def submit(function, *args):
+    """
+    Utility function to queue function(*args) on gate_writer, or run it now when there is no writer
+
+    Returns:
+        PendingResult: future result of the request
+    """
+    if gate_writer is not None:
+        return gate_writer.submit(function, *args)
+    pending = PendingResult()
+    try:
+        value = function(*args)
+    except Exception:
+        pending.finish(None, sys.exc_info())
     else:
-        return parking_complex.unpark_customer(location)
+        pending.finish(value, None)
+    return pending
+
 
+def get_complex(complex_id, function):
+    """
+    Utility function to get the complex a request is routed to
+
+    Args:
+        complex_id(str): id of a registry complex, None for parking_complex
+        function(str): function name used if a exception is raised
 
-def init():
+    Returns:
+        ParkingComplex
+
+    Raises:
+        InvalidInputError: no complex has this id
+    """
+    if complex_id is None:
+        return parking_complex
+    complex = registry.get(complex_id) if registry is not None else None
+    if complex is None:
+        raise InvalidInputError(complex_id, function, "Given 'complex_id' parameter not a loaded complex", "complex_id_unknown")
+    return complex
+
+
+def on_other_thread():
+    """
+    Utility function to check if a request must be handed to gate_writer
+    """
+    return gate_writer is not None and threading.current_thread() is not gate_writer
+
+
+def init(renderer="map", ticket_log_path=None, recent_tickets=1024, single_writer=False, config_path="redwood.txt",
+         journal_dir=None, database_path=None, instrument=False, layout_cache_path=None, analytics=False):
     """ **** Given Doc String ****
     Called on system initialization before any park/unpark function is called.
+
+    :param renderer: display for transactions, one of "none", "summary" or "map"
+    :type renderer: `str`
+    :param ticket_log_path: path of the append-only log closed tickets are archived to
+    :type ticket_log_path: `str`
+    :param recent_tickets: number of recently closed tickets kept in memory
+    :type recent_tickets: `int`
+    :param single_writer: run every park/unpark on one writer thread fed by a request queue
+    :type single_writer: `bool`
+    :param config_path: config file of the complex
+    :type config_path: `str`
+    :param journal_dir: directory of the write-ahead journal, open tickets found there are recovered
+    :type journal_dir: `str`
+    :param database_path: SQLite database the complex boots from and stores its tickets in, the
+        layout is loaded from config_path the first time, not with journal_dir as each recovers the complex
+    :type database_path: `str`
+    :param instrument: time every park/unpark stage into gate_instruments, see instrumentation.py
+    :type instrument: `bool`
+    :param layout_cache_path: binary copy of config_path kept up to date and loaded instead of it,
+        the parsed and ranked layout is also cached in memory by path and mtime, see Classes.complex_template
+    :type layout_cache_path: `str`
+    :param analytics: keep hourly occupancy, dwell time and revenue aggregates in gate_analytics, see analytics.py
+    :type analytics: `bool`
+    :raises ValueError: if both journal_dir and database_path are given
+    """
+    global parking_complex, registry, gate_store, gate_instruments, gate_analytics
+    if journal_dir is not None and database_path is not None:
+        raise ValueError("A complex is recovered from a journal or a database, give journal_dir or database_path")
+    start_writer(False)
+    close_journal()
+    close_store()
+    if database_path is not None:
+        parking_complex, gate_store = storage.open_complex(database_path, config_path, renderer,
+                                                           ticket_log_path=ticket_log_path,
+                                                           recent_tickets=recent_tickets)
+    else:
+        parking_complex = ParkingComplex(os.path.abspath(config_path), renderer,
+                                         ticket_log_path=ticket_log_path, recent_tickets=recent_tickets,
+                                         layout_cache_path=layout_cache_path)
+    registry = None
+    gate_instruments = Instrumentation(parking_complex) if instrument else None
+    start_journal(journal_dir)
+    gate_analytics = None
+    if analytics:
+        gate_analytics = Analytics()
+        gate_analytics.attach(parking_complex)
+    start_writer(single_writer)
+
+
+def reset(complex_id=None):
+    """
+    Empty a complex without reloading it: every space is freed and every ticket and reservation is
+    dropped, ticket ids continue from before the reset. The complex is stamped from its template,
+    see ParkingComplex.reset.
+
+    :param complex_id: id of the registry complex to reset, default is parking_complex
+    :type complex_id: `str`
+    :raises ValueError: if the complex is journaled or stored, init() it again instead
+    """
+    if on_other_thread():
+        return gate_writer.call(reset, complex_id)
+    complex = get_complex(complex_id, sys._getframe().f_code.co_name)
+    if not all(hasattr(listener, "on_reset") for listener in complex.listeners):
+        raise ValueError("A journaled or stored complex can not be reset, call init() instead")
+    complex.reset()
+
+
+def init_registry(config_dir, renderer="none", recent_tickets=1024, single_writer=False, complex_ids=None):
+    """
+    Called on system initialization to serve every complex config in a directory from this process.
+    Requests are routed with their complex_id parameter, the first config by file name is also
+    served as parking_complex.
+
+    :param config_dir: directory of config files, each file name without extension is a complex id
+    :type config_dir: `str`
+    :param renderer: display for transactions, one of "none", "summary" or "map"
+    :type renderer: `str`
+    :param recent_tickets: number of recently closed tickets kept in memory per complex
+    :type recent_tickets: `int`
+    :param single_writer: run every park/unpark on one writer thread fed by a request queue
+    :type single_writer: `bool`
+    :param complex_ids: only load configs with these ids, default loads every config
+    :type complex_ids: set(`str`)
+    :returns: ids of the loaded complexes
+    :rtype: list(`str`)
+    """
+    global parking_complex, registry, gate_instruments, gate_analytics
+    start_writer(False)
+    close_journal()
+    close_store()
+    registry = ComplexRegistry(renderer=renderer, recent_tickets=recent_tickets)
+    loaded = registry.load_directory(config_dir, complex_ids)
+    parking_complex = registry.get(registry.default_id())
+    gate_instruments = None
+    gate_analytics = None
+    start_writer(single_writer)
+    return loaded
+
+
+def start_writer(single_writer):
+    """
+    Utility function to stop the current gate_writer and start a new one if asked
+
+    Args:
+        single_writer(bool): boolean of starting a new writer
+    """
+    global gate_writer
+    if gate_writer is not None:
+        gate_writer.stop()
+        gate_writer = None
+    if single_writer:
+        gate_writer = SingleWriter()
+        gate_writer.start()
+
+
+def start_journal(journal_dir):
+    """
+    Utility function to recover parking_complex from a journal directory and journal it there
+
+    Args:
+        journal_dir(str): journal directory, None leaves parking_complex unjournaled
+    """
+    global gate_journal
+    if journal_dir is not None:
+        gate_journal = journal.attach(parking_complex, journal_dir)
+
+
+def close_journal():
+    """
+    Utility function to commit, snapshot and close the current journal
+    """
+    global gate_journal
+    if gate_journal is not None:
+        gate_journal.close()
+        gate_journal = None
+
+
+def close_store():
+    """
+    Utility function to commit and close the current SQLite store
     """
-    global parking_complex
-    parking_complex = ParkingComplex(os.path.abspath("redwood.txt"))
+    global gate_store
+    if gate_store is not None:
+        gate_store.close()
+        gate_store = None
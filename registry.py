@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+registry module:
+  Defines the registry of named parking complexes served by one process
+
+  Notes: every complex keeps its own levels, indexes, locks and tickets, so complexes can be
+         served together or split across processes without sharing state
+
+"""
+from collections import OrderedDict
+import os
+
+#config file extensions loaded from a registry directory
+CONFIG_EXTENSIONS = (".txt", ".cfg", ".pcx")
+
+
+class ComplexRegistry():
+    """
+    Defines a ComplexRegistry instance, parking complexes addressed by complex id
+
+    Args:
+        complex_kwargs(dict): keyword arguments given to every ParkingComplex this registry loads
+
+    Attributes:
+        complexes(OrderedDict): maps a complex id to its ParkingComplex, in load order
+        complex_kwargs(dict): keyword arguments given to every ParkingComplex this registry loads
+    """
+    def __init__(self, **complex_kwargs):
+        self.complexes = OrderedDict()
+        self.complex_kwargs = complex_kwargs
+
+    def __len__(self):
+        return len(self.complexes)
+
+    def __contains__(self, complex_id):
+        return complex_id in self.complexes
+
+    def __iter__(self):
+        return iter(self.complexes)
+
+    def get(self, complex_id):
+        """
+        Utility function to get a complex by id
+
+        Args:
+            complex_id(str): id of the complex
+
+        Returns:
+            ParkingComplex
+            or
+            None: no complex has this id
+        """
+        return self.complexes.get(complex_id)
+
+    def default_id(self):
+        """
+        Utility function to get the id of the first loaded complex, or None if the registry is empty
+        """
+        for complex_id in self.complexes:
+            return complex_id
+        return None
+
+    def add(self, complex_id, complex):
+        """
+        Utility function to add a complex, replacing any complex with the same id
+
+        Args:
+            complex_id(str): id of the complex
+            complex(ParkingComplex): complex to add
+        """
+        self.complexes[complex_id] = complex
+
+    def remove(self, complex_id):
+        """
+        Utility function to remove a complex, its buffered tickets are flushed first
+
+        Args:
+            complex_id(str): id of the complex
+        """
+        complex = self.complexes.pop(complex_id)
+        complex.flush()
+
+    def load_config(self, config_path, complex_id=None):
+        """
+        Utility function to build a complex from a config file and add it
+
+        Args:
+            config_path(str): path to config file in any format accepted by config_loader.load_layout
+            complex_id(str): id of the complex, default is the config file name without extension
+
+        Returns:
+            str: id of the added complex
+        """
+        if complex_id is None:
+            complex_id = config_id(config_path)
+        #imported on use, park_unpark imports this module and must be loaded before Classes
+        import park_unpark
+        self.add(complex_id, park_unpark.ParkingComplex(config_path, **self.complex_kwargs))
+        return complex_id
+
+    def load_directory(self, directory, complex_ids=None):
+        """
+        Utility function to build a complex from every config file in a directory
+
+        Args:
+            directory(str): directory of config files, see CONFIG_EXTENSIONS
+            complex_ids(set): only load configs with these ids, default loads every config
+
+        Returns:
+            list: ids of the added complexes, sorted
+        """
+        loaded = []
+        for config_path in config_paths(directory):
+            complex_id = config_id(config_path)
+            if complex_ids is None or complex_id in complex_ids:
+                loaded.append(self.load_config(config_path, complex_id))
+        return loaded
+
+    def flush(self):
+        """
+        Utility function to write every buffered closed ticket of every complex
+        """
+        for complex in self.complexes.values():
+            complex.flush()
+
+
+def config_id(config_path):
+    """
+    Utility function to get the complex id of a config file, its file name without extension
+
+    Args:
+        config_path(str): path to config file
+    """
+    return os.path.splitext(os.path.basename(config_path))[0]
+
+
+def config_paths(directory):
+    """
+    Utility function to list the config files of a directory, sorted by file name
+
+    Args:
+        directory(str): directory of config files
+    """
+    return [os.path.join(directory, file_name) for file_name in sorted(os.listdir(directory))
+            if os.path.splitext(file_name)[1] in CONFIG_EXTENSIONS]
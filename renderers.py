@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+renderers module:
+  Defines the pluggable displays for park and unpark transactions
+
+  Notes: a renderer is split in two steps so no output is written while a complex
+         holds its locks:
+           snapshot() runs inside the critical section and copies the state it needs
+           render() runs after the locks are released and writes the frame in one call
+
+"""
+import sys
+
+
+class NullRenderer():
+    """
+    Defines a NullRenderer instance that displays nothing
+    """
+    def snapshot(self, complex, ticket, parking):
+        """
+        Utility function to capture a transaction for display
+
+        Args:
+            complex(ParkingComplex): complex the transaction happened in
+            ticket(Ticket): ticket of the transaction
+            parking(bool): boolean of customer parking versus unparking
+
+        Returns:
+            None: nothing is displayed
+        """
+        return None
+
+    def render(self, frame):
+        """
+        Utility function to display a captured transaction
+
+        Args:
+            frame(RenderFrame): frame returned by snapshot
+        """
+        pass
+
+
+class RenderFrame():
+    """
+    Defines a RenderFrame instance, a read only copy of a transaction taken inside the critical section
+
+    Args:
+        complex(ParkingComplex): complex the transaction happened in
+        ticket(Ticket): ticket of the transaction
+        parking(bool): boolean of customer parking versus unparking
+        with_map(bool): boolean of copying the complex occupancy for a map
+
+    Attributes:
+        name(str): name of the parking complex
+        parking(bool): boolean of customer parking versus unparking
+        ticket_id(int): ticket id number
+        size(str): detected car size
+        start_t(datetime): date of when the car parked
+        end_t(datetime): date of when the car unparked
+        delta_t(float): elapsed seconds of the ticket
+        charge(float): amount charged for park time
+        location(tuple(int,int,int)): (level, row, space) of the ticket
+        dimensions(tuple): (level, rows, spaces) of every level in the complex
+        occupied(dict): maps a (level, row, space) location to the map description of its ticket
+    """
+    def __init__(self, complex, ticket, parking, with_map):
+        self.name = complex.name
+        self.parking = parking
+        self.ticket_id = ticket.id
+        self.size = ticket.customer.size
+        self.start_t = ticket.start_t
+        self.end_t = ticket.end_t
+        self.delta_t = ticket.delta_t
+        self.charge = ticket.charge
+        location = ticket.p_spot.location
+        self.location = (location.level, location.row, location.space)
+        self.dimensions = None
+        self.occupied = None
+        if with_map:
+            self.dimensions = tuple((level.level, level.rows, level.spaces) for level in complex.levels)
+            self.occupied = dict((key, t.description) for key, t in complex.open_tickets.items())
+
+
+class SummaryRenderer(NullRenderer):
+    """
+    Defines a SummaryRenderer instance that displays the ticket or receipt details without the complex map
+    """
+    with_map = False
+
+    def snapshot(self, complex, ticket, parking):
+        return RenderFrame(complex, ticket, parking, self.with_map)
+
+    def render(self, frame):
+        if frame is None:
+            return
+        parts = []
+        if frame.parking:
+            self.write_park_details(frame, parts)
+        else:
+            self.write_unpark_details(frame, parts)
+        if self.with_map:
+            self.write_map(frame, parts)
+        sys.stdout.write("".join(parts))
+
+    def write_park_details(self, frame, parts):
+        """
+        Utility function to add the ticket details of a park transaction to parts
+
+        Args:
+            frame(RenderFrame): frame to display
+            parts(list): output buffer
+        """
+        parts.append("\n\n\n\nPark:\n")
+        parts.append("-" * 148 + "\n")
+        parts.append("Welcome to the " + frame.name + " Parking Complex\n")
+        parts.append("Here are your ticket details:\n\n")
+        parts.append("\tTicket ID:\t\t %s\n" % frame.ticket_id)
+        parts.append("\tDetected Car Size:\t %s\n" % frame.size)
+        parts.append("\tStart Time:\t\t %s\n" % frame.start_t)
+        parts.append("\tLocation:\t\tLevel:%d   Row:%d   Space:%d\n" % frame.location)
+
+    def write_unpark_details(self, frame, parts):
+        """
+        Utility function to add the receipt details of a unpark transaction to parts
+
+        Args:
+            frame(RenderFrame): frame to display
+            parts(list): output buffer
+        """
+        parts.append("\n\n\n\nUnpark:\n")
+        parts.append("-" * 145 + "\n")
+        parts.append("Thank for parking at Lastline's " + frame.name + " Complex\n")
+        parts.append("Here is your receipt Details:\n\n")
+        parts.append("\tTicket ID:\t\t %s\n" % frame.ticket_id)
+        parts.append("\tDetected Car Size:\t %s\n" % frame.size)
+        parts.append("\tStart Time:\t\t %s\n" % frame.start_t)
+        parts.append("\tFinish Time:\t\t %s\n" % frame.end_t)
+        m, s = divmod(frame.delta_t, 60)
+        h, m = divmod(m, 60)
+        parts.append("\tElapsed Time:\t\t%d:%02d:%02d\n" % (h, m, s))
+        parts.append("\tCharge Due:\t\t ${:.2f}\n".format(frame.charge))
+        parts.append("\n\tHave a good day!\n")
+
+    def write_map(self, frame, parts):
+        """
+        Utility function to add the complex map of a transaction to parts
+
+        Args:
+            frame(RenderFrame): frame to display
+            parts(list): output buffer
+        """
+        if frame.parking:
+            parts.append("\n\tLocate 'Park' in the complex map below for directions to your given spot\n")
+            marker = "Park\t\t"
+        else:
+            marker = "unparking\t"
+        occupied = frame.occupied
+        for level, rows, spaces in frame.dimensions:
+            parts.append("\n\n\nLevel %d\n" % level)
+            parts.append("".join("S%d \t\t " % (n + 1) for n in range(0, spaces)))
+            parts.append("\n\n")
+            for i in range(1, rows + 1):
+                parts.append("\nR%d " % i)
+                for j in range(1, spaces + 1):
+                    key = (level, i, j)
+                    if key == frame.location:
+                        parts.append(marker)
+                    elif key in occupied:
+                        parts.append(occupied[key] + "\t\t")
+                    else:
+                        parts.append("0\t\t")
+        parts.append("\n")
+
+
+class MapRenderer(SummaryRenderer):
+    """
+    Defines a MapRenderer instance that displays the ticket or receipt details and the full complex map
+    """
+    with_map = True
+
+
+RENDERERS = {"none": NullRenderer, "summary": SummaryRenderer, "map": MapRenderer}
+
+
+def get_renderer(renderer):
+    """
+    Utility function to get a renderer instance from a name or instance
+
+    Args:
+        renderer(str|NullRenderer): one of ["none", "summary", "map"] or a renderer instance
+
+    Returns:
+        renderer instance
+    """
+    if isinstance(renderer, basestring):
+        return RENDERERS[renderer]()
+    return renderer
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+reservations module:
+  Defines the holds pre-booked spots are kept under until they are claimed, cancelled or expire
+
+  Notes: a held spot is popped out of the free spot indexes when it is reserved, so park() and
+         get_best_spot never see it and outstanding holds cost the park path nothing. Expiry is
+         driven by a hashed timer wheel: scheduling and cancelling a hold are O(1) and advancing the
+         wheel only visits the slots of the ticks that passed, never every hold.
+         Holds live in memory only, they are not journaled or stored, a restarted complex has none.
+
+"""
+from collections import namedtuple
+import itertools
+import threading
+import time
+
+#seconds per wheel tick, a hold lasts at least its ttl and at most one tick longer
+TICK_SECONDS = 1.0
+#slots of the wheel, holds further than this many ticks away wait in their slot for extra rounds
+WHEEL_SLOTS = 512
+
+
+class Reservation(namedtuple("Reservation", ["id", "key", "size_t", "customer", "deadline"])):
+    """
+    Defines a Reservation instance, a spot held for a customer
+
+    Attributes:
+        id(int): reservation id
+        key(tuple(int,int,int)): (level, row, space) of the held spot
+        size_t(str): size type of the held spot
+        customer(Customer): the customer the spot is held for
+        deadline(float): time.time() the hold expires at
+    """
+    __slots__ = ()
+
+
+class TimerWheel():
+    """
+    Defines a TimerWheel instance, a hashed timer wheel of timer ids
+
+    A timer due at tick t sits in slot t % len(slots) with its tick, so each slot holds the timers of
+    every round that hash to it and a timer fires when its slot is visited on or after its tick.
+
+    Args:
+        now(float): current time
+        tick(float): seconds per tick
+        slots(int): number of slots
+
+    Attributes:
+        tick(float): seconds per tick
+        slots(list): dict per slot mapping a timer id to its due tick
+        current(int): last tick advanced to
+    """
+    def __init__(self, now, tick=TICK_SECONDS, slots=WHEEL_SLOTS):
+        self.tick = tick
+        self.slots = [{} for n in range(0, slots)]
+        self.current = int(now // tick)
+
+    def schedule(self, timer_id, deadline):
+        """
+        Utility function to add a timer, O(1)
+
+        Args:
+            timer_id(int): id returned by advance once the timer fires
+            deadline(float): time the timer is due, timers are never due before the next tick
+
+        Returns:
+            int: due tick of the timer, needed to cancel it
+        """
+        due = max(-int(-deadline // self.tick), self.current + 1)
+        self.slots[due % len(self.slots)][timer_id] = due
+        return due
+
+    def cancel(self, timer_id, due):
+        """
+        Utility function to remove a timer, O(1)
+
+        Args:
+            timer_id(int): id given to schedule
+            due(int): tick returned by schedule
+        """
+        self.slots[due % len(self.slots)].pop(timer_id, None)
+
+    def next_tick_time(self):
+        """
+        Utility function to get the time advance next has work to do
+        """
+        return (self.current + 1) * self.tick
+
+    def advance(self, now):
+        """
+        Utility function to fire every timer due by now, O(ticks passed + timers in the visited slots)
+
+        Args:
+            now(float): current time
+
+        Returns:
+            list: ids of the fired timers
+        """
+        target = int(now // self.tick)
+        if target <= self.current:
+            return []
+        fired = []
+        ticks = min(target - self.current, len(self.slots))
+        for tick in xrange(self.current + 1, self.current + 1 + ticks):
+            slot = self.slots[tick % len(self.slots)]
+            due_ids = [timer_id for timer_id, due in slot.iteritems() if due <= target]
+            for timer_id in due_ids:
+                del slot[timer_id]
+            fired.extend(due_ids)
+        self.current = target
+        return fired
+
+
+class ReservationBook():
+    """
+    Defines a ReservationBook instance, the outstanding holds of one ParkingComplex
+
+    Args:
+        clock(function): returns the current time in seconds, default is time.time
+
+    Attributes:
+        holds(dict): maps a reservation id to its (Reservation, due tick)
+        wheel(TimerWheel): expiry timers of self.holds
+        ids(itertools.count): reservation id allocator
+        clock(function): returns the current time in seconds
+        lock(threading.Lock): locking self.holds and self.wheel
+    """
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.holds = {}
+        self.wheel = TimerWheel(clock())
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.holds)
+
+    def hold(self, key, size_t, customer, ttl):
+        """
+        Utility function to hold a spot taken out of the free spot indexes
+
+        Args:
+            key(tuple(int,int,int)): (level, row, space) of the spot
+            size_t(str): size type of the spot
+            customer(Customer): the customer the spot is held for
+            ttl(float): seconds until the hold expires
+
+        Returns:
+            Reservation: the new hold
+        """
+        with self.lock:
+            reservation = Reservation(next(self.ids), key, size_t, customer, self.clock() + ttl)
+            self.holds[reservation.id] = (reservation, self.wheel.schedule(reservation.id, reservation.deadline))
+        return reservation
+
+    def take(self, reservation_id):
+        """
+        Utility function to remove a hold before it expires, O(1)
+
+        Args:
+            reservation_id(int): id of the hold
+
+        Returns:
+            Reservation: the removed hold
+            or
+            None: no such hold, it was claimed, cancelled or has expired
+        """
+        with self.lock:
+            entry = self.holds.pop(reservation_id, None)
+            if entry is None:
+                return None
+            self.wheel.cancel(reservation_id, entry[1])
+        return entry[0]
+
+    def expire(self):
+        """
+        Utility function to remove every hold past its deadline, a single check while no tick has passed
+
+        Returns:
+            list: the expired Reservation objects, their spots must be returned to the free spot indexes
+        """
+        if not self.holds or self.clock() < self.wheel.next_tick_time():
+            return []
+        with self.lock:
+            return [self.holds.pop(reservation_id)[0] for reservation_id in self.wheel.advance(self.clock())]
+
+    def clear(self):
+        """
+        Utility function to drop every hold without returning their spots
+        """
+        with self.lock:
+            self.holds = {}
+            self.wheel = TimerWheel(self.clock(), self.wheel.tick, len(self.wheel.slots))
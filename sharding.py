@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+sharding module:
+  Serves the complexes of a config directory from a pool of worker processes
+
+  Notes: each worker process owns a ComplexRegistry with a subset of the complexes, the router
+         forwards park/unpark requests to the owning worker over a pipe and hands back the same
+         results and exceptions park_unpark would give in process, a request that fails does not
+         stop its worker.
+         Requests are sent to workers in batches so every worker runs its share in parallel.
+         A router may be shared by many threads, each worker's pipe is locked from sending a batch
+         until its results are received, the locks of a batch's workers are taken in worker order.
+
+"""
+import multiprocessing
+import pickle
+import threading
+
+import park_unpark
+from registry import ComplexRegistry, config_id, config_paths
+
+#request operations, each runs the park_unpark function of the same name
+OPERATIONS = ("park", "unpark", "park_many", "unpark_many")
+
+
+def shard_worker(connection, config_dir, complex_ids, complex_kwargs):
+    """
+    Utility function run by each worker process, serves batches of requests until it receives None
+
+    Args:
+        connection(multiprocessing.Connection): pipe to the router
+        config_dir(str): directory of config files
+        complex_ids(list): ids of the complexes this worker owns
+        complex_kwargs(dict): keyword arguments given to every ParkingComplex
+    """
+    park_unpark.gate_writer = None
+    park_unpark.registry = ComplexRegistry(**complex_kwargs)
+    park_unpark.registry.load_directory(config_dir, set(complex_ids))
+    connection.send(True)
+    while True:
+        batch = connection.recv()
+        if batch is None:
+            break
+        results = []
+        for request in batch:
+            operation, complex_id, args = request[:3]
+            kwargs = dict(request[3]) if len(request) > 3 else {}
+            kwargs["complex_id"] = complex_id
+            try:
+                if operation not in OPERATIONS:
+                    raise park_unpark.InvalidInputError(operation, "shard_worker", "Given operation not a defined as a option",
+                                                        "operation_unknown")
+                value = getattr(park_unpark, operation)(*args, **kwargs)
+            except park_unpark.InvalidInputError as e:
+                results.append((False, (e.args, e.function, e.detail, e.code)))
+            except Exception as e:
+                results.append((None, picklable_exception(e)))
+            else:
+                results.append((True, value))
+        connection.send(results)
+    park_unpark.registry.flush()
+    connection.close()
+
+
+def picklable_exception(exception):
+    """
+    Utility function to get an exception that can be sent back to the router over a pipe
+
+    Args:
+        exception(Exception): exception raised by a request
+
+    Returns:
+        Exception: exception itself, or a RuntimeError naming it if it cannot be pickled
+    """
+    try:
+        pickle.dumps(exception)
+    except Exception:
+        return RuntimeError("{}: {}".format(type(exception).__name__, exception))
+    return exception
+
+
+class ShardRouter():
+    """
+    Defines a ShardRouter instance, the front end of a pool of worker processes each owning a
+    subset of the complexes of a config directory
+
+    Args:
+        config_dir(str): directory of config files, see registry.CONFIG_EXTENSIONS
+        workers(int): number of worker processes
+        complex_kwargs(dict): keyword arguments given to every ParkingComplex, default renderer is "none"
+
+    Attributes:
+        shard_of(dict): maps a complex id to the index of its worker
+        connections(list): pipe to each worker
+        processes(list): multiprocessing.Process of each worker
+        locks(list): threading.Lock of each worker's pipe, held from sending a batch until its results are received
+    """
+    def __init__(self, config_dir, workers=2, **complex_kwargs):
+        complex_kwargs.setdefault("renderer", "none")
+        complex_ids = [config_id(config_path) for config_path in config_paths(config_dir)]
+        workers = max(1, min(workers, len(complex_ids)))
+        self.shard_of = dict((complex_id, n % workers) for n, complex_id in enumerate(complex_ids))
+        self.connections = []
+        self.processes = []
+        self.locks = [threading.Lock() for shard in range(0, workers)]
+        for shard in range(0, workers):
+            owned = [complex_id for complex_id in complex_ids if self.shard_of[complex_id] == shard]
+            router_end, worker_end = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=shard_worker, args=(worker_end, config_dir, owned, complex_kwargs))
+            process.daemon = True
+            process.start()
+            self.connections.append(router_end)
+            self.processes.append(process)
+        for connection in self.connections:
+            connection.recv()
+
+    def park(self, size, has_handicapped_placard, complex_id, entrance=None):
+        """
+        Utility function to park a vehicle in a complex, see park_unpark.park
+        """
+        return self.run_one(("park", complex_id, (size, has_handicapped_placard), {"entrance": entrance}))
+
+    def unpark(self, location, complex_id):
+        """
+        Utility function to unpark a vehicle from a complex, see park_unpark.unpark
+        """
+        return self.run_one(("unpark", complex_id, (location,)))
+
+    def run_one(self, request):
+        """
+        Utility function to run a single request, raising its exception if it was invalid or failed
+
+        Args:
+            request(tuple): (operation, complex_id, args) of the request
+        """
+        result = self.run([request])[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def run(self, requests):
+        """
+        Utility function to run a batch of requests, each worker runs its share in parallel and in order
+
+        Args:
+            requests(list): (operation, complex_id, args) or (operation, complex_id, args, kwargs) of each
+                request, operation is one of OPERATIONS, complex_id is passed by keyword with kwargs
+
+        Returns:
+            list: result of each request, an InvalidInputError instance where a request was invalid
+                and the raised exception where a request failed
+        """
+        batches = [[] for connection in self.connections]
+        positions = [[] for connection in self.connections]
+        results = [None] * len(requests)
+        for position, request in enumerate(requests):
+            shard = self.shard_of.get(request[1])
+            if shard is None:
+                results[position] = self.unknown_complex(request)
+                continue
+            batches[shard].append(request)
+            positions[shard].append(position)
+        shards = [shard for shard, batch in enumerate(batches) if batch]
+        for shard in shards:
+            self.locks[shard].acquire()
+        try:
+            for shard in shards:
+                self.connections[shard].send(batches[shard])
+            for shard in shards:
+                for position, (ok, value) in zip(positions[shard], self.connections[shard].recv()):
+                    if ok is False:
+                        value = park_unpark.InvalidInputError(*value)
+                    results[position] = value
+        finally:
+            for shard in shards:
+                self.locks[shard].release()
+        return results
+
+    def unknown_complex(self, request):
+        """
+        Utility function to build the exception park_unpark raises for a complex id no worker owns
+
+        Args:
+            request(tuple): (operation, complex_id, args) of the request
+        """
+        return park_unpark.InvalidInputError(request[1], request[0], "Given 'complex_id' parameter not a loaded complex",
+                                             "complex_id_unknown")
+
+    def close(self):
+        """
+        Utility function to stop every worker once its batch in flight is answered, buffered tickets are flushed first
+        """
+        for connection, lock in zip(self.connections, self.locks):
+            with lock:
+                connection.send(None)
+        for process in self.processes:
+            process.join()
+        for connection in self.connections:
+            connection.close()
+        self.connections = []
+        self.processes = []
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+single_writer module:
+  Defines a single writer thread that owns a ParkingComplex and drains a request queue
+
+  Notes: Python 2.7 has no asyncio, callers get a PendingResult future instead of a coroutine.
+         Many gate threads submit requests, one thread runs them in arrival order, so the complex
+         locks are never contended.
+
+"""
+import sys
+import threading
+import Queue
+
+
+class PendingResult():
+    """
+    Defines a PendingResult instance, the future result of a request submitted to a SingleWriter
+
+    Attributes:
+        done_event(threading.Event): set once the request has run
+        value(object): return value of the request
+        exc_info(tuple): sys.exc_info() of the exception raised by the request, or None
+        callbacks(list): functions called with this PendingResult once it is done
+    """
+    def __init__(self):
+        self.done_event = threading.Event()
+        self.value = None
+        self.exc_info = None
+        self.callbacks = []
+        self.lock = threading.Lock()
+
+    def done(self):
+        """
+        Utility function to check if the request has run
+        """
+        return self.done_event.is_set()
+
+    def result(self, timeout=None):
+        """
+        Utility function to wait for the request and return its value or raise its exception
+
+        Args:
+            timeout(float): seconds to wait, None waits forever
+        """
+        if not self.done_event.wait(timeout):
+            raise RuntimeError("Request did not finish in {} seconds".format(timeout))
+        if self.exc_info is not None:
+            raise self.exc_info[0], self.exc_info[1], self.exc_info[2]
+        return self.value
+
+    def add_done_callback(self, callback):
+        """
+        Utility function to call callback(self) once the request has run, immediately if it already has
+
+        Args:
+            callback(function): function taking this PendingResult
+        """
+        with self.lock:
+            if not self.done_event.is_set():
+                self.callbacks.append(callback)
+                return
+        callback(self)
+
+    def finish(self, value, exc_info):
+        """
+        Utility function to set the outcome of the request and wake up waiters
+
+        Args:
+            value(object): return value of the request
+            exc_info(tuple): sys.exc_info() of the exception raised by the request, or None
+        """
+        with self.lock:
+            self.value = value
+            self.exc_info = exc_info
+            self.done_event.set()
+            callbacks = self.callbacks
+            self.callbacks = []
+        for callback in callbacks:
+            callback(self)
+
+
+class SingleWriter(threading.Thread):
+    """
+    Defines a SingleWriter instance, a daemon thread running submitted requests one at a time
+
+    Args:
+        max_drain(int): maximum number of queued requests run per wake up
+
+    Attributes:
+        requests(Queue.Queue): queue of (function, args, PendingResult) requests
+        max_drain(int): maximum number of queued requests run per wake up
+        running(bool): boolean of the writer accepting requests
+    """
+    def __init__(self, max_drain=256):
+        threading.Thread.__init__(self, name="parking-single-writer")
+        self.daemon = True
+        self.requests = Queue.Queue()
+        self.max_drain = max_drain
+        self.running = True
+
+    def submit(self, function, *args):
+        """
+        Utility function to queue function(*args) to run on the writer thread
+
+        Returns:
+            PendingResult: future result of the request
+        """
+        pending = PendingResult()
+        if not self.running:
+            raise RuntimeError("Single writer is stopped")
+        if threading.current_thread() is self:
+            self.run_request(function, args, pending)
+        else:
+            self.requests.put((function, args, pending))
+        return pending
+
+    def call(self, function, *args):
+        """
+        Utility function to run function(*args) on the writer thread and wait for its result
+        """
+        return self.submit(function, *args).result()
+
+    def stop(self):
+        """
+        Utility function to run every queued request then stop the writer thread
+        """
+        if self.running:
+            self.running = False
+            self.requests.put(None)
+            self.join()
+
+    def run(self):
+        while True:
+            request = self.requests.get()
+            drained = 0
+            while request is not None:
+                self.run_request(*request)
+                drained += 1
+                if drained >= self.max_drain:
+                    break
+                try:
+                    request = self.requests.get_nowait()
+                except Queue.Empty:
+                    break
+            if request is None:
+                return
+
+    def run_request(self, function, args, pending):
+        """
+        Utility function to run one request and finish its PendingResult
+
+        Args:
+            function(function): function to run
+            args(tuple): arguments of function
+            pending(PendingResult): future result of the request
+        """
+        try:
+            value = function(*args)
+        except Exception:
+            pending.finish(None, sys.exc_info())
+        else:
+            pending.finish(value, None)
@@ -0,0 +1,394 @@
+# -*- coding: utf-8 -*-
+"""
+storage module:
+  Defines the SQLite backend that persists the layout, spot occupancy and tickets of a ParkingComplex
+
+  Notes: the database runs in WAL mode so reporting queries read a consistent snapshot without
+         blocking the writer. Park/unpark transactions are queued inside their critical section
+         and a single writer thread owning the write connection runs each batch in one transaction
+         (group commit). Statements are fixed SQL strings, sqlite3 prepares each once per connection
+         and reuses it from its statement cache. Reporting queries borrow a connection from a small
+         read pool.
+
+  Tables:
+    complex     name of the complex and the lines of its walking graph, one row
+    levels      rows, spaces and one type code byte per space of each level
+    tickets     every ticket, end_t and charge_cents are NULL while the ticket is open
+    occupied    (level, row, space) of each filled spot and the ticket parked there
+
+"""
+from contextlib import contextmanager
+from itertools import groupby
+from operator import itemgetter
+import os
+import sqlite3
+import threading
+import Queue
+
+import Classes
+from config_loader import GarageLayout, LevelLayout, load_layout
+from tariff import load_tariff, tariff_path
+from ticket_log import CAR_SIZES, to_seconds, from_seconds, to_cents
+from walking import parse_graph_lines
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS complex (name TEXT NOT NULL, graph TEXT);
+CREATE TABLE IF NOT EXISTS levels (
+    level INTEGER PRIMARY KEY, rows INTEGER NOT NULL, spaces INTEGER NOT NULL, type_codes BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS tickets (
+    id INTEGER PRIMARY KEY, level INTEGER NOT NULL, row INTEGER NOT NULL, space INTEGER NOT NULL,
+    size_t TEXT NOT NULL, car_size TEXT NOT NULL, handicapped INTEGER NOT NULL,
+    start_t REAL NOT NULL, end_t REAL, charge_cents INTEGER);
+CREATE TABLE IF NOT EXISTS occupied (
+    level INTEGER NOT NULL, row INTEGER NOT NULL, space INTEGER NOT NULL, ticket_id INTEGER NOT NULL,
+    PRIMARY KEY (level, row, space));
+"""
+
+INSERT_TICKET = ("INSERT INTO tickets (id, level, row, space, size_t, car_size, handicapped, start_t) "
+                 "VALUES (?, ?, ?, ?, ?, ?, ?, ?)")
+INSERT_OCCUPIED = "INSERT OR REPLACE INTO occupied (level, row, space, ticket_id) VALUES (?, ?, ?, ?)"
+CLOSE_TICKET = "UPDATE tickets SET end_t = ?, charge_cents = ? WHERE id = ?"
+DELETE_OCCUPIED = "DELETE FROM occupied WHERE level = ? AND row = ? AND space = ?"
+TICKET_STATEMENTS = (INSERT_TICKET, CLOSE_TICKET)
+
+SELECT_OPEN_TICKETS = ("SELECT t.id, t.level, t.row, t.space, t.car_size, t.handicapped, t.start_t "
+                       "FROM occupied o JOIN tickets t ON t.id = o.ticket_id")
+SELECT_REVENUE = ("SELECT size_t, COUNT(*), COALESCE(SUM(charge_cents), 0) FROM tickets "
+                  "WHERE end_t IS NOT NULL GROUP BY size_t ORDER BY size_t")
+SELECT_OCCUPANCY = "SELECT level, COUNT(*) FROM occupied GROUP BY level ORDER BY level"
+SELECT_TICKETS_BETWEEN = ("SELECT id, level, row, space, size_t, car_size, handicapped, start_t, end_t, charge_cents "
+                          "FROM tickets WHERE start_t >= ? AND start_t < ? ORDER BY id")
+
+
+def connect(db_path, check_same_thread=True):
+    """
+    Utility function to open a connection in WAL mode with the schema created
+
+    Args:
+        db_path(str): path to database file, created if missing
+        check_same_thread(bool): see sqlite3.connect, False for pooled connections
+
+    Returns:
+        sqlite3.Connection
+    """
+    connection = sqlite3.connect(db_path, check_same_thread=check_same_thread, cached_statements=32)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+class ConnectionPool():
+    """
+    Defines a ConnectionPool instance, a fixed set of read connections shared by reporting queries
+
+    Args:
+        db_path(str): path to database file
+        size(int): number of connections
+
+    Attributes:
+        connections(Queue.Queue): idle connections
+        all_connections(list): every connection of the pool
+    """
+    def __init__(self, db_path, size=2):
+        self.connections = Queue.Queue()
+        self.all_connections = []
+        for n in range(0, size):
+            connection = connect(db_path, check_same_thread=False)
+            self.all_connections.append(connection)
+            self.connections.put(connection)
+
+    @contextmanager
+    def connection(self):
+        """
+        Utility function to borrow a connection, waits while every connection is in use
+        """
+        connection = self.connections.get()
+        try:
+            yield connection
+        finally:
+            self.connections.put(connection)
+
+    def close(self):
+        """
+        Utility function to close every connection of the pool
+        """
+        for connection in self.all_connections:
+            connection.close()
+        self.all_connections = []
+
+
+class SQLiteStore():
+    """
+    Defines a SQLiteStore instance, the SQLite backend of a ParkingComplex
+
+    Note: transactions are durable once committed, a crash loses at most the transactions of the
+          last commit_interval seconds, call sync() to wait for every transaction so far
+
+    Args:
+        db_path(str): path to database file, created if missing
+        commit_interval(float): seconds a transaction may wait before it is committed
+        commit_batch(int): number of waiting transactions that triggers a commit before commit_interval
+        readers(int): number of pooled read connections
+
+    Attributes:
+        db_path(str): path to database file
+        commit_interval(float): seconds a transaction may wait before it is committed
+        commit_batch(int): number of waiting transactions that triggers a commit before commit_interval
+        pool(ConnectionPool): read connections for reporting queries
+        complex(ParkingComplex): complex being stored, set by attach
+        pending(list): (sql, parameters) statements waiting to be committed
+        queued(int): number of statements queued so far
+        committed(int): number of statements committed so far
+        lock(threading.Condition): locking access to self.pending, self.queued and self.committed
+        running(bool): boolean of the writer thread running
+        thread(threading.Thread): writer thread, the only user of the write connection
+    """
+    def __init__(self, db_path, commit_interval=0.005, commit_batch=512, readers=2):
+        self.db_path = db_path
+        self.commit_interval = commit_interval
+        self.commit_batch = commit_batch
+        connect(db_path).close()
+        self.pool = ConnectionPool(db_path, readers)
+        self.complex = None
+        self.pending = []
+        self.queued = 0
+        self.committed = 0
+        self.lock = threading.Condition(threading.Lock())
+        self.running = False
+        self.thread = None
+
+    def has_layout(self):
+        """
+        Utility function to check if a layout has been saved
+        """
+        with self.pool.connection() as connection:
+            return connection.execute("SELECT COUNT(*) FROM levels").fetchone()[0] > 0
+
+    def save_layout(self, layout):
+        """
+        Utility function to replace the saved layout, every saved ticket is removed
+
+        Args:
+            layout(GarageLayout): parsed config
+        """
+        connection = connect(self.db_path)
+        try:
+            with connection:
+                for table in ("complex", "levels", "tickets", "occupied"):
+                    connection.execute("DELETE FROM {}".format(table))
+                connection.execute("INSERT INTO complex (name, graph) VALUES (?, ?)",
+                                   (layout.name, "\n".join(layout.graph.lines) if layout.graph is not None else None))
+                connection.executemany("INSERT INTO levels (level, rows, spaces, type_codes) VALUES (?, ?, ?, ?)",
+                                       [(n + 1, level.rows, level.spaces, sqlite3.Binary(str(level.type_codes)))
+                                        for n, level in enumerate(layout.levels)])
+        finally:
+            connection.close()
+
+    def load_layout(self):
+        """
+        Utility function to load the saved layout
+
+        Returns:
+            GarageLayout
+        """
+        with self.pool.connection() as connection:
+            name, graph = connection.execute("SELECT name, graph FROM complex").fetchone()
+            levels = [LevelLayout(rows, spaces, bytearray(type_codes)) for rows, spaces, type_codes in
+                      connection.execute("SELECT rows, spaces, type_codes FROM levels ORDER BY level")]
+        return GarageLayout(name, levels, parse_graph_lines([str(line) for line in graph.splitlines()]) if graph else None)
+
+    def restore(self, complex):
+        """
+        Utility function to load the saved open tickets and occupancy into a freshly built complex
+
+        Args:
+            complex(ParkingComplex): complex built from self.load_layout()
+        """
+        customers = {}
+        for size in CAR_SIZES:
+            for handicapped in (False, True):
+                customers[size, handicapped] = Classes.Customer(size, handicapped)
+        occupancies = [bytearray(len(level.occupancy)) for level in complex.levels]
+        tickets = {}
+        with self.pool.connection() as connection:
+            for id, level, row, space, car_size, handicapped, start_t in connection.execute(SELECT_OPEN_TICKETS):
+                key = (level, row, space)
+                tickets[key] = Classes.Ticket(complex.get_spot(key), customers[car_size, bool(handicapped)], id,
+                                              from_seconds(start_t))
+                occupancies[level - 1][complex.levels[level - 1].offset(row, space)] = 1
+            next_ticket_id = (connection.execute("SELECT MAX(id) FROM tickets").fetchone()[0] or 0) + 1
+        complex.restore(occupancies, tickets, next_ticket_id)
+
+    def attach(self, complex):
+        """
+        Utility function to store every transaction of complex and start the writer thread
+
+        Args:
+            complex(ParkingComplex): complex to store
+        """
+        self.complex = complex
+        complex.add_listener(self)
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="parking-sqlite-writer")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def on_transaction(self, complex, ticket, parking):
+        """
+        Utility function to queue the statements of a transaction, called by ParkingComplex.update_matrixs
+
+        Args:
+            complex(ParkingComplex): complex of the transaction
+            ticket(Ticket): ticket of the transaction
+            parking(bool): boolean of customer parking versus unparking
+        """
+        location = ticket.p_spot.location
+        if parking:
+            statements = [(INSERT_TICKET, (ticket.id, location.level, location.row, location.space,
+                                           ticket.p_spot.size_t, ticket.customer.size, int(ticket.customer.handicapped),
+                                           to_seconds(ticket.start_t))),
+                          (INSERT_OCCUPIED, (location.level, location.row, location.space, ticket.id))]
+        else:
+            statements = [(CLOSE_TICKET, (to_seconds(ticket.end_t), to_cents(ticket.charge), ticket.id)),
+                          (DELETE_OCCUPIED, (location.level, location.row, location.space))]
+        with self.lock:
+            self.pending.extend(statements)
+            self.queued += len(statements)
+            if len(self.pending) == len(statements) or len(self.pending) >= self.commit_batch:
+                self.lock.notify_all()
+
+    def run(self):
+        connection = connect(self.db_path)
+        try:
+            while True:
+                with self.lock:
+                    while self.running and not self.pending:
+                        self.lock.wait()
+                    if self.running and len(self.pending) < self.commit_batch:
+                        self.lock.wait(self.commit_interval)
+                    pending, self.pending = self.pending, []
+                    running = self.running
+                if pending:
+                    with connection:
+                        self.execute_batch(connection, pending)
+                    with self.lock:
+                        self.committed += len(pending)
+                        self.lock.notify_all()
+                if not running:
+                    return
+        finally:
+            connection.close()
+
+    def execute_batch(self, connection, statements):
+        """
+        Utility function to run a batch of statements with one executemany per run of the same statement
+
+        Note: the tickets and occupied tables are independent, so the statements of each table are run
+              as their own stream, keeping their order, which turns a batch of parks into two runs
+
+        Args:
+            connection(sqlite3.Connection): write connection in a transaction
+            statements(list): (sql, parameters) statements in transaction order
+        """
+        tickets = [statement for statement in statements if statement[0] in TICKET_STATEMENTS]
+        occupied = [statement for statement in statements if statement[0] not in TICKET_STATEMENTS]
+        for stream in (tickets, occupied):
+            for sql, run in groupby(stream, itemgetter(0)):
+                connection.executemany(sql, [parameters for sql, parameters in run])
+
+    def sync(self):
+        """
+        Utility function to wait until every transaction queued so far is committed
+        """
+        with self.lock:
+            target = self.queued
+            self.lock.notify_all()
+            while self.committed < target and self.running:
+                self.lock.wait(self.commit_interval)
+
+    def close(self):
+        """
+        Utility function to stop storing, commit every queued transaction and close every connection
+        """
+        if self.complex is not None and self in self.complex.listeners:
+            self.complex.remove_listener(self)
+        if self.running:
+            with self.lock:
+                self.running = False
+                self.lock.notify_all()
+            self.thread.join()
+        self.pool.close()
+
+    def open_ticket_count(self):
+        """
+        Utility function to count the stored open tickets
+        """
+        with self.pool.connection() as connection:
+            return connection.execute("SELECT COUNT(*) FROM occupied").fetchone()[0]
+
+    def occupancy_by_level(self):
+        """
+        Utility function to count the filled spots of each level
+
+        Returns:
+            dict: maps a level number to its number of filled spots
+        """
+        with self.pool.connection() as connection:
+            return dict(connection.execute(SELECT_OCCUPANCY).fetchall())
+
+    def revenue_by_size(self):
+        """
+        Utility function to total the closed tickets of each spot size type
+
+        Returns:
+            dict: maps a spot size type to (closed ticket count, revenue in cents)
+        """
+        with self.pool.connection() as connection:
+            return dict((size_t, (count, cents)) for size_t, count, cents in connection.execute(SELECT_REVENUE))
+
+    def tickets_between(self, start_t, end_t):
+        """
+        Utility function to list the tickets started in [start_t, end_t)
+
+        Args:
+            start_t(datetime): earliest start time
+            end_t(datetime): end of the range
+
+        Returns:
+            list: (id, level, row, space, size_t, car_size, handicapped, start_t, end_t, charge_cents) rows,
+                times are seconds since ticket_log.EPOCH
+        """
+        with self.pool.connection() as connection:
+            return connection.execute(SELECT_TICKETS_BETWEEN, (to_seconds(start_t), to_seconds(end_t))).fetchall()
+
+
+def open_complex(db_path, config_path=None, renderer="map", **complex_kwargs):
+    """
+    Utility function to boot a complex from a database, the first boot loads the layout from config_path
+
+    Args:
+        db_path(str): path to database file, created if missing
+        config_path(str): config file saved to a database without a layout, its tariff file is loaded
+            on every boot unless a tariff is given, see tariff.tariff_path
+        renderer(str): see ParkingComplex
+        complex_kwargs(dict): other keyword arguments given to ParkingComplex
+
+    Returns:
+        tuple(ParkingComplex,SQLiteStore): the complex with its open tickets restored and its attached store
+
+    Raises:
+        ValueError: database has no layout and no config_path is given
+    """
+    store = SQLiteStore(db_path)
+    if not store.has_layout():
+        if config_path is None:
+            store.close()
+            raise ValueError("{} has no layout, a config_path is required".format(db_path))
+        store.save_layout(load_layout(os.path.abspath(config_path)))
+    if complex_kwargs.get("tariff") is None and config_path is not None and os.path.exists(tariff_path(config_path)):
+        complex_kwargs["tariff"] = load_tariff(tariff_path(config_path))
+    complex = Classes.ParkingComplex(None, renderer, layout=store.load_layout(), **complex_kwargs)
+    store.restore(complex)
+    store.attach(complex)
+    return complex, store
@@ -0,0 +1,349 @@
+# -*- coding: utf-8 -*-
+"""
+tariff module:
+  Defines declarative parking tariffs compiled into interval rate tables
+
+  Notes: a stay is charged for its started intervals, a stay shorter than the minimum is charged one
+         interval. Each interval is priced by the time of day it starts in: an event rate if an event
+         covers it, otherwise a time of day period rate, otherwise the base rate. The daily cap limits
+         the charge of every 24 hours from entry. A tariff file sits next to the complex config with
+         the extension ".tariff" and is loaded with it, e.g.
+
+            # rates are dollars per interval
+            interval: 15
+            minimum: 900
+            rate handicapped: 5.00
+            rate compact: 5.00
+            rate large: 7.50
+            period 07:00-10:00: 1.5
+            daily cap: 60.00
+            event 2026-07-04 18:00 - 2026-07-04 23:30: 3
+
+         Period and event values multiply the base rates. Compiling turns every period into a segment
+         of a two day table of rates per customer class, so pricing a stay walks the segments once per
+         distinct 24 hour window instead of every minute, a flat tariff is priced with one multiplication.
+
+"""
+from datetime import datetime
+from decimal import Decimal
+import os
+
+from billing import DEFAULT_RATES, MICROSECONDS_PER_MINUTE, RATE_UNITS, rate_table, to_microseconds
+from config_loader import SPACE_TYPE_CODES
+from ticket_log import EPOCH
+
+DAY_MINUTES = 24 * 60
+DAY_US = DAY_MINUTES * MICROSECONDS_PER_MINUTE
+CENT_UNITS = RATE_UNITS // 100
+TARIFF_EXTENSION = ".tariff"
+
+
+def ceil_div(numerator, denominator):
+    """
+    Utility function to divide integers rounding up
+    """
+    return -(-numerator // denominator)
+
+
+def scale_units(units, multiplier):
+    """
+    Utility function to multiply rate units by a multiplier exactly
+
+    Args:
+        units(int): rate units
+        multiplier(str|float): multiplier
+
+    Raises:
+        ValueError: the product is finer than a rate unit
+    """
+    value = Decimal(units) * Decimal(str(multiplier))
+    if value != value.to_integral_value():
+        raise ValueError("Multiplier {} makes a rate finer than a hundredth of a cent".format(multiplier))
+    return int(value)
+
+
+def parse_clock(clock):
+    """
+    Utility function to convert "HH:MM" to microseconds since midnight, "24:00" is the end of the day
+    """
+    hours, minutes = clock.strip().split(":")
+    return (int(hours) * 60 + int(minutes)) * MICROSECONDS_PER_MINUTE
+
+
+def tariff_path(config_path):
+    """
+    Utility function to get the tariff file of a config file, the config path with extension ".tariff"
+    """
+    return os.path.splitext(config_path)[0] + TARIFF_EXTENSION
+
+
+def load_tariff(file_path):
+    """
+    Utility function to load and compile a tariff file
+
+    Args:
+        file_path(str): path to tariff file, see module notes for the format
+
+    Returns:
+        Tariff: compiled tariff
+
+    Raises:
+        ValueError: a line is not understood
+    """
+    rates = {}
+    options = {"periods": [], "events": []}
+    with open(file_path) as definition:
+        for line in definition:
+            line = line.split("#")[0].strip()
+            if not line:
+                continue
+            if ": " not in line:
+                raise ValueError("{}: line not understood: {}".format(file_path, line))
+            key, value = [part.strip() for part in line.rsplit(": ", 1)]
+            words = key.split(None, 1)
+            if key == "interval":
+                options["interval_minutes"] = int(value)
+            elif key == "minimum":
+                options["minimum_seconds"] = int(value)
+            elif key == "daily cap":
+                options["daily_cap"] = value
+            elif words[0] == "rate" and len(words) == 2 and words[1] in DEFAULT_RATES:
+                rates[words[1]] = value
+            elif words[0] == "period" and len(words) == 2:
+                start, end = words[1].split("-")
+                options["periods"].append((parse_clock(start), parse_clock(end), value))
+            elif words[0] == "event" and len(words) == 2:
+                start, end = words[1].split(" - ")
+                options["events"].append((datetime.strptime(start.strip(), "%Y-%m-%d %H:%M"),
+                                          datetime.strptime(end.strip(), "%Y-%m-%d %H:%M"), value))
+            else:
+                raise ValueError("{}: line not understood: {}".format(file_path, line))
+    return Tariff(rates, **options)
+
+
+class Tariff():
+    """
+    Defines a Tariff instance, a tariff compiled into rate tables of each customer class
+
+    A customer class is the spot size type code times 2 plus the handicapped flag, see billing.rate_table
+
+    Args:
+        rates(dict): dollars per interval overriding billing.DEFAULT_RATES
+        interval_minutes(int): minutes per interval, must divide a day
+        minimum_seconds(int): stays shorter than this are charged one interval,
+            default is park_unpark.MINIMUM_PARKING_INTERVAL_SECONDS
+        periods(list): (start, end, multiplier) of each time of day period, start and end in
+            microseconds since midnight, periods may not overlap
+        daily_cap(str|float): most dollars charged per 24 hours from entry, None for no cap
+        events(list): (start, end, multiplier) of each event, start and end are datetimes, events may not overlap
+
+    Attributes:
+        interval_minutes(int): minutes per interval
+        interval_us(int): microseconds per interval
+        minimum_us(int): stays shorter than this are charged one interval
+        window_intervals(int): intervals per 24 hours
+        rates(list): base rate units of each customer class
+        cap_units(int): most rate units charged per 24 hours from entry, or None
+        segments(list): (start, end) microseconds of each rate segment of a two day table
+        segment_units(list): rate units of each segment of each customer class
+        events(list): (start, end) microseconds since ticket_log.EPOCH of each event, sorted
+        event_units(list): rate units of each event of each customer class
+        flat(bool): boolean of every interval having the base rate and no cap
+    """
+    def __init__(self, rates=None, interval_minutes=15, minimum_seconds=None, periods=(), daily_cap=None, events=()):
+        if DAY_MINUTES % interval_minutes:
+            raise ValueError("Interval of {} minutes does not divide a day".format(interval_minutes))
+        if minimum_seconds is None:
+            #imported on use, park_unpark imports this module through Classes
+            import park_unpark
+            minimum_seconds = park_unpark.MINIMUM_PARKING_INTERVAL_SECONDS
+        self.interval_minutes = interval_minutes
+        self.interval_us = interval_minutes * MICROSECONDS_PER_MINUTE
+        self.minimum_us = minimum_seconds * 1000000
+        self.window_intervals = DAY_MINUTES // interval_minutes
+        self.rates = rate_table(rates)
+        self.cap_units = None if daily_cap is None else scale_units(RATE_UNITS, daily_cap)
+        self.segments = []
+        self.segment_units = []
+        self.set_segments(periods)
+        self.events = []
+        self.event_units = []
+        self.set_events(events)
+        self.flat = not periods and not events and daily_cap is None
+
+    def set_segments(self, periods):
+        """
+        Utility function to compile time of day periods into self.segments covering two days
+
+        Args:
+            periods(list): (start, end, multiplier) of each period, see Tariff
+        """
+        boundaries = []
+        position = 0
+        for start, end, multiplier in sorted(periods):
+            if not 0 <= start < end <= DAY_US or start < position:
+                raise ValueError("Period {}-{} is outside the day or overlaps another".format(start, end))
+            if start > position:
+                boundaries.append((position, start, 1))
+            boundaries.append((start, end, multiplier))
+            position = end
+        if position < DAY_US:
+            boundaries.append((position, DAY_US, 1))
+        for day in (0, DAY_US):
+            for start, end, multiplier in boundaries:
+                self.segments.append((day + start, day + end))
+        self.segment_units = [[scale_units(rate, multiplier) for day in (0, DAY_US) for start, end, multiplier in boundaries]
+                              for rate in self.rates]
+
+    def set_events(self, events):
+        """
+        Utility function to compile dated events into self.events
+
+        Args:
+            events(list): (start, end, multiplier) of each event, see Tariff
+        """
+        events = sorted((to_microseconds(start - EPOCH), to_microseconds(end - EPOCH), multiplier)
+                        for start, end, multiplier in events)
+        for n, (start, end, multiplier) in enumerate(events):
+            if start >= end or (n and start < events[n - 1][1]):
+                raise ValueError("Event starting {} is empty or overlaps another".format(start))
+        self.events = [(start, end) for start, end, multiplier in events]
+        self.event_units = [[scale_units(rate, multiplier) for start, end, multiplier in events] for rate in self.rates]
+
+    def class_of(self, size_t, handicapped):
+        """
+        Utility function to get the customer class of a spot size type and handicapped flag
+        """
+        return (SPACE_TYPE_CODES[size_t] << 1) | bool(handicapped)
+
+    def intervals(self, duration_us):
+        """
+        Utility function to get the number of charged intervals of a stay
+
+        Args:
+            duration_us(int): length of the stay in microseconds
+        """
+        if duration_us < self.minimum_us:
+            return 1
+        return ceil_div(duration_us // MICROSECONDS_PER_MINUTE, self.interval_minutes)
+
+    def price_cents(self, start_us, end_us, customer_class):
+        """
+        Utility function to price a stay, O(segments + events)
+
+        Args:
+            start_us(int): entry time in microseconds since ticket_log.EPOCH
+            end_us(int): exit time in microseconds since ticket_log.EPOCH
+            customer_class(int): see class_of
+
+        Returns:
+            int: charge in cents, rounded up to the penny
+        """
+        intervals = self.intervals(end_us - start_us)
+        if self.flat:
+            return ceil_div(self.rates[customer_class] * intervals, CENT_UNITS)
+        return ceil_div(self.stay_units(start_us, intervals, customer_class), CENT_UNITS)
+
+    def charge(self, ticket):
+        """
+        Utility function to price a closed ticket
+
+        Args:
+            ticket(Ticket): ticket with start_t and end_t set
+
+        Returns:
+            float: charge in dollars
+        """
+        customer_class = (SPACE_TYPE_CODES[ticket.p_spot.size_t] << 1) | bool(ticket.customer.handicapped)
+        if self.flat:
+            intervals = self.intervals(to_microseconds(ticket.end_t - ticket.start_t))
+            return ceil_div(self.rates[customer_class] * intervals, CENT_UNITS) / 100.0
+        return self.price_cents(to_microseconds(ticket.start_t - EPOCH), to_microseconds(ticket.end_t - EPOCH),
+                                customer_class) / 100.0
+
+    def stay_units(self, start_us, intervals, customer_class):
+        """
+        Utility function to total the rate units of the intervals of a stay, capped per 24 hours from entry
+
+        Note: every full 24 hours from entry starts its intervals at the same time of day, so windows
+              without events are priced once
+
+        Args:
+            start_us(int): entry time in microseconds since ticket_log.EPOCH
+            intervals(int): number of charged intervals
+            customer_class(int): see class_of
+        """
+        window_us = self.window_intervals * self.interval_us
+        full, rest = divmod(intervals, self.window_intervals)
+        windows = full + (1 if rest else 0)
+        end_us = start_us + intervals * self.interval_us
+        event_windows = set()
+        for event_start, event_end in self.events:
+            if event_start < end_us and event_end > start_us:
+                first = (max(event_start, start_us) - start_us) // window_us
+                last = (min(event_end, end_us) - 1 - start_us) // window_us
+                event_windows.update(xrange(first, min(last, windows - 1) + 1))
+        phase = start_us % DAY_US
+        units = 0
+        plain_full = full - len([window for window in event_windows if window < full])
+        if plain_full:
+            units += plain_full * self.capped(self.window_units(phase, self.window_intervals, customer_class))
+        if rest and full not in event_windows:
+            units += self.capped(self.window_units(phase, rest, customer_class))
+        for window in event_windows:
+            count = self.window_intervals if window < full else rest
+            units += self.capped(self.event_window_units(start_us + window * window_us, count, customer_class))
+        return units
+
+    def window_units(self, phase, count, customer_class):
+        """
+        Utility function to total the period rates of count intervals starting phase microseconds after midnight
+
+        Args:
+            phase(int): microseconds since midnight of the first interval, less than a day
+            count(int): number of intervals, at most a day of intervals
+            customer_class(int): see class_of
+        """
+        units = 0
+        interval_us = self.interval_us
+        for (start, end), rate in zip(self.segments, self.segment_units[customer_class]):
+            first = max(0, ceil_div(start - phase, interval_us))
+            last = min(count, ceil_div(end - phase, interval_us))
+            if last > first:
+                units += (last - first) * rate
+        return units
+
+    def event_window_units(self, window_start, count, customer_class):
+        """
+        Utility function to total the rates of count intervals from window_start, events included
+
+        Args:
+            window_start(int): microseconds since ticket_log.EPOCH of the first interval
+            count(int): number of intervals, at most a day of intervals
+            customer_class(int): see class_of
+        """
+        interval_us = self.interval_us
+        units = self.window_units(window_start % DAY_US, count, customer_class)
+        window_end = window_start + count * interval_us
+        day_start = window_start - window_start % DAY_US
+        segment_units = self.segment_units[customer_class]
+        for (event_start, event_end), event_rate in zip(self.events, self.event_units[customer_class]):
+            if event_start >= window_end or event_end <= window_start:
+                continue
+            for (start, end), rate in zip(self.segments, segment_units):
+                low, high = max(event_start, day_start + start), min(event_end, day_start + end)
+                if low >= high:
+                    continue
+                first = max(0, ceil_div(low - window_start, interval_us))
+                last = min(count, ceil_div(high - window_start, interval_us))
+                if last > first:
+                    units += (last - first) * (event_rate - rate)
+        return units
+
+    def capped(self, units):
+        """
+        Utility function to apply the daily cap to the rate units of one 24 hour window
+        """
+        if self.cap_units is None:
+            return units
+        return min(units, self.cap_units)
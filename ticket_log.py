@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+"""
+ticket_log module:
+  Defines the bounded in memory ticket history and the append-only on disk log of closed tickets
+
+  Notes: a log is a flat sequence of fixed size records, see RECORD
+
+"""
+from collections import namedtuple, OrderedDict
+from datetime import datetime, timedelta
+import struct
+import threading
+
+from config_loader import SPACE_TYPES, SPACE_TYPE_CODES
+
+#car size of each car size code
+CAR_SIZES = ("compact_car", "large_car")
+CAR_SIZE_CODES = dict((size, code) for code, size in enumerate(CAR_SIZES))
+
+#id, level, row, space, spot type code, car size code, handicapped, start seconds, end seconds, charge cents
+RECORD = struct.Struct("<IHHHBBBddq")
+
+EPOCH = datetime(1970, 1, 1)
+
+TicketRecord = namedtuple("TicketRecord", ["id", "level", "row", "space", "size_t", "size", "handicapped",
+                                           "start_t", "end_t", "charge"])
+
+
+def to_seconds(date):
+    """
+    Utility function to convert a naive datetime to seconds since EPOCH
+
+    Args:
+        date(datetime): date to convert
+    """
+    delta = date - EPOCH
+    return delta.days * 86400 + delta.seconds + delta.microseconds / 1000000.0
+
+
+def from_seconds(seconds):
+    """
+    Utility function to convert seconds since EPOCH to a naive datetime
+
+    Args:
+        seconds(float): seconds to convert
+    """
+    return EPOCH + timedelta(seconds=seconds)
+
+
+def to_cents(charge):
+    """
+    Utility function to convert a charge in dollars to integer cents
+
+    Args:
+        charge(float): charge in dollars
+    """
+    return int(round(charge * 100))
+
+
+def pack_ticket(ticket):
+    """
+    Utility function to pack a closed ticket into a log record
+
+    Args:
+        ticket(Ticket): closed ticket to pack
+
+    Returns:
+        str: RECORD.size bytes
+    """
+    location = ticket.p_spot.location
+    return RECORD.pack(ticket.id, location.level, location.row, location.space,
+                       SPACE_TYPE_CODES[ticket.p_spot.size_t], CAR_SIZE_CODES[ticket.customer.size],
+                       ticket.customer.handicapped, to_seconds(ticket.start_t), to_seconds(ticket.end_t),
+                       to_cents(ticket.charge))
+
+
+def unpack_record(data, offset=0):
+    """
+    Utility function to unpack a log record
+
+    Args:
+        data(str): bytes holding the record
+        offset(int): offset of the record in data
+
+    Returns:
+        TicketRecord: the unpacked record, charge in dollars
+    """
+    (id, level, row, space, size_code, car_code, handicapped,
+     start_t, end_t, charge) = RECORD.unpack_from(data, offset)
+    return TicketRecord(id, level, row, space, SPACE_TYPES[size_code], CAR_SIZES[car_code], bool(handicapped),
+                        from_seconds(start_t), from_seconds(end_t), charge / 100.0)
+
+
+def read_ticket_log(file_path, batch_records=4096):
+    """
+    Utility function to iterate the records of a ticket log in the order they were written
+
+    Args:
+        file_path(str): path to ticket log
+        batch_records(int): number of records read from disk at a time
+
+    Returns:
+        generator of TicketRecord
+    """
+    with open(file_path, "rb") as log:
+        while True:
+            data = log.read(RECORD.size * batch_records)
+            if not data:
+                break
+            for offset in xrange(0, len(data) - RECORD.size + 1, RECORD.size):
+                yield unpack_record(data, offset)
+
+
+class TicketLog():
+    """
+    Defines a TicketLog instance, an append-only file of closed tickets written in batches
+
+    Args:
+        file_path(str): path to ticket log, created if missing
+        batch_size(int): number of closed tickets buffered before they are written
+
+    Attributes:
+        file_path(str): path to ticket log
+        batch_size(int): number of closed tickets buffered before they are written
+        pending(list): packed records waiting to be written
+        lock(threading.Lock): locking access to self.pending
+    """
+    def __init__(self, file_path, batch_size=256):
+        self.file_path = file_path
+        self.batch_size = batch_size
+        self.pending = []
+        self.lock = threading.Lock()
+
+    def append(self, ticket):
+        """
+        Utility function to add a closed ticket to the log, writes the batch once it is full
+
+        Args:
+            ticket(Ticket): closed ticket
+        """
+        record = pack_ticket(ticket)
+        with self.lock:
+            self.pending.append(record)
+            if len(self.pending) >= self.batch_size:
+                self.write_pending()
+
+    def flush(self):
+        """
+        Utility function to write every buffered record
+        """
+        with self.lock:
+            self.write_pending()
+
+    def write_pending(self):
+        """
+        Utility function to write self.pending in one call
+
+        Note: the caller must hold self.lock
+        """
+        if not self.pending:
+            return
+        with open(self.file_path, "ab") as log:
+            log.write("".join(self.pending))
+        self.pending = []
+
+    def __iter__(self):
+        self.flush()
+        return read_ticket_log(self.file_path)
+
+
+class TicketHistory():
+    """
+    Defines a TicketHistory instance, the tickets of a ParkingComplex kept in bounded memory
+
+    Open tickets are kept until they close, closed tickets are kept in a ring buffer of the most
+    recently closed and handed to a TicketLog for archival.
+    Indexing follows ticket ids: history[n] is the ticket with id n + 1.
+
+    Args:
+        recent(int): number of recently closed tickets kept in memory
+        log(TicketLog): archive for closed tickets, optional
+
+    Attributes:
+        recent(int): number of recently closed tickets kept in memory
+        log(TicketLog): archive for closed tickets or None
+        open(dict): maps a ticket id to its open Ticket
+        closed(OrderedDict): maps a ticket id to its closed Ticket, oldest first
+        issued(int): number of tickets added to the history
+        lock(threading.Lock): locking access to the history
+    """
+    def __init__(self, recent=1024, log=None):
+        self.recent = recent
+        self.log = log
+        self.open = {}
+        self.closed = OrderedDict()
+        self.issued = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self.issued
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.issued
+        ticket_id = index + 1
+        ticket = self.open.get(ticket_id)
+        if ticket is None:
+            ticket = self.closed.get(ticket_id)
+        if ticket is None:
+            raise IndexError("Ticket {} is not in memory".format(ticket_id))
+        return ticket
+
+    def __iter__(self):
+        with self.lock:
+            tickets = self.open.values() + self.closed.values()
+        return iter(sorted(tickets, key=lambda ticket: ticket.id))
+
+    def append(self, ticket):
+        """
+        Utility function to add a new open ticket
+
+        Args:
+            ticket(Ticket): open ticket
+        """
+        with self.lock:
+            self.open[ticket.id] = ticket
+            self.issued = max(self.issued, ticket.id)
+
+    def extend(self, tickets):
+        """
+        Utility function to add many open tickets under one lock
+
+        Args:
+            tickets(list): open tickets
+        """
+        with self.lock:
+            for ticket in tickets:
+                self.open[ticket.id] = ticket
+                self.issued = max(self.issued, ticket.id)
+
+    def close(self, ticket, archive=True):
+        """
+        Utility function to move a closed ticket from the open tickets to the recent ring buffer and log
+
+        Args:
+            ticket(Ticket): closed ticket
+            archive(bool): boolean of writing the ticket to self.log
+        """
+        with self.lock:
+            self.open.pop(ticket.id, None)
+            if self.recent > 0:
+                self.closed[ticket.id] = ticket
+                if len(self.closed) > self.recent:
+                    self.closed.popitem(last=False)
+        if archive and self.log is not None:
+            self.log.append(ticket)
+
+    def flush(self):
+        """
+        Utility function to write every closed ticket still buffered by self.log
+        """
+        if self.log is not None:
+            self.log.flush()
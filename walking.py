@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+walking module:
+  Walking distances from the entrances of a parking complex over its aisle and ramp graph
+
+  Notes: a text or compact text config may describe the graph after its levels, one line each:
+    entrance <id>: <node>                 # entrance <id> is at <node>
+    path <node> -> <node>: <length>       # one-way aisle or ramp
+    path <node> <-> <node>: <length>      # two-way aisle or ramp
+  A node named "level/row" is the head of that row's aisle, space s of the row is s steps down the
+  aisle from its head. Any other node name is a waypoint such as a ramp landing or a gate.
+  Shortest paths are found once per entrance with Dijkstra's algorithm when the complex is built.
+
+"""
+from collections import OrderedDict
+import heapq
+
+#entrance id of configs without a graph, their distance is level + row + space from location(1,1,1)
+DEFAULT_ENTRANCE = "main"
+#distance added to rows an entrance has no path to, their spots are still given out after every reachable spot
+UNREACHABLE = 1 << 24
+
+
+class WalkingGraph():
+    """
+    Defines a WalkingGraph instance, the entrances and the directed aisle/ramp paths of a complex
+
+    Attributes:
+        entrances(OrderedDict): maps an entrance id to its node, in config order, the first is the default
+        paths(dict): maps a node to a list of (node, length) paths leaving it
+        lines(list): the graph lines the graph was parsed from, see parse_graph_lines
+    """
+    def __init__(self):
+        self.entrances = OrderedDict()
+        self.paths = {}
+        self.lines = []
+
+    def add_entrance(self, entrance, node):
+        """
+        Utility function to add an entrance at a node
+
+        Args:
+            entrance(str): entrance id
+            node(str): node the entrance is at
+        """
+        if entrance in self.entrances:
+            raise ValueError("Entrance {} is defined twice".format(entrance))
+        self.entrances[entrance] = node
+        self.paths.setdefault(node, [])
+        self.lines.append("entrance {}: {}".format(entrance, node))
+
+    def add_path(self, start, end, length, two_way=False):
+        """
+        Utility function to add a path between two nodes
+
+        Args:
+            start(str): node the path leaves
+            end(str): node the path reaches
+            length(int): walking distance of the path, non-negative
+            two_way(bool): the path may also be walked from end to start
+        """
+        if length < 0:
+            raise ValueError("Path {} to {} has a negative length".format(start, end))
+        self.paths.setdefault(start, []).append((end, length))
+        self.paths.setdefault(end, [])
+        if two_way:
+            self.paths[end].append((start, length))
+        self.lines.append("path {} {} {}: {}".format(start, "<->" if two_way else "->", end, length))
+
+    def shortest_distances(self, entrance):
+        """
+        Utility function to get the walking distance from an entrance to every node it reaches
+
+        Args:
+            entrance(str): entrance id
+
+        Returns:
+            dict: maps each reachable node to its distance
+        """
+        distances = {}
+        heap = [(0, self.entrances[entrance])]
+        while heap:
+            distance, node = heapq.heappop(heap)
+            if node in distances:
+                continue
+            distances[node] = distance
+            for next_node, length in self.paths[node]:
+                if next_node not in distances:
+                    heapq.heappush(heap, (distance + length, next_node))
+        return distances
+
+    def row_distances(self, level_rows):
+        """
+        Utility function to get the distance from each entrance to the head of every row it reaches
+
+        Args:
+            level_rows(list): number of rows of each level
+
+        Returns:
+            dict: maps each entrance id to a dict of (level, row) to distance
+
+        Raises:
+            ValueError: a row node names a row the layout does not have
+        """
+        for node in self.paths:
+            row = parse_row_node(node)
+            if row is not None and not (1 <= row[0] <= len(level_rows) and 1 <= row[1] <= level_rows[row[0] - 1]):
+                raise ValueError("Graph node {} is not a row of the layout".format(node))
+        row_distances = {}
+        for entrance in self.entrances:
+            row_distances[entrance] = dict((parse_row_node(node), distance) for node, distance in
+                                           self.shortest_distances(entrance).items()
+                                           if parse_row_node(node) is not None)
+        return row_distances
+
+
+def parse_row_node(node):
+    """
+    Utility function to get the (level, row) of a "level/row" node
+
+    Args:
+        node(str): node name
+
+    Returns:
+        tuple(int,int): (level, row) of the row whose aisle head the node is
+        or
+        None: the node is a waypoint
+    """
+    parts = node.split("/")
+    if len(parts) != 2 or not parts[0].isdigit() or not parts[1].isdigit():
+        return None
+    return (int(parts[0]), int(parts[1]))
+
+
+def parse_graph_lines(lines):
+    """
+    Utility function to parse the entrance and path lines of a config
+
+    Args:
+        lines(list): stripped config lines after the levels
+
+    Returns:
+        WalkingGraph: the parsed graph
+        or
+        None: there are no graph lines
+
+    Raises:
+        ValueError: a line is not an entrance or path line, or the graph has paths but no entrance
+    """
+    if not lines:
+        return None
+    graph = WalkingGraph()
+    for line in lines:
+        head, _, value = line.rpartition(":")
+        words = head.split()
+        if len(words) == 2 and words[0] == "entrance":
+            graph.add_entrance(words[1], value.strip())
+        elif len(words) == 4 and words[0] == "path" and words[2] in ("->", "<->"):
+            graph.add_path(words[1], words[3], int(value), words[2] == "<->")
+        else:
+            raise ValueError("Config line '{}' is not an entrance or path line".format(line))
+    if not graph.entrances:
+        raise ValueError("Config graph has no entrance")
+    return graph